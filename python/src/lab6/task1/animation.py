@@ -0,0 +1,112 @@
+import numpy as np
+
+# motion curves of an animated entity, name -> default; all angles in radians, speeds in radians per second.
+#   pos = center + orbit_radius * (cos, 0, sin)(orbit_speed * t + orbit_phase)
+#             + axis * amplitude * cos(oscillation_speed * t + oscillation_phase)
+#   rot = base_rot + spin * t
+#   scale = base_scale * (1 + pulse * (sin(pulse_speed * t + pulse_phase) + 1))
+MOTION_DEFAULTS: dict[str, tuple[float, ...]] = {
+    'center': (0.0, 0.0, 0.0),
+    'orbit_radius': (0.0,),
+    'orbit_speed': (0.0,),
+    'orbit_phase': (0.0,),
+    'axis': (0.0, 0.0, 0.0),
+    'amplitude': (0.0,),
+    'oscillation_speed': (0.0,),
+    'oscillation_phase': (0.0,),
+    'base_rot': (0.0, 0.0, 0.0),
+    'spin': (0.0, 0.0, 0.0),
+    'base_scale': (1.0, 1.0, 1.0),
+    'pulse': (0.0,),
+    'pulse_speed': (0.0,),
+    'pulse_phase': (0.0,),
+}
+# a motion is a dict of some of those parameters, each one shared value or one value per entity
+Motion = dict[str, object]
+
+
+def get_motion_arrays(motion: Motion, count: int) -> dict[str, np.ndarray]:
+    # every parameter as a (count, width) array
+    unknown = set(motion) - set(MOTION_DEFAULTS)
+    if unknown:
+        raise ValueError(f'unknown motion parameters: {", ".join(sorted(unknown))}')
+    arrays = dict()
+    for name, default in MOTION_DEFAULTS.items():
+        value = np.asarray(motion.get(name, default), dtype='f4').reshape(-1, len(default))
+        arrays[name] = np.broadcast_to(value, (count, len(default))).copy()
+    return arrays
+
+
+def evaluate_motion(params: dict[str, np.ndarray], t: float) -> np.ndarray:
+    # (N, 3, 3) pos, rot, scale of every entity at time t
+    orbit = params['orbit_speed'] * t + params['orbit_phase']
+    pos = params['center'] + params['orbit_radius'] * np.hstack([np.cos(orbit), np.zeros_like(orbit), np.sin(orbit)])
+    pos += params['axis'] * params['amplitude'] * np.cos(params['oscillation_speed'] * t + params['oscillation_phase'])
+    rot = params['base_rot'] + params['spin'] * t
+    scale = params['base_scale'] * (1 + params['pulse'] * (np.sin(params['pulse_speed'] * t + params['pulse_phase']) + 1))
+    return np.stack([pos, rot, scale], axis=1)
+
+
+def get_rotations(rot: np.ndarray) -> np.ndarray:
+    # (N, 3, 3) rz @ ry @ rx, the order get_model_matrix rotates in
+    (cx, cy, cz), (sx, sy, sz) = np.cos(rot).T, np.sin(rot).T
+    rotation = np.empty((len(rot), 3, 3), dtype='f4')
+    rotation[:, 0, 0] = cz * cy
+    rotation[:, 0, 1] = cz * sy * sx - sz * cx
+    rotation[:, 0, 2] = cz * sy * cx + sz * sx
+    rotation[:, 1, 0] = sz * cy
+    rotation[:, 1, 1] = sz * sy * sx + cz * cx
+    rotation[:, 1, 2] = sz * sy * cx - cz * sx
+    rotation[:, 2, 0] = -sy
+    rotation[:, 2, 1] = cy * sx
+    rotation[:, 2, 2] = cy * cx
+    return rotation
+
+
+def compose_matrices(transforms: np.ndarray) -> np.ndarray:
+    # (N, 4, 4) row-major model matrices from (N, 3, 3) pos, rot, scale, as get_model_matrix builds them one by one
+    pos, rot, scale = transforms[:, 0], transforms[:, 1], transforms[:, 2]
+    matrices = np.zeros((len(transforms), 4, 4), dtype='f4')
+    matrices[:, :3, :3] = get_rotations(rot) * scale[:, None, :]
+    matrices[:, :3, 3] = pos
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+class Animation:
+    # motion parameters of every animated entity in the scene, one array per parameter with a row per entity,
+    # so a simulation step evaluates all of them at once
+    params: dict[str, np.ndarray]
+    count: int
+    # simulation time of the latest step
+    time: float
+    # (N, 3, 3) pos, rot, scale at the previous and the latest simulation step
+    previous: np.ndarray
+    latest: np.ndarray
+
+    def __init__(self) -> None:
+        self.params = get_motion_arrays(dict(), 0)
+        self.count = 0
+        self.time = 0.0
+        self.previous = np.empty((0, 3, 3), dtype='f4')
+        self.latest = np.empty((0, 3, 3), dtype='f4')
+
+    def add(self, motion: Motion, count: int = 1) -> slice:
+        # appends count entities, returns their rows
+        arrays = get_motion_arrays(motion, count)
+        for name, values in arrays.items():
+            self.params[name] = np.concatenate([self.params[name], values])
+        transforms = evaluate_motion(arrays, self.time)
+        self.previous = np.concatenate([self.previous, transforms])
+        self.latest = np.concatenate([self.latest, transforms])
+        rows = slice(self.count, self.count + count)
+        self.count += count
+        return rows
+
+    def step(self, t: float) -> None:
+        self.time = t
+        self.previous, self.latest = self.latest, evaluate_motion(self.params, t)
+
+    def get_transforms(self, alpha: float) -> np.ndarray:
+        # between the previous and the latest step, like the interpolated nodes of scripted models
+        return self.previous + (self.latest - self.previous) * alpha
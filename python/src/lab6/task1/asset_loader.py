@@ -0,0 +1,65 @@
+import os
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable
+
+
+def timed_call(fn: Callable, *args) -> tuple[Any, float]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+class AssetLoader:
+    # decodes and parses assets on a worker pool, gl uploads stay on the context thread
+    executor: Executor
+    futures: dict[str, Future]
+    decode_times: dict[str, float]
+    upload_times: dict[str, float]
+    start_time: float
+    # wall clock from creation to the last upload
+    total_time: float
+
+    def __init__(self, max_workers: int | None = None, use_processes: bool = False) -> None:
+        max_workers = max_workers or min(8, os.cpu_count() or 1)
+        if use_processes:
+            self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='asset_loader')
+        self.futures = dict()
+        self.decode_times = dict()
+        self.upload_times = dict()
+        self.start_time = time.perf_counter()
+        self.total_time = 0.0
+
+    def submit(self, name: str, fn: Callable, *args) -> None:
+        self.futures[name] = self.executor.submit(timed_call, fn, *args)
+
+    def ready(self, name: str) -> bool:
+        return self.futures[name].done()
+
+    def result(self, name: str) -> Any:
+        result, self.decode_times[name] = self.futures.pop(name).result()
+        return result
+
+    def upload(self, name: str, fn: Callable) -> Any:
+        # fn receives the unpacked result of the decode job
+        data = self.result(name)
+        start = time.perf_counter()
+        asset = fn(*data)
+        self.upload_times[name] = time.perf_counter() - start
+        self.total_time = time.perf_counter() - self.start_time
+        return asset
+
+    def finish(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def report(self) -> str:
+        lines = [f'{"asset":<24}{"decode ms":>12}{"upload ms":>12}']
+        for name in sorted(self.decode_times, key=self.decode_times.get, reverse=True):
+            lines.append(f'{name:<24}{self.decode_times[name] * 1000:>12.1f}'
+                         f'{self.upload_times.get(name, 0.0) * 1000:>12.1f}')
+        lines.append(f'decode {sum(self.decode_times.values()):.2f} s, '
+                     f'upload {sum(self.upload_times.values()):.2f} s, '
+                     f'wall clock {self.total_time:.2f} s')
+        return '\n'.join(lines)
@@ -0,0 +1,121 @@
+import numpy as np
+from typing import Optional
+from vbo import CubeVBO
+
+# voxel cell -> texture id, cells are integer grid coordinates
+Cells = dict[tuple[int, int, int], str]
+# (texture id, chunk) -> vertex data in the cube vbo format, '2f 3f 3f'
+BakedMeshes = dict[tuple[str, tuple[int, int]], np.ndarray]
+
+
+def get_face_uv_maps() -> dict[tuple[int, int], np.ndarray]:
+    # affine position -> uv map of each cube face, fitted to the cube vbo so baked faces map textures the same way;
+    # keyed by (axis, sign) of the face normal, (4, 2) matrices applied to (x, y, z, 1) in cube space
+    data = CubeVBO.get_vertex_data().reshape(6, 6, 8)
+    maps = dict()
+    for face in data:
+        axis = int(np.argmax(np.abs(face[0, 2:5])))
+        sign = int(np.sign(face[0, 2 + axis]))
+        positions = np.hstack([face[:, 5:8], np.ones((6, 1), dtype='f4')])
+        maps[axis, sign] = np.linalg.lstsq(positions, face[:, 0:2], rcond=None)[0]
+    return maps
+
+
+def greedy_rectangles(mask: np.ndarray) -> list[tuple[int, int, int, int]]:
+    # covers the set cells of a 2d mask with maximal rectangles, (i0, j0, i1, j1) with exclusive ends
+    mask = mask.copy()
+    rects = []
+    height, width = mask.shape
+    for i in range(height):
+        j = 0
+        while j < width:
+            if not mask[i, j]:
+                j += 1
+                continue
+            j1 = j + 1
+            while j1 < width and mask[i, j1]:
+                j1 += 1
+            i1 = i + 1
+            while i1 < height and mask[i1, j:j1].all():
+                i1 += 1
+            mask[i:i1, j:j1] = False
+            rects.append((i, j, i1, j1))
+            j = j1
+    return rects
+
+
+def get_visible_faces(grid: np.ndarray, solid: np.ndarray, axis: int, sign: int) -> np.ndarray:
+    # faces of grid cells whose neighbour along the normal is empty, interior faces are dropped
+    neighbour = np.zeros_like(solid)
+    src = [slice(None)] * 3
+    dst = [slice(None)] * 3
+    if sign > 0:
+        src[axis], dst[axis] = slice(1, None), slice(None, -1)
+    else:
+        src[axis], dst[axis] = slice(None, -1), slice(1, None)
+    neighbour[tuple(dst)] = solid[tuple(src)]
+    return grid & ~neighbour
+
+
+def get_quad(axis: int, sign: int, layer: int, rect: tuple[int, int, int, int], origin: np.ndarray,
+             cube_size: float, uv_map: np.ndarray) -> np.ndarray:
+    u_axis, v_axis = [a for a in range(3) if a != axis]
+    i0, j0, i1, j1 = rect
+    half = cube_size / 2
+    corners = []
+    for i, j in ((i0, j0), (i1, j0), (i1, j1), (i0, j1)):
+        corner = np.zeros(3)
+        corner[axis] = (origin[axis] + layer) * cube_size + sign * half
+        corner[u_axis] = (origin[u_axis] + i) * cube_size - half
+        corner[v_axis] = (origin[v_axis] + j) * cube_size - half
+        corners.append(corner)
+    corners = np.array(corners)
+    normal = np.zeros(3)
+    normal[axis] = sign
+    # counter-clockwise seen from outside, for back face culling
+    if np.dot(np.cross(corners[1] - corners[0], corners[2] - corners[0]), normal) < 0:
+        corners = corners[::-1]
+    # cube space coordinates repeat every cell, so the uvs tile across the merged quad
+    uvs = np.hstack([corners / half, np.ones((4, 1))]) @ uv_map
+    vertices = np.hstack([uvs, np.tile(normal, (4, 1)), corners])
+    return vertices[[0, 1, 2, 0, 2, 3]]
+
+
+def bake_voxels(cells: Cells, cube_size: float, chunk_size: Optional[int] = None) -> BakedMeshes:
+    # merges unit cubes on a grid into one mesh per texture and chunk of chunk_size x chunk_size cells in x and z,
+    # keeping only faces that are not covered by a neighbour and merging coplanar faces into rectangles
+    uv_maps = get_face_uv_maps()
+    coords = np.array(list(cells.keys()))
+    origin = coords.min(axis=0)
+    shape = tuple(coords.max(axis=0) - origin + 1)
+    solid = np.zeros(shape, dtype=bool)
+    grids: dict[str, np.ndarray] = dict()
+    for cell, tex_id in cells.items():
+        index = tuple(np.array(cell) - origin)
+        solid[index] = True
+        grids.setdefault(tex_id, np.zeros(shape, dtype=bool))[index] = True
+
+    chunk = chunk_size or max(shape)
+    meshes: dict[tuple[str, tuple[int, int]], list[np.ndarray]] = dict()
+    for tex_id, grid in grids.items():
+        for (axis, sign), uv_map in uv_maps.items():
+            faces = get_visible_faces(grid, solid, axis, sign)
+            u_axis, v_axis = [a for a in range(3) if a != axis]
+            for layer in range(shape[axis]):
+                plane = np.take(faces, layer, axis=axis)
+                # split each plane along the chunk grid in x and z
+                u_step = chunk if u_axis != 1 else shape[1]
+                v_step = chunk if v_axis != 1 else shape[1]
+                for u in range(0, plane.shape[0], u_step):
+                    for v in range(0, plane.shape[1], v_step):
+                        rects = greedy_rectangles(plane[u:u + u_step, v:v + v_step])
+                        if not rects:
+                            continue
+                        cell = np.zeros(3, dtype=int)
+                        cell[axis], cell[u_axis], cell[v_axis] = layer, u, v
+                        key = (tex_id, (int(cell[0] // chunk), int(cell[2] // chunk)))
+                        quads = meshes.setdefault(key, [])
+                        for i0, j0, i1, j1 in rects:
+                            quads.append(get_quad(axis, sign, layer, (u + i0, v + j0, u + i1, v + j1),
+                                                  origin, cube_size, uv_map))
+    return {key: np.concatenate(quads).astype('f4') for key, quads in meshes.items()}
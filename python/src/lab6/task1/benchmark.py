@@ -0,0 +1,276 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import moderngl as mgl
+from moderngl import Framebuffer, Query
+from pyglm import glm
+from camera import Camera
+from clock import FrameClock
+from light import Light
+from mesh import Mesh
+from scene import Scene
+from scene_renderer import SceneRenderer
+from graphics_engine import IGraphicsEngine
+from render_stats import RenderStats
+
+WIN_SIZE: tuple[int, int] = (1000, 800)
+FRAMES = 600
+WARMUP = 60
+# the scripted camera orbits the middle of the floor
+PATH_CENTER = (20, 0, 0)
+PATH_RADIUS = 55
+PATH_HEIGHT = 20
+
+CPU_PHASES = ('update', 'shadow', 'main')
+GPU_PHASES = ('shadow', 'main')
+COUNTERS = ('draw_calls', 'triangles', 'state_changes', 'queue_changes_unsorted', 'queue_changes_sorted',
+            'uniform_writes', 'culled', 'shadow_culled', 'shadow_bakes', 'occluded')
+
+
+class ScriptedCamera(Camera):
+    # follows a fixed path by frame number instead of reading the mouse and keyboard
+    path_frames: int
+
+    def __init__(self, app: IGraphicsEngine, path_frames: int) -> None:
+        self.path_frames = path_frames
+        super().__init__(app)
+        self.set_frame(0)
+
+    def set_frame(self, frame: int) -> None:
+        angle = 2 * math.pi * frame / self.path_frames
+        center = glm.vec3(PATH_CENTER)
+        self.position = center + glm.vec3(PATH_RADIUS * math.cos(angle),
+                                          PATH_HEIGHT + 5 * math.sin(2 * angle),
+                                          PATH_RADIUS * math.sin(angle))
+        forward = glm.normalize(center - self.position)
+        self.yaw = math.degrees(math.atan2(forward.z, forward.x))
+        self.pitch = math.degrees(math.asin(forward.y))
+        self.update_camera_vectors()
+        self.m_view = self.get_view_matrix()
+
+    def update(self) -> None:
+        self.set_frame(self.app.frame)
+
+
+class HeadlessEngine(IGraphicsEngine):
+    light: Light
+    camera: ScriptedCamera
+    mesh: Mesh
+    scene: Scene
+    scene_renderer: SceneRenderer
+    fbo: Framebuffer
+    queries: dict[str, Query]
+    frame: int
+    # extra animated models added to the scene
+    animated: int
+    occlusion: bool
+    # seconds from the start of __init__ until every asset is resident
+    startup_time: float
+
+    def __init__(self, win_size: tuple[int, int] = WIN_SIZE, path_frames: int = FRAMES,
+                 backend: str | None = None, animated: int = 0, occlusion: bool = True) -> None:
+        start_time = time.perf_counter()
+        self.WIN_SIZE = win_size
+        if backend:
+            self.ctx = mgl.create_standalone_context(require=330, backend=backend)
+        else:
+            self.ctx = mgl.create_standalone_context(require=330)
+        self.ctx.enable(flags=mgl.DEPTH_TEST | mgl.CULL_FACE)
+        self.fbo = self.ctx.framebuffer(color_attachments=[self.ctx.renderbuffer(win_size)],
+                                        depth_attachment=self.ctx.depth_renderbuffer(win_size))
+        self.queries = {phase: self.ctx.query(time=True) for phase in GPU_PHASES}
+
+        self.frame = 0
+        # advanced by exactly one simulation step per frame, so every run animates the same
+        self.clock = FrameClock()
+
+        self.stats = RenderStats()
+        self.light = Light()
+        self.camera = ScriptedCamera(self, path_frames)
+        self.mesh = Mesh(self)
+        self.scene = Scene(self)
+        self.animated = animated
+        if animated:
+            self.scene.add_crowd(animated)
+        self.scene_renderer = SceneRenderer(self, self.fbo)
+        self.occlusion = occlusion
+        self.scene_renderer.occlusion.enabled = occlusion
+        # measure rendering, not streaming
+        self.mesh.residency.flush()
+        self.startup_time = time.perf_counter() - start_time
+
+    def render(self) -> dict[str, float]:
+        self.fbo.clear(red=0.0, green=0.0, blue=0.0)
+        self.stats.reset()
+        renderer = self.scene_renderer
+        uniform_writes = self.mesh.vao.program.uniforms.writes
+        shadow_bakes = renderer.shadow_cache.bakes
+
+        start = time.perf_counter()
+        self.scene.update(self.clock.advance(self.clock.step))
+        self.camera.update()
+        renderer.update()
+        update_end = time.perf_counter()
+        with self.queries['shadow']:
+            renderer.render_shadow()
+        shadow_end = time.perf_counter()
+        with self.queries['main']:
+            renderer.main_render()
+        main_end = time.perf_counter()
+        # wait for the gpu so the frame time covers the whole frame
+        self.ctx.finish()
+        end = time.perf_counter()
+
+        return {
+            'cpu_update': (update_end - start) * 1000,
+            'cpu_shadow': (shadow_end - update_end) * 1000,
+            'cpu_main': (main_end - shadow_end) * 1000,
+            'gpu_shadow': self.queries['shadow'].elapsed / 1e6,
+            'gpu_main': self.queries['main'].elapsed / 1e6,
+            'frame': (end - start) * 1000,
+            'draw_calls': self.stats.draw_calls,
+            'triangles': self.stats.triangles,
+            'state_changes': self.stats.state_changes,
+            # program, vao and texture switches the render queues saved by sorting
+            'queue_changes_unsorted': renderer.queue.unsorted_changes + renderer.shadow_queue.unsorted_changes,
+            'queue_changes_sorted': renderer.queue.sorted_changes + renderer.shadow_queue.sorted_changes,
+            'uniform_writes': self.mesh.vao.program.uniforms.writes - uniform_writes,
+            'culled': renderer.culled_count,
+            'shadow_culled': renderer.shadow_culled_count,
+            'shadow_bakes': renderer.shadow_cache.bakes - shadow_bakes,
+            # rejected by the occlusion queries, read a few frames late
+            'occluded': renderer.occlusion.rejected_count,
+        }
+
+    def run(self, frames: int, warmup: int) -> list[dict[str, float]]:
+        # warmup frames stay on the first point of the path
+        for _ in range(warmup):
+            self.render()
+        samples = []
+        for self.frame in range(frames):
+            samples.append(self.render())
+        return samples
+
+    def destroy(self) -> None:
+        self.mesh.destroy()
+        self.scene_renderer.destroy()
+        self.fbo.release()
+        self.ctx.release()
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return {
+        'mean': float(np.mean(values)),
+        'p50': float(p50),
+        'p95': float(p95),
+        'p99': float(p99),
+        'max': float(np.max(values)),
+    }
+
+
+def get_git_revision() -> dict[str, str | bool | None]:
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=cwd, capture_output=True, text=True, check=True)
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no', '.'],
+                                cwd=cwd, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit.stdout.strip(), 'dirty': bool(status.stdout.strip())}
+
+
+def make_report(engine: HeadlessEngine, samples: list[dict[str, float]], warmup: int) -> dict:
+    return {
+        **get_git_revision(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': {
+            'frames': len(samples),
+            'warmup': warmup,
+            'win_size': list(engine.WIN_SIZE),
+            'animated': engine.animated,
+            'occlusion': engine.occlusion,
+        },
+        'system': {
+            'renderer': engine.ctx.info['GL_RENDERER'],
+            'gl_version': engine.ctx.info['GL_VERSION'],
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'startup_s': {'engine': engine.startup_time, 'assets': engine.mesh.loader.total_time},
+        'frame_ms': summarize([sample['frame'] for sample in samples]),
+        'cpu_ms': {phase: summarize([sample[f'cpu_{phase}'] for sample in samples]) for phase in CPU_PHASES},
+        'gpu_ms': {phase: summarize([sample[f'gpu_{phase}'] for sample in samples]) for phase in GPU_PHASES},
+        # per-frame averages
+        'counters': {name: float(np.mean([sample[name] for sample in samples])) for name in COUNTERS},
+        'samples': {'frame_ms': [round(sample['frame'], 4) for sample in samples]},
+    }
+
+
+def get_metrics(report: dict) -> dict[str, float]:
+    metrics = {f'frame {key}': report['frame_ms'][key] for key in ('p50', 'p95', 'p99')}
+    metrics.update({f'cpu {phase} p50': report['cpu_ms'][phase]['p50'] for phase in CPU_PHASES})
+    metrics.update({f'gpu {phase} p50': report['gpu_ms'][phase]['p50'] for phase in GPU_PHASES})
+    metrics.update(report['counters'])
+    return metrics
+
+
+def format_report(report: dict, baseline: dict | None = None) -> str:
+    revision = (report['commit'] or 'unknown')[:10] + (' (dirty)' if report['dirty'] else '')
+    lines = [f'{revision}, {report["system"]["renderer"]}, '
+             f'{report["config"]["frames"]} frames at {report["config"]["win_size"][0]}x'
+             f'{report["config"]["win_size"][1]}']
+    metrics = get_metrics(report)
+    if baseline is None:
+        lines += [f'{name:<20}{value:>14.3f}' for name, value in metrics.items()]
+        return '\n'.join(lines)
+
+    if baseline['system']['renderer'] != report['system']['renderer'] or baseline['config'] != report['config']:
+        lines.append('warning: baseline was recorded with a different renderer or config')
+    base_metrics = get_metrics(baseline)
+    lines.append(f'{"":<20}{"baseline":>14}{"current":>14}{"change":>10}')
+    for name, value in metrics.items():
+        base = base_metrics.get(name, 0.0)
+        change = f'{(value - base) / base * 100:+.1f}%' if base else '-'
+        lines.append(f'{name:<20}{base:>14.3f}{value:>14.3f}{change:>10}')
+    return '\n'.join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Render the scene offscreen along a scripted camera path '
+                                                 'and report frame times')
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--warmup', type=int, default=WARMUP)
+    parser.add_argument('--size', default=f'{WIN_SIZE[0]}x{WIN_SIZE[1]}', help='framebuffer size, WxH')
+    parser.add_argument('--backend', help='standalone context backend, e.g. egl')
+    parser.add_argument('--animated', type=int, default=0, help='animated cats to add to the scene')
+    parser.add_argument('--no-occlusion', action='store_true', help='draw without the occlusion queries')
+    parser.add_argument('--output', default='benchmark.json', help='where to write the json report')
+    parser.add_argument('--compare', help='json report of an earlier run to compare against')
+    args = parser.parse_args()
+
+    win_size = tuple(int(value) for value in args.size.lower().split('x'))
+    engine = HeadlessEngine(win_size, args.frames, args.backend, args.animated, not args.no_occlusion)
+    print(engine.mesh.loader.report(), file=sys.stderr)
+    samples = engine.run(args.frames, args.warmup)
+    report = make_report(engine, samples, args.warmup)
+    engine.destroy()
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print(format_report(report, baseline))
+    print(f'report written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
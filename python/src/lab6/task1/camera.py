@@ -1,13 +1,20 @@
+import numpy as np
 from pyglm import glm
 import pygame as pg
+from typing import Optional
 from pyglm.glm import vec3, mat4x4
 from graphics_engine import IGraphicsEngine
+from spatial_index import SceneIndex
 
 FOV = 50
 NEAR = 0.1
 FAR = 300
 SPEED = 0.03
 SENSITIVITY = 0.04
+# half the side of the box the camera bumps into solid props with
+COLLISION_RADIUS = 0.3
+# how far along the forward vector pick() finds objects
+PICK_DISTANCE = 100
 
 
 class Camera:
@@ -21,6 +28,9 @@ class Camera:
     pitch: int
     m_view: mat4x4
     m_proj: mat4x4
+    # set once the scene exists, the scene's models take the camera when they are made;
+    # without it the camera neither collides nor picks
+    index: Optional[SceneIndex]
 
     def __init__(self, app: IGraphicsEngine, position=(0, 0, 4), yaw=-90, pitch=0) -> None:
         self.app = app
@@ -33,6 +43,7 @@ class Camera:
         self.pitch = pitch
         self.m_view = self.get_view_matrix()
         self.m_proj = self.get_projection_matrix()
+        self.index = None
 
     def rotate(self) -> None:
         rel_x, rel_y = pg.mouse.get_rel()
@@ -58,7 +69,9 @@ class Camera:
         self.m_view = self.get_view_matrix()
 
     def move(self) -> None:
-        velocity = SPEED * self.app.delta_time
+        # SPEED is per millisecond of real time, the camera follows input every frame rather than every step
+        velocity = SPEED * self.app.clock.frame_time * 1000
+        start = glm.vec3(self.position)
         keys = pg.key.get_pressed()
         if keys[pg.K_w] or keys[pg.K_UP]:
             self.position += self.forward * velocity
@@ -72,6 +85,31 @@ class Camera:
             self.position += self.up * velocity
         if keys[pg.K_e] or keys[pg.K_LCTRL] or keys[pg.K_RCTRL]:
             self.position -= self.up * velocity
+        self.position = self.collide(start, self.position)
+
+    def is_blocked(self, position: vec3) -> bool:
+        b_min = np.array(position) - COLLISION_RADIUS
+        hits = self.index.query_aabb(b_min, b_min + 2 * COLLISION_RADIUS)
+        return any(obj.solid for obj, _ in hits)
+
+    def collide(self, start: vec3, end: vec3) -> vec3:
+        # slides along solid props, hedges and buildings, instead of entering them, one axis at a time;
+        # a camera already inside one is let out
+        if start == end or self.index is None or self.is_blocked(start):
+            return end
+        position = glm.vec3(start)
+        for axis in range(3):
+            candidate = glm.vec3(position)
+            candidate[axis] = end[axis]
+            if not self.is_blocked(candidate):
+                position = candidate
+        return position
+
+    def pick(self) -> Optional[tuple[object, int, float]]:
+        # (object, instance, distance) the camera looks at
+        if self.index is None:
+            return None
+        return self.index.pick(np.array(self.position), np.array(self.forward), PICK_DISTANCE)
 
     def get_view_matrix(self) -> mat4x4:
         return glm.lookAt(self.position, self.position + self.forward, self.up)
@@ -0,0 +1,74 @@
+import time
+from typing import Optional
+
+# the simulation advances in steps of this many seconds, whatever the frame rate
+SIMULATION_STEP = 1 / 60
+# real time a single frame may add to the simulation; after a stall the simulation slows down
+# rather than running a burst of steps that would stall the next frame too
+MAX_FRAME_TIME = 0.25
+# frame pacing: 'vsync' waits for the display, 'uncapped' renders as fast as possible,
+# 'capped' sleeps to stay at MAX_FPS
+PACING_MODES = ('vsync', 'uncapped', 'capped')
+MAX_FPS = 60
+# weight of the latest frame in the smoothed frame time
+FPS_SMOOTHING = 0.1
+
+
+class FrameClock:
+    # one high resolution clock for the whole engine: models animate from the simulation time,
+    # which only moves in fixed steps, and are drawn alpha of the way from the previous step to the latest
+    step: float
+    # simulation time at the latest step, in seconds
+    time: float
+    steps: int
+    # real time not yet simulated, less than one step
+    accumulator: float
+    alpha: float
+    # real seconds the last frame took, and a smoothed average
+    frame_time: float
+    average_frame_time: float
+    max_fps: Optional[int]
+    last_tick: float
+
+    def __init__(self, step: float = SIMULATION_STEP, max_fps: Optional[int] = None) -> None:
+        self.step = step
+        self.time = 0.0
+        self.steps = 0
+        self.accumulator = 0.0
+        self.alpha = 0.0
+        self.frame_time = 0.0
+        self.average_frame_time = step
+        self.max_fps = max_fps
+        self.last_tick = time.perf_counter()
+
+    @property
+    def fps(self) -> float:
+        return 1 / self.average_frame_time if self.average_frame_time > 0 else 0.0
+
+    def tick(self) -> int:
+        # call once per frame; returns the simulation steps the frame owes
+        now = time.perf_counter()
+        self.frame_time = now - self.last_tick
+        self.last_tick = now
+        self.average_frame_time += (self.frame_time - self.average_frame_time) * FPS_SMOOTHING
+        return self.advance(self.frame_time)
+
+    def advance(self, elapsed: float) -> int:
+        # adds elapsed real seconds, tick() measures them; scripted runs pass fixed amounts
+        self.accumulator += min(elapsed, MAX_FRAME_TIME)
+        steps = int(self.accumulator // self.step)
+        self.accumulator -= steps * self.step
+        self.alpha = self.accumulator / self.step
+        return steps
+
+    def advance_step(self) -> None:
+        self.steps += 1
+        self.time = self.steps * self.step
+
+    def pace(self) -> None:
+        # sleeps off the rest of the frame when the frame rate is capped
+        if self.max_fps is None:
+            return
+        remaining = self.last_tick + 1 / self.max_fps - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
@@ -0,0 +1,170 @@
+import numpy as np
+from pyglm.glm import mat4x4
+from spatial_index import SceneIndex
+
+LEAF_SIZE = 16
+
+
+def transform_bounds(bounds: np.ndarray, m_models: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # bounds: (2, 3) local min/max, m_models: (N, 4, 4) row-major model matrices
+    center = (bounds[0] + bounds[1]) * 0.5
+    extent = (bounds[1] - bounds[0]) * 0.5
+    rotation = m_models[:, :3, :3]
+    world_center = rotation @ center + m_models[:, :3, 3]
+    world_extent = np.abs(rotation) @ extent
+    return world_center - world_extent, world_center + world_extent
+
+
+class Frustum:
+    planes: np.ndarray
+    plane_list: list[list[float]]
+
+    def __init__(self, m_view_proj: mat4x4) -> None:
+        m = np.array(m_view_proj, dtype='f8')
+        planes = np.array([
+            m[3] + m[0], m[3] - m[0],  # left, right
+            m[3] + m[1], m[3] - m[1],  # bottom, top
+            m[3] + m[2], m[3] - m[2],  # near, far
+        ])
+        self.planes = planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+        self.plane_list = self.planes.tolist()
+
+    def classify(self, b_min, b_max) -> int:
+        # -1 outside, 0 intersecting, 1 inside; plain floats, used for bvh nodes
+        inside = True
+        for a, b, c, d in self.plane_list:
+            px = b_max[0] if a > 0 else b_min[0]
+            py = b_max[1] if b > 0 else b_min[1]
+            pz = b_max[2] if c > 0 else b_min[2]
+            if a * px + b * py + c * pz + d < 0:
+                return -1
+            nx = b_min[0] if a > 0 else b_max[0]
+            ny = b_min[1] if b > 0 else b_max[1]
+            nz = b_min[2] if c > 0 else b_max[2]
+            if a * nx + b * ny + c * nz + d < 0:
+                inside = False
+        return 1 if inside else 0
+
+    def test(self, mins: np.ndarray, maxs: np.ndarray) -> np.ndarray:
+        center = (mins + maxs) * 0.5
+        extent = (maxs - mins) * 0.5
+        normals = self.planes[:, :3]
+        distance = center @ normals.T + self.planes[:, 3]
+        radius = extent @ np.abs(normals).T
+        return np.all(distance >= -radius, axis=1)
+
+
+class BVH:
+    mins: np.ndarray
+    maxs: np.ndarray
+    order: np.ndarray
+    # node layout: [min, max, start, end, left, right, parent], children follow their parent
+    nodes: list[list]
+    leaf_of: np.ndarray
+
+    def __init__(self, mins: np.ndarray, maxs: np.ndarray) -> None:
+        self.mins = mins
+        self.maxs = maxs
+        self.order = np.arange(len(mins))
+        self.nodes = []
+        self.leaf_of = np.zeros(len(mins), dtype=int)
+        if len(mins):
+            self.build(0, len(mins), -1)
+
+    def build(self, start: int, end: int, parent: int) -> int:
+        index = len(self.nodes)
+        items = self.order[start:end]
+        node = [self.mins[items].min(axis=0).tolist(), self.maxs[items].max(axis=0).tolist(),
+                start, end, -1, -1, parent]
+        self.nodes.append(node)
+        if end - start <= LEAF_SIZE:
+            self.leaf_of[items] = index
+            return index
+        centers = (self.mins[items] + self.maxs[items]) * 0.5
+        axis = int(np.argmax(centers.max(axis=0) - centers.min(axis=0)))
+        self.order[start:end] = items[np.argsort(centers[:, axis], kind='stable')]
+        middle = (start + end) // 2
+        node[4] = self.build(start, middle, index)
+        node[5] = self.build(middle, end, index)
+        return index
+
+    def refit(self, mins: np.ndarray, maxs: np.ndarray, items: np.ndarray) -> None:
+        # only the leaves holding the changed items and their ancestors are refitted
+        self.mins = mins
+        self.maxs = maxs
+        dirty = set()
+        for index in np.unique(self.leaf_of[items]).tolist():
+            while index >= 0 and index not in dirty:
+                dirty.add(index)
+                index = self.nodes[index][6]
+        for index in sorted(dirty, reverse=True):
+            node = self.nodes[index]
+            if node[4] < 0:
+                leaf_items = self.order[node[2]:node[3]]
+                node[0] = self.mins[leaf_items].min(axis=0).tolist()
+                node[1] = self.maxs[leaf_items].max(axis=0).tolist()
+            else:
+                left, right = self.nodes[node[4]], self.nodes[node[5]]
+                node[0] = [min(a, b) for a, b in zip(left[0], right[0])]
+                node[1] = [max(a, b) for a, b in zip(left[1], right[1])]
+
+    def query(self, frustum: Frustum) -> np.ndarray:
+        visible = []
+        stack = [0] if self.nodes else []
+        while stack:
+            node = self.nodes[stack.pop()]
+            result = frustum.classify(node[0], node[1])
+            if result < 0:
+                continue
+            items = self.order[node[2]:node[3]]
+            if result > 0:
+                visible.append(items)
+            elif node[4] < 0:
+                visible.append(items[frustum.test(self.mins[items], self.maxs[items])])
+            else:
+                stack += [node[4], node[5]]
+        return np.concatenate(visible) if visible else np.empty(0, dtype=int)
+
+
+class SceneCuller:
+    # every scene object contributes one bvh item per instance, the bounds come from the scene index
+    index: SceneIndex
+    bvh: BVH
+    culled_count: int
+
+    def __init__(self, index: SceneIndex) -> None:
+        self.index = index
+        self.bvh = BVH(np.empty((0, 3)), np.empty((0, 3)))
+        self.culled_count = 0
+
+    @property
+    def objects(self) -> list:
+        return self.index.objects
+
+    @property
+    def offsets(self) -> list[int]:
+        return self.index.offsets
+
+    @property
+    def item_count(self) -> int:
+        return self.index.item_count
+
+    def update(self, version: int = 0) -> None:
+        self.index.update(version)
+        changed = self.index.take_changes()
+        if changed is None or len(self.bvh.mins) != self.index.item_count:
+            self.bvh = BVH(self.index.mins, self.index.maxs)
+        elif len(changed):
+            self.bvh.refit(self.index.mins, self.index.maxs, changed)
+
+    def cull(self, m_view_proj: mat4x4) -> list[tuple[object, np.ndarray, np.ndarray]]:
+        # (object, visible instance indices, their bvh item indices)
+        visible = np.sort(self.bvh.query(Frustum(m_view_proj)))
+        self.culled_count = self.item_count - len(visible)
+        bounds = np.searchsorted(visible, self.offsets)
+        result = []
+        for i, obj in enumerate(self.objects):
+            if bounds[i] != bounds[i + 1]:
+                items = visible[bounds[i]:bounds[i + 1]]
+                result.append((obj, items - self.offsets[i], items))
+        return result
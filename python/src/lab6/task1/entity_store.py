@@ -0,0 +1,133 @@
+import numpy as np
+from animation import compose_matrices
+
+# rows a new store allocates, it doubles whenever it fills up
+INITIAL_CAPACITY = 16
+
+
+class Entity:
+    # a row of an EntityStore; handles are made on demand and hold nothing but the row
+    __slots__ = ('store', 'index')
+    store: 'EntityStore'
+    index: int
+
+    def __init__(self, store: 'EntityStore', index: int) -> None:
+        self.store = store
+        self.index = index
+
+    @property
+    def pos(self) -> np.ndarray:
+        return self.store.positions[self.index]
+
+    @property
+    def rot(self) -> np.ndarray:
+        return self.store.rotations[self.index]
+
+    @property
+    def scale(self) -> np.ndarray:
+        return self.store.scales[self.index]
+
+    @property
+    def material(self) -> int:
+        return int(self.store.materials[self.index])
+
+    @property
+    def m_model(self) -> np.ndarray:
+        self.store.update_matrices()
+        return self.store.matrices[self.index]
+
+    def set_transform(self, pos=None, rot=None, scale=None) -> None:
+        self.store.set_transform(self.index, pos, rot, scale)
+
+    def set_material(self, material: int) -> None:
+        self.store.set_material(self.index, material)
+
+
+class EntityStore:
+    # transforms and materials of many entities in contiguous arrays, a row per entity,
+    # instead of a python model object with its own node and glm values for each
+    positions: np.ndarray
+    # radians
+    rotations: np.ndarray
+    scales: np.ndarray
+    # (N, 4, 4) row-major model matrices, composed for the dirty rows in update_matrices()
+    matrices: np.ndarray
+    # texture array layer of each entity
+    materials: np.ndarray
+    dirty: np.ndarray
+    count: int
+    # bumped whenever a row changes or is added
+    version: int
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY) -> None:
+        self.positions = np.zeros((capacity, 3), dtype='f4')
+        self.rotations = np.zeros((capacity, 3), dtype='f4')
+        self.scales = np.ones((capacity, 3), dtype='f4')
+        self.matrices = np.zeros((capacity, 4, 4), dtype='f4')
+        self.materials = np.zeros(capacity, dtype='u2')
+        self.dirty = np.zeros(capacity, dtype=bool)
+        self.count = 0
+        self.version = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def capacity(self) -> int:
+        return len(self.positions)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.positions, self.rotations, self.scales, self.matrices,
+                                              self.materials, self.dirty))
+
+    def reserve(self, capacity: int) -> None:
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, self.capacity * 2)
+        for name in ('positions', 'rotations', 'scales', 'matrices', 'materials', 'dirty'):
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.count] = array[:self.count]
+            setattr(self, name, grown)
+
+    def add(self, pos, rot=(0, 0, 0), scale=(1, 1, 1), material: int = 0) -> Entity:
+        return self.get(self.add_many(pos, rot, scale, material).start)
+
+    def add_many(self, positions, rotations=(0, 0, 0), scales=(1, 1, 1), materials=0) -> range:
+        # rows of (N, 3) arrays or values shared by all of them, returns the new indices
+        positions = np.asarray(positions, dtype='f4').reshape(-1, 3)
+        start, end = self.count, self.count + len(positions)
+        self.reserve(end)
+        self.positions[start:end] = positions
+        self.rotations[start:end] = np.asarray(rotations, dtype='f4').reshape(-1, 3)
+        self.scales[start:end] = np.asarray(scales, dtype='f4').reshape(-1, 3)
+        self.materials[start:end] = materials
+        self.dirty[start:end] = True
+        self.count = end
+        self.version += 1
+        return range(start, end)
+
+    def get(self, index: int) -> Entity:
+        if not 0 <= index < self.count:
+            raise IndexError(f'entity {index} out of range')
+        return Entity(self, index)
+
+    def set_transform(self, index: int, pos=None, rot=None, scale=None) -> None:
+        for array, value in ((self.positions, pos), (self.rotations, rot), (self.scales, scale)):
+            if value is not None:
+                array[index] = value
+        self.dirty[index] = True
+        self.version += 1
+
+    def set_material(self, index: int, material: int) -> None:
+        self.materials[index] = material
+        self.version += 1
+
+    def update_matrices(self) -> None:
+        rows = np.flatnonzero(self.dirty[:self.count])
+        if not len(rows):
+            return
+        transforms = np.stack([self.positions[rows], self.rotations[rows], self.scales[rows]], axis=1)
+        self.matrices[rows] = compose_matrices(transforms)
+        self.dirty[rows] = False
@@ -0,0 +1,65 @@
+from moderngl import Buffer, Program
+from pyglm import glm
+from graphics_engine import IGraphicsEngine
+from shadow_cascades import ShadowCascades
+
+# uniform block binding points, shared by every program declaring the block
+BLOCK_BINDINGS: dict[str, int] = {
+    'Camera': 0,
+    'Light': 1,
+    'Shadow': 2,
+}
+
+
+def pad_vec3(value) -> bytes:
+    # std140 aligns vec3 to 16 bytes
+    return glm.vec4(value, 0.0).to_bytes()
+
+
+class FrameUniforms:
+    # camera, light and shadow state in std140 uniform blocks, uploaded once per frame when it changes
+    app: IGraphicsEngine
+    cascades: ShadowCascades
+    buffers: dict[str, Buffer]
+    data: dict[str, bytes]
+
+    def __init__(self, app: IGraphicsEngine, programs: dict[str, Program], cascades: ShadowCascades) -> None:
+        self.app = app
+        self.cascades = cascades
+        self.buffers = dict()
+        self.data = dict()
+        for name, binding in BLOCK_BINDINGS.items():
+            self.buffers[name] = app.ctx.buffer(reserve=len(self.get_data(name)))
+            self.buffers[name].bind_to_uniform_block(binding)
+        self.bind_programs(programs)
+        self.update()
+
+    @staticmethod
+    def bind_programs(programs: dict[str, Program]) -> None:
+        for program in programs.values():
+            for name, binding in BLOCK_BINDINGS.items():
+                if name in program:
+                    program[name].binding = binding
+
+    def get_data(self, name: str) -> bytes:
+        if name == 'Camera':
+            camera = self.app.camera
+            # the skybox ignores the camera translation
+            m_view = glm.mat4(glm.mat3(camera.m_view))
+            return (camera.m_proj.to_bytes() + camera.m_view.to_bytes() +
+                    glm.inverse(camera.m_proj * m_view).to_bytes() + pad_vec3(camera.position))
+        if name == 'Shadow':
+            return self.cascades.get_data()
+        light = self.app.light
+        return (light.m_view_light.to_bytes() + pad_vec3(light.position) +
+                pad_vec3(light.Ia) + pad_vec3(light.Id) + pad_vec3(light.Is))
+
+    def update(self) -> None:
+        for name, buffer in self.buffers.items():
+            data = self.get_data(name)
+            if self.data.get(name) != data:
+                self.data[name] = data
+                buffer.write(data)
+
+    def destroy(self) -> None:
+        [buffer.release() for buffer in self.buffers.values()]
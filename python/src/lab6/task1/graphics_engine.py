@@ -1,10 +1,12 @@
 from abc import ABCMeta
 from moderngl import Context
+from clock import FrameClock
+from render_stats import RenderStats
 
 
 class IGraphicsEngine:
-    time: int
-    delta_time: int
+    clock: FrameClock
     WIN_SIZE: tuple[int, int]
     ctx: Context
+    stats: RenderStats
     __metaclass__ = ABCMeta
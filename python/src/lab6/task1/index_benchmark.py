@@ -0,0 +1,84 @@
+import argparse
+import time
+import numpy as np
+from spatial_index import SpatialGrid, intersect_ray
+
+COUNTS = (1_000, 10_000, 100_000)
+QUERIES = 200
+# props keep the same density whatever their number, one per AREA_PER_ITEM square units of floor
+AREA_PER_ITEM = 16
+QUERY_RADIUS = 5.0
+
+
+def get_bounds(count: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    side = (count * AREA_PER_ITEM) ** 0.5
+    centers = np.stack([rng.uniform(0, side, count), rng.uniform(0, 2, count), rng.uniform(0, side, count)], axis=1)
+    extents = rng.uniform(0.2, 1.5, (count, 3))
+    return (centers - extents).astype('f4'), (centers + extents).astype('f4')
+
+
+def scan_radius(mins: np.ndarray, maxs: np.ndarray, center: np.ndarray, radius: float) -> np.ndarray:
+    nearest = np.clip(center, mins, maxs)
+    return np.flatnonzero(np.einsum('ij,ij->i', nearest - center, nearest - center) <= radius * radius)
+
+
+def scan_aabb(mins: np.ndarray, maxs: np.ndarray, b_min: np.ndarray, b_max: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.all(mins <= b_max, axis=1) & np.all(maxs >= b_min, axis=1))
+
+
+def scan_ray(mins: np.ndarray, maxs: np.ndarray, origin: np.ndarray, direction: np.ndarray):
+    distances = intersect_ray(origin, direction / np.linalg.norm(direction), mins, maxs)
+    nearest = int(np.argmin(distances))
+    return (nearest, float(distances[nearest])) if distances[nearest] < np.inf else None
+
+
+def time_queries(query, arguments: list[tuple]) -> tuple[float, list]:
+    # microseconds per query
+    start = time.perf_counter()
+    results = [query(*args) for args in arguments]
+    return (time.perf_counter() - start) / len(arguments) * 1e6, results
+
+
+def run(count: int, queries: int) -> None:
+    rng = np.random.default_rng(0)
+    mins, maxs = get_bounds(count, rng)
+    side = (count * AREA_PER_ITEM) ** 0.5
+    start = time.perf_counter()
+    grid = SpatialGrid(mins, maxs)
+    build = (time.perf_counter() - start) * 1000
+
+    points = np.stack([rng.uniform(0, side, queries), np.ones(queries), rng.uniform(0, side, queries)],
+                      axis=1).astype('f4')
+    directions = rng.normal(size=(queries, 3)) * (1, 0.1, 1)
+    cases = [
+        ('radius', grid.query_radius, lambda c, r: scan_radius(mins, maxs, c, r),
+         [(point, QUERY_RADIUS) for point in points]),
+        ('aabb', grid.query_aabb, lambda a, b: scan_aabb(mins, maxs, a, b),
+         [(point - QUERY_RADIUS, point + QUERY_RADIUS) for point in points]),
+        ('ray', grid.raycast, lambda o, d: scan_ray(mins, maxs, o, d),
+         [(point, direction) for point, direction in zip(points, directions)]),
+    ]
+    print(f'{count} items, grid built in {build:.1f} ms')
+    for name, grid_query, scan_query, arguments in cases:
+        grid_time, grid_results = time_queries(grid_query, arguments)
+        scan_time, scan_results = time_queries(scan_query, arguments)
+        if name == 'ray':
+            same = all((a is None) == (b is None) and (a is None or abs(a[1] - b[1]) < 1e-4)
+                       for a, b in zip(grid_results, scan_results))
+        else:
+            same = all(np.array_equal(np.sort(a), b) for a, b in zip(grid_results, scan_results))
+        print(f'  {name:<8}grid {grid_time:>9.1f} us   scan {scan_time:>9.1f} us   '
+              f'{scan_time / grid_time:>6.1f}x{"" if same else "   results differ"}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Time scene queries on the spatial grid against a linear scan')
+    parser.add_argument('--counts', type=int, nargs='+', default=COUNTS)
+    parser.add_argument('--queries', type=int, default=QUERIES)
+    args = parser.parse_args()
+    for count in args.counts:
+        run(count, args.queries)
+
+
+if __name__ == '__main__':
+    main()
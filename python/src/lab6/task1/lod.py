@@ -0,0 +1,48 @@
+import math
+import numpy as np
+from camera import Camera, FOV, NEAR
+from culling import SceneCuller
+
+# projected diameter in pixels below which the next coarser level is used
+LOD_SCREEN_SIZES = (200.0, 100.0, 40.0)
+# a level only changes once the size is this far past its threshold, so levels don't flicker
+LOD_HYSTERESIS = 0.15
+
+
+def get_screen_sizes(mins: np.ndarray, maxs: np.ndarray, camera: Camera, height: int) -> np.ndarray:
+    centers = (mins + maxs) * 0.5
+    radii = np.linalg.norm(maxs - mins, axis=1) * 0.5
+    distances = np.maximum(np.linalg.norm(centers - np.array(camera.position, dtype='f4'), axis=1), NEAR)
+    return radii / (distances * math.tan(math.radians(FOV) / 2)) * height
+
+
+def select_lods(sizes: np.ndarray, levels: np.ndarray) -> np.ndarray:
+    thresholds = np.array(LOD_SCREEN_SIZES, dtype='f4')
+    # the levels a size is clearly inside of, a level within the band around its thresholds is kept
+    coarse = np.sum(sizes[:, None] < thresholds * (1 - LOD_HYSTERESIS), axis=1)
+    fine = np.sum(sizes[:, None] < thresholds * (1 + LOD_HYSTERESIS), axis=1)
+    return np.clip(levels, coarse, fine)
+
+
+class LodSelector:
+    # picks a detail level for every culler item from its projected bounds
+    culler: SceneCuller
+    camera: Camera
+    height: int
+    levels: np.ndarray
+
+    def __init__(self, culler: SceneCuller, camera: Camera, height: int) -> None:
+        self.culler = culler
+        self.camera = camera
+        self.height = height
+        self.levels = np.zeros(0, dtype=int)
+
+    def update(self) -> None:
+        culler = self.culler
+        if len(self.levels) != culler.item_count:
+            self.levels = np.zeros(culler.item_count, dtype=int)
+        sizes = get_screen_sizes(culler.bvh.mins, culler.bvh.maxs, self.camera, self.height)
+        self.levels = select_lods(sizes, self.levels)
+        for i, obj in enumerate(culler.objects):
+            levels = self.levels[culler.offsets[i]:culler.offsets[i + 1]]
+            obj.set_lods(np.minimum(levels, obj.lod_count - 1))
@@ -1,23 +1,34 @@
 import pygame as pg
 import sys
-from pygame.time import Clock
+import time
 from camera import Camera
+from clock import FrameClock, MAX_FPS
 from light import Light
 from mesh import Mesh
 from scene import Scene
 from scene_renderer import SceneRenderer
 import moderngl as mgl
 from graphics_engine import IGraphicsEngine
+from render_stats import RenderStats
+from overlay import Overlay
+from shadow_cascades import PCF_MODES
 
 WIN_SIZE: tuple[int, int] = (1000, 800)
+# one of clock.PACING_MODES
+PACING = 'vsync'
 
 class GraphicsEngine(IGraphicsEngine):
-    clock: Clock
+    clock: FrameClock
     light: Light
     camera: Camera
     mesh: Mesh
     scene: Scene
     scene_renderer: SceneRenderer
+    overlay: Overlay
+    # what the last click picked, shown in the caption
+    picked: str
+    # where F12 last dumped the profiler trace, shown in the caption
+    trace_path: str
 
     def __init__(self) -> None:
         pg.init()
@@ -28,7 +39,13 @@ class GraphicsEngine(IGraphicsEngine):
         pg.display.gl_set_attribute(pg.GL_CONTEXT_MINOR_VERSION, 3)
         pg.display.gl_set_attribute(pg.GL_CONTEXT_PROFILE_MASK, pg.GL_CONTEXT_PROFILE_CORE)
 
-        pg.display.set_mode(self.WIN_SIZE, flags=pg.OPENGL | pg.DOUBLEBUF)
+        pacing = PACING
+        try:
+            pg.display.set_mode(self.WIN_SIZE, flags=pg.OPENGL | pg.DOUBLEBUF, vsync=int(pacing == 'vsync'))
+        except pg.error:
+            # no vsync from this driver, sleep to the display rate instead
+            pg.display.set_mode(self.WIN_SIZE, flags=pg.OPENGL | pg.DOUBLEBUF)
+            pacing = 'capped'
 
         pg.event.set_grab(True)
         pg.mouse.set_visible(False)
@@ -37,39 +54,75 @@ class GraphicsEngine(IGraphicsEngine):
 
         self.ctx.enable(flags=mgl.DEPTH_TEST | mgl.CULL_FACE)
 
-        self.clock = pg.time.Clock()
-        self.time = 0
-        self.delta_time = 0
-
+        self.stats = RenderStats()
         self.light = Light()
         self.camera = Camera(self)
         self.mesh = Mesh(self)
         self.scene = Scene(self)
+        self.camera.index = self.scene.index
         self.scene_renderer = SceneRenderer(self)
+        self.overlay = Overlay(self, self.scene_renderer.profiler)
+        # started after loading, so the first frame doesn't count it
+        self.clock = FrameClock(max_fps=MAX_FPS if pacing == 'capped' else None)
+        self.picked = 'nothing'
+        self.trace_path = 'none'
 
     def check_events(self) -> None:
         for event in pg.event.get():
             if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
                 self.mesh.destroy()
                 self.scene_renderer.destroy()
+                self.overlay.destroy()
                 pg.quit()
                 sys.exit()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                self.overlay.toggle()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F4:
+                self.scene_renderer.cascades.cycle_pcf_mode()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F5:
+                self.scene_renderer.occlusion.toggle()
+            if event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
+                hit = self.camera.pick()
+                if hit is None:
+                    self.picked = 'nothing'
+                else:
+                    obj, instance, distance = hit
+                    self.picked = f'{obj.vao_name} #{instance} at {distance:.1f}'
+            if event.type == pg.KEYDOWN and event.key == pg.K_F12:
+                self.trace_path = time.strftime('trace-%Y%m%d-%H%M%S.json')
+                self.scene_renderer.profiler.dump_trace(self.trace_path)
 
     def render(self) -> None:
         self.ctx.clear(red=0.0, green=0.0, blue=0.0)
+        self.stats.reset()
         self.scene_renderer.render()
+        self.overlay.render()
         pg.display.flip()
 
-    def update_time(self) -> None:
-        self.time = int(pg.time.get_ticks() * 0.001)
-
     def run(self) -> None:
+        # the simulation runs in fixed steps, rendering as often as pacing allows in between
         while True:
-            self.update_time()
+            steps = self.clock.tick()
             self.check_events()
+            self.scene.update(steps)
             self.camera.update()
             self.render()
-            self.delta_time = self.clock.tick(60)
+            self.clock.pace()
+            self.report()
+
+    def report(self) -> None:
+        stats = self.mesh.residency.stats()
+        occlusion = self.scene_renderer.occlusion
+        pg.display.set_caption(f'{self.clock.fps:.0f} fps, '
+                               f'culled: {self.scene_renderer.culled_count} main, '
+                               f'{self.scene_renderer.shadow_culled_count} shadow, '
+                               f'occluded: {occlusion.rejected_count if occlusion.enabled else "off"}, '
+                               f'draw calls: {self.stats.draw_calls}, '
+                               f'state changes: {self.stats.state_changes}, '
+                               f'shadows: {PCF_MODES[self.scene_renderer.cascades.pcf_mode]}, '
+                               f'resident: {stats["resident_bytes"] / 2 ** 20:.0f} MB, '
+                               f'pending: {stats["pending"]}, evictions: {stats["evictions"]}, '
+                               f'picked: {self.picked}, trace: {self.trace_path}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,65 @@
+import argparse
+import gc
+import tracemalloc
+import numpy as np
+from benchmark import HeadlessEngine
+from entity_store import EntityStore
+from model import EntityModel, Ferret
+
+COUNT = 100_000
+# props are spread over the floor
+AREA = ((0, 40), (-40, 40))
+
+
+def measure(create) -> tuple[int, int, object]:
+    # python heap bytes and gc tracked objects the result of create() keeps alive
+    gc.collect()
+    objects = len(gc.get_objects())
+    tracemalloc.start()
+    result = create()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, len(gc.get_objects()) - objects, result
+
+
+def get_positions(count: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    (x_min, x_max), (z_min, z_max) = AREA
+    return np.stack([rng.uniform(x_min, x_max, count), np.full(count, -1.0), rng.uniform(z_min, z_max, count)],
+                    axis=1)
+
+
+def create_models(engine: HeadlessEngine, positions: np.ndarray) -> list[Ferret]:
+    return [Ferret(engine, pos=tuple(pos), rot=(-90, 90, 0), scale=(0.025, 0.025, 0.025)) for pos in positions.tolist()]
+
+
+def create_entities(engine: HeadlessEngine, positions: np.ndarray) -> EntityModel:
+    store = EntityStore()
+    store.add_many(positions, np.radians((-90, 90, 0)), (0.025, 0.025, 0.025), engine.mesh.texture.get_layer('ferret'))
+    return EntityModel(engine, 'ferret', 'ferret', store)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare the memory of props as model objects and as rows '
+                                                 'of an entity store')
+    parser.add_argument('--count', type=int, default=COUNT)
+    parser.add_argument('--backend', help='standalone context backend, e.g. egl')
+    args = parser.parse_args()
+
+    engine = HeadlessEngine((64, 64), backend=args.backend)
+    positions = get_positions(args.count)
+    print(f'{args.count} entities{"":<8}{"bytes/entity":>14}{"objects/entity":>16}')
+    results = []
+    for name, create in (('models', create_models), ('entity store', create_entities)):
+        size, objects, result = measure(lambda: create(engine, positions))
+        print(f'{name:<22}{size / args.count:>14.1f}{objects / args.count:>16.3f}')
+        results.append(result)
+    store = results[1].store
+    print(f'entity store arrays {store.nbytes / store.capacity:.1f} bytes/row, instance data '
+          f'{results[1].instance_data.nbytes / args.count:.1f} bytes/entity')
+    engine.destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,26 @@
+from asset_loader import AssetLoader
 from graphics_engine import IGraphicsEngine
+from residency import ResidencyManager, GPU_MEMORY_BUDGET
 from vao import VAO
 from texture import Texture
 
 
 class Mesh:
     app: IGraphicsEngine
+    loader: AssetLoader
+    residency: ResidencyManager
     vao: VAO
     texture: Texture
 
-    def __init__(self, app: IGraphicsEngine):
+    def __init__(self, app: IGraphicsEngine, budget: int = GPU_MEMORY_BUDGET, use_processes: bool = False):
         self.app = app
-        self.vao = VAO(app.ctx)
-        self.texture = Texture(app)
+        # meshes and textures are decoded on the loader when a model first acquires them
+        self.loader = AssetLoader(use_processes=use_processes)
+        self.residency = ResidencyManager(self.loader, budget)
+        self.vao = VAO(app.ctx, self.residency)
+        self.texture = Texture(app, self.residency)
 
     def destroy(self):
+        self.residency.destroy()
         self.vao.destroy()
         self.texture.destroy()
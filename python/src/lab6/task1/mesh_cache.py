@@ -0,0 +1,186 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import numpy as np
+import pywavefront
+from mesh_index import index_vertex_data, get_acmr
+from mesh_simplify import simplify_mesh
+
+MAGIC = b'MESH'
+VERSION = 2
+# magic, version, header size
+PREAMBLE = struct.Struct('<4sII')
+ALIGNMENT = 16
+# face count of each simplified level relative to the source mesh, level 0 is the source itself
+LOD_RATIOS = (0.5, 0.25, 0.1)
+LOD_LEVELS = len(LOD_RATIOS) + 1
+
+VERTEX_FORMATS = {
+    'T2F_N3F_V3F': ('2f 3f 3f', ['in_texcoord_0', 'in_normal', 'in_position']),
+}
+
+
+# one lock per source file, so concurrent loads of its levels compile it once
+compile_locks: dict[str, threading.RLock] = dict()
+compile_locks_lock = threading.Lock()
+
+
+def get_cache_path(obj_path: str, lod: int = 0) -> str:
+    return obj_path + (f'.lod{lod}.mesh' if lod else '.mesh')
+
+
+def get_source_hash(obj_path: str) -> str:
+    with open(obj_path, 'rb') as file:
+        return hashlib.blake2b(file.read(), digest_size=16).hexdigest()
+
+
+def parse_obj(obj_path: str) -> tuple[np.ndarray, str, list[str]]:
+    objs = pywavefront.Wavefront(obj_path, cache=False, parse=True)
+    obj = objs.materials.popitem()[1]
+    if obj.vertex_format not in VERTEX_FORMATS:
+        raise ValueError(f'{obj_path}: unsupported vertex format {obj.vertex_format}')
+    vertex_format, attribs = VERTEX_FORMATS[obj.vertex_format]
+    return np.array(obj.vertices, dtype='f4'), vertex_format, attribs
+
+
+def write_mesh(cache_path: str, vertex_data: np.ndarray, index_data: np.ndarray, header: dict) -> None:
+    vertex_bytes = np.ascontiguousarray(vertex_data, dtype='f4').tobytes()
+    # the index data follows the vertex data, both start aligned
+    vertex_bytes += b'\0' * (-len(vertex_bytes) % ALIGNMENT)
+    header_data = json.dumps(header).encode()
+    header_data += b' ' * (-(PREAMBLE.size + len(header_data)) % ALIGNMENT)
+    # unique per writer, several workers may compile the same mesh
+    tmp_path = f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(PREAMBLE.pack(MAGIC, VERSION, len(header_data)))
+        file.write(header_data)
+        file.write(vertex_bytes)
+        file.write(index_data.tobytes())
+    os.replace(tmp_path, cache_path)
+
+
+def read_header(cache_path: str) -> tuple[dict, int] | None:
+    try:
+        with open(cache_path, 'rb') as file:
+            magic, version, header_size = PREAMBLE.unpack(file.read(PREAMBLE.size))
+            if magic != MAGIC or version != VERSION:
+                return None
+            return json.loads(file.read(header_size)), PREAMBLE.size + header_size
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+def get_header(vertex_data: np.ndarray, index_data: np.ndarray, vertex_format: str, attribs: list[str],
+               unindexed_count: int, source_hash: str) -> dict:
+    sizes = [int(attr[:-1]) for attr in vertex_format.split()]
+    offset = sum(sizes[:attribs.index('in_position')])
+    positions = vertex_data.reshape(-1, sum(sizes))[:, offset:offset + 3]
+    return {
+        'format': vertex_format,
+        'attribs': attribs,
+        'vertex_count': len(positions),
+        'unindexed_vertex_count': unindexed_count,
+        'index_count': len(index_data),
+        'index_format': index_data.dtype.str[1:],
+        'acmr': get_acmr(index_data),
+        'bounds': [positions.min(axis=0).tolist(), positions.max(axis=0).tolist()],
+        'source_hash': source_hash,
+    }
+
+
+def compile_mesh(obj_path: str, reorder: bool = True, lods: bool = True) -> dict:
+    vertex_data, vertex_format, attribs = parse_obj(obj_path)
+    sizes = [int(attr[:-1]) for attr in vertex_format.split()]
+    stride = sum(sizes)
+    source_hash = get_source_hash(obj_path)
+    unindexed_count = len(vertex_data) // stride
+    vertex_data, index_data = index_vertex_data(vertex_data, stride, reorder)
+    header = get_header(vertex_data, index_data, vertex_format, attribs, unindexed_count, source_hash)
+    write_mesh(get_cache_path(obj_path), vertex_data, index_data, header)
+    if lods:
+        header['lods'] = compile_lods(obj_path, vertex_data, index_data, header, reorder)
+    return header
+
+
+def compile_lods(obj_path: str, vertex_data: np.ndarray, index_data: np.ndarray, header: dict,
+                 reorder: bool = True) -> list[dict]:
+    sizes = [int(attr[:-1]) for attr in header['format'].split()]
+    stride = sum(sizes)
+    offset = sum(sizes[:header['attribs'].index('in_position')])
+    lod_headers = []
+    levels = simplify_mesh(vertex_data, index_data, stride, offset, LOD_RATIOS)
+    for lod, (lod_vertex_data, error) in enumerate(levels, start=1):
+        unindexed_count = len(lod_vertex_data) // stride
+        lod_vertex_data, lod_index_data = index_vertex_data(lod_vertex_data, stride, reorder)
+        lod_header = get_header(lod_vertex_data, lod_index_data, header['format'], header['attribs'],
+                                unindexed_count, header['source_hash'])
+        # simplified levels keep the bounds of the source so culling does not depend on the level
+        lod_header.update(lod=lod, error=error, bounds=header['bounds'])
+        write_mesh(get_cache_path(obj_path, lod), lod_vertex_data, lod_index_data, lod_header)
+        lod_headers.append(lod_header)
+    return lod_headers
+
+
+def is_up_to_date(obj_path: str, lod: int = 0) -> bool:
+    cached = read_header(get_cache_path(obj_path, lod))
+    return cached is not None and cached[0]['source_hash'] == get_source_hash(obj_path)
+
+
+def load_mesh(obj_path: str, lod: int = 0) -> tuple[np.ndarray, np.ndarray, dict]:
+    cache_path = get_cache_path(obj_path, lod)
+    if not is_up_to_date(obj_path, lod):
+        with compile_locks_lock:
+            lock = compile_locks.setdefault(obj_path, threading.RLock())
+        with lock:
+            if not is_up_to_date(obj_path, lod) and lod == 0:
+                compile_mesh(obj_path, lods=False)
+            elif not is_up_to_date(obj_path, lod):
+                # simplified levels are built from the cached source level
+                compile_lods(obj_path, *load_mesh(obj_path))
+    header, offset = read_header(cache_path)
+    stride = sum(int(attr[:-1]) for attr in header['format'].split())
+    vertex_size = header['vertex_count'] * stride
+    vertex_data = np.memmap(cache_path, dtype='f4', mode='r', offset=offset, shape=(vertex_size,))
+    offset += vertex_size * 4 + (-vertex_size * 4 % ALIGNMENT)
+    index_data = np.memmap(cache_path, dtype=header['index_format'], mode='r', offset=offset,
+                           shape=(header['index_count'],))
+    return vertex_data, index_data, header
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Precompile .obj files into memory-mappable .mesh files')
+    parser.add_argument('directory', nargs='?', default='objects')
+    parser.add_argument('--force', action='store_true', help='rebuild up-to-date meshes too')
+    parser.add_argument('--no-reorder', action='store_true', help='skip the vertex cache reordering pass')
+    parser.add_argument('--no-lods', action='store_true', help='skip generating simplified levels')
+    args = parser.parse_args()
+
+    for name in sorted(os.listdir(args.directory)):
+        if not name.endswith('.obj'):
+            continue
+        obj_path = os.path.join(args.directory, name)
+        levels = 1 if args.no_lods else LOD_LEVELS
+        if not args.force and all(is_up_to_date(obj_path, lod) for lod in range(levels)):
+            print(f'{name}: up to date')
+            continue
+        start = time.perf_counter()
+        try:
+            header = compile_mesh(obj_path, reorder=not args.no_reorder, lods=not args.no_lods)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            continue
+        print(f'{name}: {header["unindexed_vertex_count"]} -> {header["vertex_count"]} vertices, '
+              f'{header["index_count"] // 3} triangles, acmr {header["acmr"]:.3f} '
+              f'in {time.perf_counter() - start:.2f}s')
+        for lod_header in header.get('lods', []):
+            print(f'  lod {lod_header["lod"]}: {lod_header["index_count"] // 3} triangles, '
+                  f'error {lod_header["error"]:.4f}')
+
+
+if __name__ == '__main__':
+    main()
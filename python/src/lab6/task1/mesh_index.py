@@ -0,0 +1,111 @@
+import numpy as np
+
+CACHE_SIZE = 16
+
+
+def deduplicate(vertex_data: np.ndarray, stride: int) -> tuple[np.ndarray, np.ndarray]:
+    rows = np.ascontiguousarray(vertex_data, dtype='f4').reshape(-1, stride)
+    # compare whole (uv, normal, position) rows as opaque byte strings
+    keys = rows.view(np.dtype((np.void, rows.itemsize * stride))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    # keep the unique vertices in order of first occurrence
+    order = np.argsort(first)
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+    return rows[first[order]], remap[inverse.ravel()].astype('u4')
+
+
+def optimize_vertex_cache(indices: np.ndarray, vertex_count: int, cache_size: int = CACHE_SIZE) -> np.ndarray:
+    # tipsify: Sander, Nehab, Barczak, "Fast Triangle Reordering for Vertex Locality and Reduced Overdraw"
+    triangles = indices.reshape(-1, 3).tolist()
+    live = np.bincount(indices, minlength=vertex_count).tolist()
+    adjacency_order = np.argsort(indices, kind='stable') // 3
+    adjacency_offsets = np.concatenate([[0], np.cumsum(live)]).tolist()
+    adjacency = adjacency_order.tolist()
+
+    cache_time = [0] * vertex_count
+    emitted = [False] * len(triangles)
+    dead_end = []
+    output = []
+    time_stamp = cache_size + 1
+    cursor = 0
+    fanning = 0 if vertex_count else -1
+
+    while fanning >= 0:
+        candidates = []
+        for t in adjacency[adjacency_offsets[fanning]:adjacency_offsets[fanning + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            for v in triangles[t]:
+                output.append(v)
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if time_stamp - cache_time[v] > cache_size:
+                    cache_time[v] = time_stamp
+                    time_stamp += 1
+
+        # prefer vertices that stay in the cache while their remaining triangles are emitted
+        fanning, best = -1, -1
+        for v in candidates:
+            if live[v] > 0:
+                priority = 0
+                if time_stamp - cache_time[v] + 2 * live[v] <= cache_size:
+                    priority = time_stamp - cache_time[v]
+                if priority > best:
+                    fanning, best = v, priority
+        if fanning < 0:
+            while dead_end:
+                v = dead_end.pop()
+                if live[v] > 0:
+                    fanning = v
+                    break
+        if fanning < 0:
+            while cursor < vertex_count:
+                if live[cursor] > 0:
+                    fanning = cursor
+                    break
+                cursor += 1
+
+    return np.array(output, dtype='u4')
+
+
+def reorder_vertices(vertices: np.ndarray, indices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # lay vertices out in the order the reordered triangles fetch them
+    _, first = np.unique(indices, return_index=True)
+    order = np.argsort(first)
+    remap = np.empty(len(vertices), dtype='u4')
+    remap[order] = np.arange(len(order))
+    return vertices[order], remap[indices]
+
+
+def get_acmr(indices: np.ndarray, cache_size: int = CACHE_SIZE) -> float:
+    # average cache miss ratio of a fifo post-transform cache, misses per triangle
+    if not len(indices):
+        return 0.0
+    cache = [-1] * cache_size
+    cached = set()
+    head = 0
+    misses = 0
+    for v in indices.tolist():
+        if v in cached:
+            continue
+        misses += 1
+        cached.discard(cache[head])
+        cache[head] = v
+        cached.add(v)
+        head = (head + 1) % cache_size
+    return misses / (len(indices) // 3)
+
+
+def get_index_format(vertex_count: int) -> str:
+    return 'u2' if vertex_count < 1 << 16 else 'u4'
+
+
+def index_vertex_data(vertex_data: np.ndarray, stride: int, reorder: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    vertices, indices = deduplicate(vertex_data, stride)
+    if reorder:
+        indices = optimize_vertex_cache(indices, len(vertices))
+        vertices, indices = reorder_vertices(vertices, indices)
+    return vertices.ravel(), indices.astype(get_index_format(len(vertices)))
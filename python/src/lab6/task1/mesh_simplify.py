@@ -0,0 +1,164 @@
+import heapq
+import numpy as np
+
+# weight of the planes that keep open boundaries in place
+BOUNDARY_WEIGHT = 100.0
+# collapses that turn a face by more than this (cosine) are rejected
+MIN_FACE_COS = 0.2
+
+
+def get_face_quadrics(points: np.ndarray, faces: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # area weighted plane quadrics of every face, and the face normals
+    a, b, c = points[faces[:, 0]], points[faces[:, 1]], points[faces[:, 2]]
+    cross = np.cross(b - a, c - a)
+    area = np.linalg.norm(cross, axis=1)
+    normals = cross / np.maximum(area, 1e-12)[:, None]
+    planes = np.hstack([normals, -np.einsum('ij,ij->i', normals, a)[:, None]])
+    return np.einsum('i,ij,ik->ijk', area * 0.5, planes, planes), normals
+
+
+def get_boundary_quadrics(points: np.ndarray, faces: np.ndarray, normals: np.ndarray) -> np.ndarray:
+    # edges used by one face only get a plane through the edge, perpendicular to the face
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    face_ids = np.tile(np.arange(len(faces)), 3)
+    keys = np.sort(edges, axis=1)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    boundary = counts[inverse.ravel()] == 1
+    quadrics = np.zeros((len(points), 4, 4))
+    if not boundary.any():
+        return quadrics
+    edges, face_ids = edges[boundary], face_ids[boundary]
+    a, b = points[edges[:, 0]], points[edges[:, 1]]
+    direction = b - a
+    length = np.linalg.norm(direction, axis=1)
+    normal = np.cross(direction, normals[face_ids])
+    normal /= np.maximum(np.linalg.norm(normal, axis=1), 1e-12)[:, None]
+    planes = np.hstack([normal, -np.einsum('ij,ij->i', normal, a)[:, None]])
+    edge_quadrics = np.einsum('i,ij,ik->ijk', BOUNDARY_WEIGHT * length ** 2, planes, planes)
+    np.add.at(quadrics, edges[:, 0], edge_quadrics)
+    np.add.at(quadrics, edges[:, 1], edge_quadrics)
+    return quadrics
+
+
+class Simplifier:
+    # quadric error metric edge collapse (Garland, Heckbert, "Surface Simplification Using Quadric Error Metrics"),
+    # collapsing onto an existing endpoint so every corner keeps its own uv and normal
+    points: np.ndarray
+    faces: np.ndarray
+    corners: np.ndarray
+    quadrics: np.ndarray
+    face_alive: np.ndarray
+    point_faces: list[set[int]]
+    versions: list[int]
+    heap: list[tuple[float, int, int, int, int]]
+    face_count: int
+    # largest collapse cost so far, in squared distance units
+    error: float
+
+    def __init__(self, vertices: np.ndarray, indices: np.ndarray, position_offset: int) -> None:
+        positions = vertices[:, position_offset:position_offset + 3].astype('f8')
+        # corners with different uvs or normals still share their position
+        self.points, point_ids = np.unique(positions, axis=0, return_inverse=True)
+        point_ids = point_ids.ravel()
+        self.corners = indices.reshape(-1, 3).astype(np.int64)
+        faces = point_ids[self.corners]
+        valid = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])
+        self.faces, self.corners = faces[valid], self.corners[valid]
+
+        face_quadrics, normals = get_face_quadrics(self.points, self.faces)
+        self.quadrics = get_boundary_quadrics(self.points, self.faces, normals)
+        for k in range(3):
+            np.add.at(self.quadrics, self.faces[:, k], face_quadrics)
+
+        self.face_alive = np.ones(len(self.faces), dtype=bool)
+        self.face_count = len(self.faces)
+        self.point_faces = [set() for _ in range(len(self.points))]
+        for f, face in enumerate(self.faces.tolist()):
+            for p in face:
+                self.point_faces[p].add(f)
+        self.versions = [0] * len(self.points)
+        self.error = 0.0
+        self.heap = []
+        for a, b in {(min(a, b), max(a, b)) for face in self.faces.tolist()
+                     for a, b in ((face[0], face[1]), (face[1], face[2]), (face[2], face[0]))}:
+            self.push(a, b)
+
+    def get_cost(self, src: int, dst: int) -> float:
+        v = np.append(self.points[dst], 1.0)
+        return float(v @ (self.quadrics[src] + self.quadrics[dst]) @ v)
+
+    def push(self, a: int, b: int) -> None:
+        cost_ab, cost_ba = self.get_cost(a, b), self.get_cost(b, a)
+        src, dst, cost = (a, b, cost_ab) if cost_ab <= cost_ba else (b, a, cost_ba)
+        heapq.heappush(self.heap, (cost, src, dst, self.versions[src], self.versions[dst]))
+
+    def get_neighbours(self, p: int) -> set[int]:
+        return {q for f in self.point_faces[p] for q in self.faces[f].tolist()} - {p}
+
+    def can_collapse(self, src: int, dst: int) -> bool:
+        shared = self.point_faces[src] & self.point_faces[dst]
+        if not shared:
+            return False
+        # link condition, keeps the mesh manifold
+        if len(self.get_neighbours(src) & self.get_neighbours(dst)) != len(shared):
+            return False
+        for f in self.point_faces[src] - shared:
+            face = self.faces[f]
+            a, b, c = self.points[face]
+            moved = [self.points[dst] if p == src else self.points[p] for p in face.tolist()]
+            before = np.cross(b - a, c - a)
+            after = np.cross(moved[1] - moved[0], moved[2] - moved[0])
+            norm = np.linalg.norm(before) * np.linalg.norm(after)
+            if norm < 1e-20 or np.dot(before, after) < MIN_FACE_COS * norm:
+                return False
+        return True
+
+    def collapse(self, src: int, dst: int) -> None:
+        shared = self.point_faces[src] & self.point_faces[dst]
+        for f in shared:
+            self.face_alive[f] = False
+            for p in self.faces[f].tolist():
+                self.point_faces[p].discard(f)
+        self.face_count -= len(shared)
+        for f in self.point_faces[src]:
+            self.faces[f][self.faces[f] == src] = dst
+            self.point_faces[dst].add(f)
+        self.point_faces[src] = set()
+        self.quadrics[dst] += self.quadrics[src]
+        self.versions[src] += 1
+        self.versions[dst] += 1
+        for p in self.get_neighbours(dst):
+            self.push(dst, p)
+
+    def simplify(self, target_faces: int) -> None:
+        while self.face_count > target_faces and self.heap:
+            cost, src, dst, src_version, dst_version = heapq.heappop(self.heap)
+            if self.versions[src] != src_version or self.versions[dst] != dst_version:
+                continue
+            if not self.can_collapse(src, dst):
+                continue
+            self.error = max(self.error, cost)
+            self.collapse(src, dst)
+
+    def get_vertex_data(self, vertices: np.ndarray, position_offset: int) -> np.ndarray:
+        # unindexed vertex data of the remaining faces, each corner moved to where its point collapsed to
+        alive = self.face_alive
+        corners = self.corners[alive].ravel()
+        data = vertices[corners].copy()
+        data[:, position_offset:position_offset + 3] = self.points[self.faces[alive].ravel()]
+        return data
+
+
+def simplify_mesh(vertices: np.ndarray, indices: np.ndarray, stride: int, position_offset: int,
+                  ratios: tuple[float, ...]) -> list[tuple[np.ndarray, float]]:
+    # one simplification run, snapshotted at each ratio of the original face count (in decreasing order);
+    # returns unindexed vertex data and the geometric error estimate of every level
+    vertices = np.asarray(vertices, dtype='f4').reshape(-1, stride)
+    simplifier = Simplifier(vertices, np.asarray(indices), position_offset)
+    face_count = simplifier.face_count
+    levels = []
+    for ratio in ratios:
+        simplifier.simplify(max(1, int(face_count * ratio)))
+        levels.append((simplifier.get_vertex_data(vertices, position_offset).ravel(),
+                       float(np.sqrt(max(simplifier.error, 0.0)))))
+    return levels
@@ -1,103 +1,354 @@
-import time
-
-import math
-
-from moderngl import VertexArray, Program, TextureCube, Texture
+import numpy as np
+from typing import Optional
+from moderngl import VertexArray, Program, TextureCube, Texture, TextureArray, Buffer
 from pyglm import glm
 from pyglm.glm import vec3, mat4x4
+from animation import Motion, compose_matrices, evaluate_motion, get_motion_arrays
 from graphics_engine import IGraphicsEngine
 from camera import Camera
+from culling import transform_bounds
+from entity_store import EntityStore
+from shader_program import UniformCache
+from transform import Node, get_model_matrix
+from vbo import get_lod_name
+
+# bytes per instance: the model matrix and the texture array layer
+INSTANCE_SIZE = 17 * 4
 
 
 class BaseModel:
     app: IGraphicsEngine
-    pos: tuple[float, float, float]
+    node: Node
     vao_name: str
-    rot: vec3
-    scale: tuple[float, float, float]
-    m_model: mat4x4
     tex_id: str
-    vao: VertexArray
-    program: Program
+    program_name: str = 'default'
+    uniforms: UniformCache
     camera: Camera
+    # moving models get move() called every simulation step, or follow their motion
+    dynamic: bool = False
+    # the camera does not pass through solid models
+    solid: bool = False
+    # motion curves, evaluated by the scene's Animation together with those of every other model
+    motion: Optional[Motion] = None
+    # (pos, rot, scale) at the previous and latest simulation step, moving models are drawn in between
+    transforms: tuple[tuple[vec3, vec3, vec3], tuple[vec3, vec3, vec3]]
+    # detail level of the mesh, picked by the lod selector
+    lod: int = 0
 
     def __init__(self, app: IGraphicsEngine, vao_name: str, tex_id: str, pos=(0, 0, 0), rot=(0, 0, 0), scale=(1, 1, 1)):
         self.app = app
-        self.pos = pos
+        self.node = Node(pos, [glm.radians(a) for a in rot], scale)
+        self.transforms = (self.get_transform(), self.get_transform())
         self.vao_name = vao_name
-        self.rot = glm.vec3([glm.radians(a) for a in rot])
-        self.scale = scale
-        self.m_model = self.get_model_matrix()
         self.tex_id = tex_id
-        self.vao = app.mesh.vao.vaos[vao_name]
-        self.program = self.vao.program
+        self.app.mesh.vao.vbo.acquire(vao_name)
+        self.uniforms = self.app.mesh.vao.program.uniforms
         self.camera = self.app.camera
 
     def update(self) -> None: ...
 
-    def get_model_matrix(self) -> mat4x4:
-        m_model = glm.mat4()
-        # translate
-        m_model = glm.translate(m_model, self.pos)
-        # rotate
-        m_model = glm.rotate(m_model, self.rot[2], glm.vec3(0, 0, 1))
-        m_model = glm.rotate(m_model, self.rot[1], glm.vec3(0, 1, 0))
-        m_model = glm.rotate(m_model, self.rot[0], glm.vec3(1, 0, 0))
-        # scale
-        m_model = glm.scale(m_model, self.scale)
-        return m_model
+    def move(self) -> None: ...
+
+    def get_transform(self) -> tuple[vec3, vec3, vec3]:
+        return glm.vec3(self.node.pos), glm.vec3(self.node.rot), glm.vec3(self.node.scale)
+
+    def step(self) -> None:
+        # move() leaves the transform of the new simulation time on the node
+        self.move()
+        self.transforms = (self.transforms[1], self.get_transform())
+
+    def interpolate(self, alpha: float) -> None:
+        previous, latest = self.transforms
+        self.node.set_transform(*(glm.mix(a, b, alpha) for a, b in zip(previous, latest)))
+
+    @property
+    def motion_count(self) -> int:
+        # entities the motion animates
+        return 1
+
+    def animate(self, transforms: np.ndarray) -> None:
+        # (1, 3, 3) pos, rot, scale from the Animation
+        self.node.set_transform(*(tuple(value.tolist()) for value in transforms[0]))
+
+    @property
+    def program(self) -> Program:
+        # looked up on every use, shaders may be reloaded
+        return self.app.mesh.vao.program.programs[self.program_name]
+
+    @property
+    def pos(self) -> vec3:
+        return self.node.pos
+
+    @property
+    def rot(self) -> vec3:
+        return self.node.rot
+
+    @property
+    def scale(self) -> vec3:
+        return self.node.scale
+
+    @property
+    def m_model(self) -> mat4x4:
+        return self.node.world_matrix
+
+    def attach(self, child: 'BaseModel') -> None:
+        # the child's transform becomes relative to this model
+        self.node.add_child(child.node)
+
+    def get_bounds(self) -> tuple[np.ndarray, np.ndarray]:
+        bounds = self.app.mesh.vao.vbo.get(self.vao_name).bounds
+        return transform_bounds(bounds, np.array(self.m_model, dtype='f4')[None])
+
+    @property
+    def lod_count(self) -> int:
+        return self.app.mesh.vao.vbo.get_lod_count(self.vao_name)
+
+    def set_lods(self, levels: np.ndarray) -> None:
+        self.lod = int(levels[0])
+
+    @property
+    def vao(self) -> VertexArray:
+        # looked up on every use, the mesh may still be streaming in or may have been evicted
+        return self.get_vao()
+
+    def get_vao(self) -> VertexArray:
+        return self.app.mesh.vao.get(self.program_name, get_lod_name(self.vao_name, self.lod))
 
     def render(self):
         self.update()
-        self.vao.render()
+        self.app.stats.draw(self.vao)
+
+    def destroy(self) -> None:
+        self.app.mesh.vao.vbo.release(self.vao_name)
 
 
 class ExtendedBaseModel(BaseModel):
+    shadow_program_name: str = 'shadow_map'
+    # layer of tex_id in its texture array
+    layer: int
+
     def __init__(self, app: IGraphicsEngine, vao_name: str, tex_id: str, pos: tuple[int, int, int],
                  rot: tuple[int, int, int], scale: tuple[int, int, int]) -> None:
         super().__init__(app, vao_name, tex_id, pos, rot, scale)
         self.on_init()
 
     def update(self) -> None:
-        self.texture.use(location=0)
-        self.program['camPos'].write(self.camera.position)
-        self.program['m_view'].write(self.camera.m_view)
-        self.program['m_model'].write(self.m_model)
+        self.app.stats.bind_texture(self.texture, 0)
+        self.uniforms.write(self.program, 'm_model', self.m_model)
+        self.uniforms.write(self.program, 'u_layer', glm.vec1(self.layer))
 
     def update_shadow(self) -> None:
-        self.shadow_program['m_model'].write(self.m_model)
+        self.uniforms.write(self.shadow_program, 'm_model', self.m_model)
+
+    @property
+    def shadow_program(self) -> Program:
+        return self.app.mesh.vao.program.programs[self.shadow_program_name]
+
+    @property
+    def shadow_vao(self) -> VertexArray:
+        return self.get_shadow_vao()
 
-    def render_shadow(self) -> None:
+    def get_shadow_vao(self, lod: Optional[int] = None) -> VertexArray:
+        lod = self.lod if lod is None else lod
+        return self.app.mesh.vao.get(self.shadow_program_name, get_lod_name(self.vao_name, lod))
+
+    @property
+    def texture(self) -> TextureArray:
+        # shared by every texture in the same array
+        return self.app.mesh.texture.get(self.tex_id)
+
+    def render_shadow(self, lod: Optional[int] = None) -> None:
+        # lod overrides the selected detail level
         self.update_shadow()
-        self.shadow_vao.render()
+        self.app.stats.draw(self.get_shadow_vao(lod))
+
+    def destroy(self) -> None:
+        super().destroy()
+        self.app.mesh.texture.release(self.tex_id)
 
     def on_init(self) -> None:
-        self.program['m_view_light'].write(self.app.light.m_view_light)
-        # resolution
-        self.program['u_resolution'].write(glm.vec2(self.app.WIN_SIZE))
+        # camera and light come from the Camera and Light uniform blocks
         # depth texture
         self.depth_texture = self.app.mesh.texture.textures['depth_texture']
-        self.program['shadowMap'] = 1
+        self.app.mesh.vao.program.set_default(self.program_name, 'shadowMap', 1)
         self.depth_texture.use(location=1)
-        # shadow
-        self.shadow_vao = self.app.mesh.vao.vaos['shadow_' + self.vao_name]
-        self.shadow_program = self.shadow_vao.program
-        self.shadow_program['m_proj'].write(self.camera.m_proj)
-        self.shadow_program['m_view_light'].write(self.app.light.m_view_light)
-        self.shadow_program['m_model'].write(self.m_model)
         # texture
-        self.texture = self.app.mesh.texture.textures[self.tex_id]
-        self.program['u_texture_0'] = 0
+        self.app.mesh.texture.acquire(self.tex_id)
+        self.layer = self.app.mesh.texture.get_layer(self.tex_id)
+        self.app.mesh.vao.program.set_default(self.program_name, 'u_texture_0', 0)
         self.texture.use(location=0)
-        # mvp
-        self.program['m_proj'].write(self.camera.m_proj)
-        self.program['m_view'].write(self.camera.m_view)
-        self.program['m_model'].write(self.m_model)
-        # light
-        self.program['light.position'].write(self.app.light.position)
-        self.program['light.Ia'].write(self.app.light.Ia)
-        self.program['light.Id'].write(self.app.light.Id)
-        self.program['light.Is'].write(self.app.light.Is)
+
+
+class InstancedModel(ExtendedBaseModel):
+    program_name = 'default_instanced'
+    shadow_program_name = 'shadow_map_instanced'
+    # (N, 4, 4) model matrices, row-major; uploaded transposed as in_m_model
+    instances: np.ndarray
+    # texture array layer of each instance
+    instance_layers: np.ndarray
+    instance_data: np.ndarray
+    # one instance buffer per detail level and pass
+    instance_buffers: list[Buffer]
+    shadow_instance_buffers: list[Buffer]
+    written: dict[int, Optional[np.ndarray]]
+    # detail level of each instance
+    lods: np.ndarray
+
+    def __init__(self, app: IGraphicsEngine, vao_name: str, tex_id: str,
+                 instances: list[tuple]) -> None:
+        # instances are (pos, rot, scale) tuples with rotation in degrees, as for the other models;
+        # a fourth element overrides tex_id, with any texture from the same texture array
+        matrices = np.array([
+            get_model_matrix(pos, glm.vec3([glm.radians(a) for a in rot]), scale)
+            for pos, rot, scale, *_ in instances
+        ], dtype='f4')
+        layers = np.array([
+            self.get_instance_layer(app, tex_id, *instance[3:]) for instance in instances
+        ], dtype='f4')
+        self.init_instances(app, vao_name, matrices, layers)
+        super().__init__(app, vao_name, tex_id, (0, 0, 0), (0, 0, 0), (1, 1, 1))
+
+    def init_instances(self, app: IGraphicsEngine, vao_name: str, matrices: np.ndarray, layers: np.ndarray) -> None:
+        self.instances = matrices
+        self.instance_layers = layers
+        lod_count = app.mesh.vao.vbo.get_lod_count(vao_name)
+        size = len(self.instances) * INSTANCE_SIZE
+        self.instance_buffers = [app.ctx.buffer(reserve=size) for _ in range(lod_count)]
+        self.shadow_instance_buffers = [app.ctx.buffer(reserve=size) for _ in range(lod_count)]
+        self.lods = np.zeros(len(self.instances), dtype=int)
+        self.write_instances()
+
+    @staticmethod
+    def get_instance_layer(app: IGraphicsEngine, tex_id: str, instance_tex_id: Optional[str] = None) -> int:
+        textures = app.mesh.texture
+        instance_tex_id = instance_tex_id or tex_id
+        if textures.layers[instance_tex_id][0] != textures.layers[tex_id][0]:
+            raise ValueError(f'{instance_tex_id} is not in the texture array of {tex_id}')
+        return textures.get_layer(instance_tex_id)
+
+    @property
+    def instance_count(self) -> int:
+        return len(self.instances)
+
+    def write_instances(self) -> None:
+        matrices = self.instances.transpose(0, 2, 1).reshape(-1, 16)
+        self.instance_data = np.hstack([matrices, self.instance_layers[:, None]])
+        for buffer in self.instance_buffers + self.shadow_instance_buffers:
+            if buffer.size != self.instance_data.nbytes:
+                buffer.orphan(self.instance_data.nbytes)
+        self.written = {buffer.glo: None for buffer in self.instance_buffers + self.shadow_instance_buffers}
+
+    def write_visible(self, buffer: Buffer, instances: Optional[np.ndarray]) -> int:
+        # compacts the visible instances to the front of the buffer, skipping unchanged sets
+        if instances is None:
+            instances = np.arange(self.instance_count)
+        written = self.written[buffer.glo]
+        if written is None or not np.array_equal(written, instances):
+            buffer.write(self.instance_data[instances].tobytes())
+            self.written[buffer.glo] = instances
+        return len(instances)
+
+    def get_bounds(self) -> tuple[np.ndarray, np.ndarray]:
+        bounds = self.app.mesh.vao.vbo.get(self.vao_name).bounds
+        return transform_bounds(bounds, self.instances)
+
+    def set_lods(self, levels: np.ndarray) -> None:
+        self.lods = levels
+
+    def split_lods(self, instances: Optional[np.ndarray], lod: Optional[int] = None) -> list[tuple[int, np.ndarray]]:
+        # visible instances grouped by detail level, in their original order
+        if instances is None:
+            instances = np.arange(self.instance_count)
+        if lod is not None:
+            return [(lod, instances)]
+        levels = self.lods[instances]
+        return [(lod, instances[levels == lod]) for lod in np.unique(levels).tolist()]
+
+    def get_vao(self, lod: int = 0) -> VertexArray:
+        return self.app.mesh.vao.get(self.program_name, get_lod_name(self.vao_name, lod), self.instance_buffers[lod])
+
+    def get_shadow_vao(self, lod: int = 0) -> VertexArray:
+        return self.app.mesh.vao.get(self.shadow_program_name, get_lod_name(self.vao_name, lod),
+                                     self.shadow_instance_buffers[lod])
+
+    def update(self) -> None:
+        self.app.stats.bind_texture(self.texture, 0)
+
+    def update_shadow(self) -> None: ...
+
+    def render(self, instances: Optional[np.ndarray] = None) -> None:
+        self.update()
+        for lod, lod_instances in self.split_lods(instances):
+            self.app.stats.draw(self.get_vao(lod), self.write_visible(self.instance_buffers[lod], lod_instances))
+
+    def render_shadow(self, instances: Optional[np.ndarray] = None, lod: Optional[int] = None) -> None:
+        self.update_shadow()
+        for lod, lod_instances in self.split_lods(instances, lod):
+            self.app.stats.draw(self.get_shadow_vao(lod),
+                                self.write_visible(self.shadow_instance_buffers[lod], lod_instances))
+
+    def destroy(self) -> None:
+        for buffer in self.instance_buffers + self.shadow_instance_buffers:
+            self.app.mesh.vao.release_instance_buffer(buffer)
+        self.instance_buffers = []
+        self.shadow_instance_buffers = []
+        super().destroy()
+
+
+class AnimatedModel(InstancedModel):
+    # count instances of one mesh moving along motion curves; the scene's Animation evaluates them
+    # and the model matrices are composed in one batch, no per-instance python
+    dynamic = True
+
+    def __init__(self, app: IGraphicsEngine, vao_name: str, tex_id: str, motion: Motion, count: int) -> None:
+        self.motion = motion
+        matrices = compose_matrices(evaluate_motion(get_motion_arrays(motion, count), 0.0))
+        layers = np.full(count, self.get_instance_layer(app, tex_id), dtype='f4')
+        self.init_instances(app, vao_name, matrices, layers)
+        ExtendedBaseModel.__init__(self, app, vao_name, tex_id, (0, 0, 0), (0, 0, 0), (1, 1, 1))
+
+    @property
+    def motion_count(self) -> int:
+        return self.instance_count
+
+    def animate(self, transforms: np.ndarray) -> None:
+        self.instances = compose_matrices(transforms)
+        self.write_instances()
+        # the instances moved, bounds derived from them are stale
+        self.node.version += 1
+
+
+class EntityModel(InstancedModel):
+    # draws every entity of an EntityStore as an instance; entities may be moved or added
+    # after the model is made, the instance data follows the store in sync()
+    store: EntityStore
+    # store version the instances were taken at
+    synced_version: int
+
+    def __init__(self, app: IGraphicsEngine, vao_name: str, tex_id: str, store: EntityStore) -> None:
+        self.store = store
+        self.synced_version = store.version
+        store.update_matrices()
+        self.init_instances(app, vao_name, store.matrices[:store.count], store.materials[:store.count].astype('f4'))
+        ExtendedBaseModel.__init__(self, app, vao_name, tex_id, (0, 0, 0), (0, 0, 0), (1, 1, 1))
+
+    def sync(self) -> None:
+        if self.store.version == self.synced_version:
+            return
+        self.synced_version = self.store.version
+        self.store.update_matrices()
+        count = self.store.count
+        self.instances = self.store.matrices[:count]
+        self.instance_layers = self.store.materials[:count].astype('f4')
+        if len(self.lods) != count:
+            self.lods = np.zeros(count, dtype=int)
+        self.write_instances()
+        # bounds derived from the instances are stale
+        self.node.version += 1
+
+    def get_bounds(self) -> tuple[np.ndarray, np.ndarray]:
+        self.sync()
+        return super().get_bounds()
 
 
 class Cube(ExtendedBaseModel):
@@ -105,6 +356,17 @@ class Cube(ExtendedBaseModel):
         super().__init__(app, vao_name, tex_id, pos, rot, scale)
 
 
+class BakedMesh(ExtendedBaseModel):
+    # geometry already in world space, its vertices carry their texture array layers;
+    # tex_id picks the array, all textures of the mesh must be in it
+    def __init__(self, app: IGraphicsEngine, vao_name: str, tex_id: str) -> None:
+        super().__init__(app, vao_name, tex_id, (0, 0, 0), (0, 0, 0), (1, 1, 1))
+
+    def on_init(self) -> None:
+        super().on_init()
+        self.layer = 0
+
+
 class Ferret(ExtendedBaseModel):
     def __init__(self, app: IGraphicsEngine, vao_name='ferret', tex_id='ferret',
                  pos=(0, 0, 0), rot=(-90, 0, 0), scale=(1, 1, 1)) -> None:
@@ -124,34 +386,22 @@ class Farmhouse(ExtendedBaseModel):
 
 
 class Cat(ExtendedBaseModel):
+    dynamic = True
+
     def __init__(self, app: IGraphicsEngine, vao_name='cat', tex_id='cat',
                  pos=(0, 0, 0), rot=(-90, 0, 0), scale=(1.0, 1.0, 1.0)) -> None:
         super().__init__(app, vao_name, tex_id, pos, rot, scale)
-        self.base_scale = scale
-        self.radius = 5
-        self.speed = 0.5
-        self.rotation_speed = 0.01
-        self.start_time = time.time()
-
-    def update(self):
-        s = (math.sin(time.time()) + 1) * 1.5
-        scale_factor = 1 + s
-        self.scale = (
-            self.base_scale[0] * scale_factor,
-            self.base_scale[1] * scale_factor,
-            self.base_scale[2] * scale_factor
-        )
-        t = time.time() - self.start_time
-        angle = self.speed * t
-        x = self.radius * math.cos(angle) + 10
-        z = self.radius * math.sin(angle) + 20
-        self.pos = (x, self.pos[1], z)
-
-        rot_y = (self.rot[1] + self.rotation_speed * t) % 360
-        self.rot = vec3(self.rot[0], rot_y, self.rot[2])
-
-        self.m_model = self.get_model_matrix()
-        super().update()
+        # circles (10, 20) while turning around and growing up to four times its size
+        self.motion = {
+            'center': (10, self.pos[1], 20),
+            'orbit_radius': 5,
+            'orbit_speed': 0.5,
+            'base_rot': tuple(self.rot),
+            'spin': (0, 0.6, 0),
+            'base_scale': tuple(self.scale),
+            'pulse': 1.5,
+            'pulse_speed': 1.0,
+        }
 
 
 class Cactus(ExtendedBaseModel):
@@ -173,24 +423,24 @@ class Hedge(ExtendedBaseModel):
 
 
 class Car(ExtendedBaseModel):
+    dynamic = True
+
     def __init__(self, app: IGraphicsEngine, vao_name='car', tex_id='car',
                  pos=(0, 0, 0), rot=(-90, 0, 0), scale=(1.0, 1.0, 1.0)) -> None:
         super().__init__(app, vao_name, tex_id, pos, rot, scale)
-        self.speed = 0.5
-        self.amplitude = 34
-        self.start_time = time.time()
-        self.base_pos = pos
-
-    def update(self):
-        t = time.time() - self.start_time
-        z = self.amplitude * math.cos(self.speed * t)
-        self.pos = (self.base_pos[0], self.base_pos[1], z)
-
-        self.m_model = self.get_model_matrix()
-        super().update()
+        # drives back and forth along z
+        self.motion = {
+            'center': (self.pos[0], self.pos[1], 0),
+            'axis': (0, 0, 1),
+            'amplitude': 34,
+            'oscillation_speed': 0.5,
+            'base_rot': tuple(self.rot),
+            'base_scale': tuple(self.scale),
+        }
 
 
 class AdvancedSkyBox(BaseModel):
+    program_name = 'skybox'
     texture: Texture | TextureCube
 
     def __init__(self, app: IGraphicsEngine, vao_name='skybox', tex_id='skybox',
@@ -198,11 +448,7 @@ class AdvancedSkyBox(BaseModel):
         super().__init__(app, vao_name, tex_id, pos, rot, scale)
         self.on_init()
 
-    def update(self) -> None:
-        m_view = glm.mat4(glm.mat3(self.camera.m_view))
-        self.program['m_invProjView'].write(glm.inverse(self.camera.m_proj * m_view))
-
     def on_init(self) -> None:
         self.texture = self.app.mesh.texture.textures[self.tex_id]
-        self.program['u_texture_skybox'] = 0
+        self.app.mesh.vao.program.set_default(self.program_name, 'u_texture_skybox', 0)
         self.texture.use(location=0)
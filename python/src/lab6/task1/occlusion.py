@@ -0,0 +1,144 @@
+import numpy as np
+import moderngl as mgl
+from moderngl import Buffer, Framebuffer, Query, VertexArray
+from graphics_engine import IGraphicsEngine
+from culling import SceneCuller
+
+# objects this close to the camera are drawn without a test, their box would be cut by the near plane
+NEAR_MARGIN = 0.5
+# query sets in flight; results are read this many frames after they were issued, when they are ready
+QUERY_LATENCY = 2
+# 12 triangles of a cube from 0 to 1
+CUBE_VERTICES = np.array([
+    corner
+    for face in ((0, 2, 3, 1), (4, 5, 7, 6), (0, 1, 5, 4), (2, 6, 7, 3), (0, 4, 6, 2), (1, 3, 7, 5))
+    for corner in (face[0], face[1], face[2], face[0], face[2], face[3])
+], dtype=int)
+CUBE = np.array([[(i >> 2) & 1, (i >> 1) & 1, i & 1] for i in CUBE_VERTICES], dtype='f4')
+
+
+class OcclusionCuller:
+    # solid models, the farmhouse and the hedges, are drawn first. The bounding boxes of every other visible
+    # object are then drawn against their depth into one samples-passed query per object, without writing
+    # colour or depth, and the objects are drawn under conditional render of their queries: the gpu skips
+    # those with no box sample passed, and the cpu never waits for a result. Results are only read
+    # QUERY_LATENCY frames later, to count the rejected objects.
+    # moderngl can neither read nor conditionally render on any_samples queries, so the queries count samples
+    app: IGraphicsEngine
+    culler: SceneCuller
+    cube: Buffer
+    boxes: Buffer
+    vao: VertexArray
+    # a query per tested object in each set, the sets are used in turn; keyed by the object itself,
+    # which stays alive while it holds a query, so a new object can never inherit another's
+    queries: list[dict[object, Query]]
+    # queries of objects that left the scene, moderngl can't release queries so they are reused
+    free: list[Query]
+    # tested objects of each set, read back when the set comes round again
+    tested: list[list[object]]
+    frame: int
+    enabled: bool
+    # objects tested and rejected in the frame QUERY_LATENCY frames ago
+    tested_count: int
+    rejected_count: int
+
+    def __init__(self, app: IGraphicsEngine, culler: SceneCuller) -> None:
+        self.app = app
+        self.ctx = app.ctx
+        self.culler = culler
+        self.cube = self.ctx.buffer(CUBE)
+        self.boxes = self.ctx.buffer(reserve=6 * 4)
+        self.get_vao()
+        app.mesh.vao.program.reload_callbacks.append(self.on_reload)
+        self.queries = [dict() for _ in range(QUERY_LATENCY)]
+        self.free = []
+        self.tested = [[] for _ in range(QUERY_LATENCY)]
+        self.frame = 0
+        self.enabled = True
+        self.tested_count = 0
+        self.rejected_count = 0
+
+    def get_vao(self) -> None:
+        program = self.app.mesh.vao.program.programs['occlusion']
+        self.vao = self.ctx.vertex_array(program, [(self.cube, '3f', 'in_position'),
+                                                  (self.boxes, '3f 3f/i', 'in_min', 'in_max')])
+
+    def on_reload(self, program_names: set[str]) -> None:
+        if 'occlusion' in program_names:
+            self.vao.release()
+            self.get_vao()
+
+    def toggle(self) -> bool:
+        self.enabled = not self.enabled
+        self.tested = [[] for _ in range(QUERY_LATENCY)]
+        self.tested_count = 0
+        self.rejected_count = 0
+        return self.enabled
+
+    def read_results(self, index: int) -> None:
+        queries = self.queries[index]
+        self.tested_count = len(self.tested[index])
+        self.rejected_count = sum(queries[obj].samples == 0 for obj in self.tested[index])
+        self.tested[index] = []
+
+    def get_boxes(self, obj, instances: np.ndarray, offsets: dict[object, int]) -> np.ndarray:
+        items = offsets[obj] + instances
+        return np.hstack([self.culler.bvh.mins[items], self.culler.bvh.maxs[items]]).astype('f4')
+
+    def render(self, target: Framebuffer, visible: list[tuple[object, np.ndarray]], draw) -> None:
+        # draws the visible (object, instances) with draw(obj, instances), skipping what the occluders hide
+        if not self.enabled:
+            for obj, instances in visible:
+                draw(obj, instances)
+            return
+        index = self.frame % QUERY_LATENCY
+        self.frame += 1
+        self.read_results(index)
+        occluders = [entry for entry in visible if entry[0].solid]
+        for obj, instances in occluders:
+            draw(obj, instances)
+
+        offsets = dict(zip(self.culler.objects, self.culler.offsets))
+        # queries of objects that left the scene, after their results were read
+        queries = self.queries[index]
+        for obj in [obj for obj in queries if obj not in offsets]:
+            self.free.append(queries.pop(obj))
+        eye = np.array(self.app.camera.position, dtype='f4')
+        tested, untested = [], []
+        for obj, instances in visible:
+            if obj.solid:
+                continue
+            boxes = self.get_boxes(obj, instances, offsets)
+            near = np.all((boxes[:, :3] - NEAR_MARGIN <= eye) & (eye <= boxes[:, 3:] + NEAR_MARGIN), axis=1)
+            (untested if near.any() else tested).append((obj, instances, boxes))
+
+        # boxes only test depth, the conditional draws come after all of them
+        target.color_mask = (False, False, False, False)
+        target.depth_mask = False
+        # masks are applied when the framebuffer is bound
+        target.use()
+        self.ctx.disable(mgl.CULL_FACE)
+        for obj, instances, boxes in tested:
+            query = queries.get(obj)
+            if query is None:
+                query = queries[obj] = self.free.pop() if self.free else self.ctx.query(samples=True)
+            self.boxes.orphan(boxes.nbytes)
+            self.boxes.write(boxes)
+            with query:
+                self.app.stats.draw(self.vao, len(boxes))
+            self.tested[index].append(obj)
+        self.ctx.enable(mgl.CULL_FACE)
+        target.color_mask = (True, True, True, True)
+        target.depth_mask = True
+        target.use()
+
+        for obj, instances, _ in tested:
+            with queries[obj].crender:
+                draw(obj, instances)
+        for obj, instances, _ in untested:
+            draw(obj, instances)
+
+    def destroy(self) -> None:
+        self.vao.release()
+        self.cube.release()
+        self.boxes.release()
@@ -0,0 +1,102 @@
+import time
+import numpy as np
+import pygame as pg
+import moderngl as mgl
+from typing import Optional
+from moderngl import Buffer, Program, VertexArray
+from graphics_engine import IGraphicsEngine
+from profiler import Profiler
+
+FONT_SIZE = 16
+MARGIN = 8
+PADDING = 6
+# the text texture is redrawn at most this often, the numbers are averages over the history anyway
+REFRESH_INTERVAL = 0.25
+
+
+class Overlay:
+    # per-pass profiler numbers drawn as a textured quad in the top left corner
+    app: IGraphicsEngine
+    profiler: Profiler
+    program: Program
+    font: pg.font.Font
+    texture: Optional[mgl.Texture]
+    vbo: Buffer
+    vao: VertexArray
+    visible: bool
+    last_refresh: float
+
+    def __init__(self, app: IGraphicsEngine, profiler: Profiler) -> None:
+        self.app = app
+        self.ctx = app.ctx
+        self.profiler = profiler
+        app.mesh.vao.program.set_default('overlay', 'u_texture_0', 0)
+        pg.font.init()
+        self.font = pg.font.SysFont('monospace', FONT_SIZE)
+        self.texture = None
+        # 4 vertices of uv, position
+        self.vbo = self.ctx.buffer(reserve=4 * 4 * 4)
+        self.get_vao()
+        app.mesh.vao.program.reload_callbacks.append(self.on_reload)
+        self.visible = True
+        self.last_refresh = 0.0
+
+    def get_vao(self) -> None:
+        self.program = self.app.mesh.vao.program.programs['overlay']
+        self.vao = self.ctx.vertex_array(self.program, [(self.vbo, '2f 2f', 'in_texcoord_0', 'in_position')])
+        self.vao.mode = mgl.TRIANGLE_STRIP
+
+    def on_reload(self, program_names: set[str]) -> None:
+        if 'overlay' in program_names:
+            self.vao.release()
+            self.get_vao()
+
+    def toggle(self) -> None:
+        self.visible = not self.visible
+
+    def get_lines(self) -> list[str]:
+        lines = [f'{"pass":<8}{"cpu ms":>8}{"gpu ms":>8}{"prims":>10}{"draws":>7}']
+        for name, average in self.profiler.averages().items():
+            lines.append(f'{name:<8}{average["cpu_ms"]:>8.2f}{average["gpu_ms"]:>8.2f}'
+                         f'{average["primitives"]:>10.0f}{average["draw_calls"]:>7.0f}')
+        return lines
+
+    def refresh(self) -> None:
+        lines = [self.font.render(line, True, (255, 255, 255)) for line in self.get_lines()]
+        line_height = self.font.get_linesize()
+        size = (max(line.get_width() for line in lines) + 2 * PADDING, line_height * len(lines) + 2 * PADDING)
+        surface = pg.Surface(size, pg.SRCALPHA)
+        surface.fill((0, 0, 0, 160))
+        for i, line in enumerate(lines):
+            surface.blit(line, (PADDING, PADDING + i * line_height))
+
+        if self.texture is None or self.texture.size != size:
+            if self.texture is not None:
+                self.texture.release()
+            self.texture = self.ctx.texture(size, 4)
+        self.texture.write(pg.image.tostring(surface, 'RGBA', True))
+
+        # pixel rect to ndc, anchored to the top left corner
+        width, height = self.app.WIN_SIZE
+        x0, y1 = -1 + 2 * MARGIN / width, 1 - 2 * MARGIN / height
+        x1, y0 = x0 + 2 * size[0] / width, y1 - 2 * size[1] / height
+        self.vbo.write(np.array([0, 0, x0, y0, 1, 0, x1, y0, 0, 1, x0, y1, 1, 1, x1, y1], dtype='f4'))
+
+    def render(self) -> None:
+        if not self.visible:
+            return
+        if time.perf_counter() - self.last_refresh > REFRESH_INTERVAL:
+            self.last_refresh = time.perf_counter()
+            self.refresh()
+        self.ctx.disable(mgl.DEPTH_TEST | mgl.CULL_FACE)
+        self.ctx.enable(mgl.BLEND)
+        self.app.stats.bind_texture(self.texture, 0)
+        self.app.stats.draw(self.vao)
+        self.ctx.disable(mgl.BLEND)
+        self.ctx.enable(mgl.DEPTH_TEST | mgl.CULL_FACE)
+
+    def destroy(self) -> None:
+        if self.texture is not None:
+            self.texture.release()
+        self.vao.release()
+        self.vbo.release()
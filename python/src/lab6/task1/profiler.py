@@ -0,0 +1,117 @@
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+from moderngl import Context, Query
+from render_stats import RenderStats
+
+HISTORY = 120
+# query results are read this many frames later so reading them does not stall on the gpu
+LATENCY = 3
+
+
+class PassSample:
+    frame: int
+    # cpu timestamps in seconds since the profiler was created
+    start: float
+    cpu_time: float
+    gpu_time: float
+    primitives: int
+    draw_calls: int
+
+    def __init__(self, frame: int, start: float, cpu_time: float, draw_calls: int) -> None:
+        self.frame = frame
+        self.start = start
+        self.cpu_time = cpu_time
+        self.gpu_time = 0.0
+        self.primitives = 0
+        self.draw_calls = draw_calls
+
+
+class Profiler:
+    ctx: Context
+    stats: RenderStats
+    frame: int
+    start_time: float
+    # per pass: LATENCY queries used round robin, with the sample each one is measuring
+    queries: dict[str, list[Query]]
+    pending: dict[str, list[PassSample | None]]
+    history_size: int
+    history: dict[str, deque[PassSample]]
+
+    def __init__(self, ctx: Context, stats: RenderStats, history: int = HISTORY) -> None:
+        self.ctx = ctx
+        self.stats = stats
+        self.frame = 0
+        self.start_time = time.perf_counter()
+        self.queries = dict()
+        self.pending = dict()
+        self.history_size = history
+        self.history = dict()
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        if name not in self.queries:
+            self.queries[name] = [self.ctx.query(time=True, primitives=True) for _ in range(LATENCY)]
+            self.pending[name] = [None] * LATENCY
+            self.history[name] = deque(maxlen=self.history_size)
+        slot = self.frame % LATENCY
+        query = self.queries[name][slot]
+        self.resolve(name, slot)
+
+        draw_calls = self.stats.draw_calls
+        start = time.perf_counter()
+        with query:
+            yield
+        end = time.perf_counter()
+        self.pending[name][slot] = PassSample(self.frame, start - self.start_time, end - start,
+                                              self.stats.draw_calls - draw_calls)
+
+    def resolve(self, name: str, slot: int) -> None:
+        # the query is about to be reused, so the frame it measured has finished on the gpu by now
+        sample = self.pending[name][slot]
+        if sample is None:
+            return
+        query = self.queries[name][slot]
+        sample.gpu_time = query.elapsed / 1e9
+        sample.primitives = query.primitives
+        self.history[name].append(sample)
+        self.pending[name][slot] = None
+
+    def end_frame(self) -> None:
+        self.frame += 1
+
+    def averages(self) -> dict[str, dict[str, float]]:
+        result = dict()
+        for name, samples in self.history.items():
+            count = max(1, len(samples))
+            result[name] = {
+                'cpu_ms': sum(sample.cpu_time for sample in samples) / count * 1000,
+                'gpu_ms': sum(sample.gpu_time for sample in samples) / count * 1000,
+                'primitives': sum(sample.primitives for sample in samples) / count,
+                'draw_calls': sum(sample.draw_calls for sample in samples) / count,
+            }
+        return result
+
+    def get_trace_events(self) -> list[dict]:
+        # cpu passes on thread 0, gpu passes on thread 1; gpu spans start with their cpu span,
+        # timer queries only measure durations
+        events = [
+            {'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': 'SceneRenderer'}},
+            {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': 0, 'args': {'name': 'cpu'}},
+            {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': 1, 'args': {'name': 'gpu'}},
+        ]
+        for name, samples in self.history.items():
+            for sample in samples:
+                args = {'frame': sample.frame, 'draw_calls': sample.draw_calls, 'primitives': sample.primitives}
+                for tid, duration in ((0, sample.cpu_time), (1, sample.gpu_time)):
+                    events.append({'name': name, 'cat': 'render', 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+                                   'ts': sample.start * 1e6, 'dur': duration * 1e6, 'args': args})
+        return events
+
+    def dump_trace(self, path: str) -> None:
+        # open in chrome://tracing or ui.perfetto.dev
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': self.get_trace_events(), 'displayTimeUnit': 'ms'}, file)
@@ -0,0 +1,52 @@
+import numpy as np
+from pyglm.glm import vec3
+from culling import SceneCuller
+
+# program, vao, texture; the depth that follows only orders draws within a state group
+SortKey = tuple[int, int, int, float]
+
+
+def count_state_changes(keys: list[SortKey]) -> int:
+    # a texture of 0 means the pass samples no texture, which needs no bind
+    changes = 0
+    previous = (None, None, 0)
+    for key in keys:
+        changes += (key[0] != previous[0]) + (key[1] != previous[1]) + (key[2] not in (0, previous[2]))
+        previous = key[:3]
+    return changes
+
+
+class RenderQueue:
+    # draw order for one pass: grouped by program, vao and texture, then front to back
+    culler: SceneCuller
+    shadow: bool
+    # state changes the last sorted pass would have needed in scene order, and needs now
+    unsorted_changes: int
+    sorted_changes: int
+
+    def __init__(self, culler: SceneCuller, shadow: bool = False) -> None:
+        self.culler = culler
+        self.shadow = shadow
+        self.unsorted_changes = 0
+        self.sorted_changes = 0
+
+    def get_key(self, obj, depth: float) -> SortKey:
+        if self.shadow:
+            return obj.shadow_program.glo, obj.shadow_vao.glo, 0, depth
+        texture = obj.texture.glo if hasattr(obj, 'texture') else 0
+        return obj.program.glo, obj.vao.glo, texture, depth
+
+    def sort(self, visible: list[tuple[object, np.ndarray, np.ndarray]], eye: vec3) -> list[tuple[object, np.ndarray]]:
+        bvh = self.culler.bvh
+        eye = np.array(eye, dtype='f4')
+        entries = []
+        for obj, instances, items in visible:
+            centers = (bvh.mins[items] + bvh.maxs[items]) * 0.5
+            depths = np.einsum('ij,ij->i', centers - eye, centers - eye)
+            # instances are drawn in buffer order, so the nearest go first there too
+            order = np.argsort(depths, kind='stable')
+            entries.append((self.get_key(obj, float(depths[order[0]])), obj, instances[order]))
+        self.unsorted_changes = count_state_changes([entry[0] for entry in entries])
+        entries.sort(key=lambda entry: entry[0])
+        self.sorted_changes = count_state_changes([entry[0] for entry in entries])
+        return [(obj, instances) for _, obj, instances in entries]
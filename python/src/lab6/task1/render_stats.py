@@ -0,0 +1,50 @@
+from typing import Optional
+from moderngl import Texture, TextureCube, VertexArray, Framebuffer
+
+
+class RenderStats:
+    # per-frame counters; draws and binds go through here so they can be counted,
+    # and textures already bound to a unit this frame are not bound again
+    draw_calls: int
+    triangles: int
+    state_changes: int
+    program: Optional[int]
+    vao: Optional[int]
+    framebuffer: Optional[int]
+    textures: dict[int, int]
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.draw_calls = 0
+        self.triangles = 0
+        self.state_changes = 0
+        self.program = None
+        self.vao = None
+        self.framebuffer = None
+        self.textures = dict()
+
+    def use_framebuffer(self, framebuffer: Framebuffer) -> None:
+        if self.framebuffer != framebuffer.glo:
+            self.framebuffer = framebuffer.glo
+            self.state_changes += 1
+        framebuffer.use()
+
+    def bind_texture(self, texture: Texture | TextureCube, location: int) -> None:
+        if self.textures.get(location) == texture.glo:
+            return
+        self.textures[location] = texture.glo
+        self.state_changes += 1
+        texture.use(location=location)
+
+    def draw(self, vao: VertexArray, instances: int = -1) -> None:
+        if self.program != vao.program.glo:
+            self.program = vao.program.glo
+            self.state_changes += 1
+        if self.vao != vao.glo:
+            self.vao = vao.glo
+            self.state_changes += 1
+        self.draw_calls += 1
+        self.triangles += vao.vertices // 3 * max(instances, 1)
+        vao.render(instances=instances)
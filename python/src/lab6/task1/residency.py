@@ -0,0 +1,153 @@
+from collections import OrderedDict
+from typing import Any, Callable
+from asset_loader import AssetLoader
+
+GPU_MEMORY_BUDGET = 512 * 1024 * 1024
+
+
+class ResidentAsset:
+    name: str
+    decode: tuple[Callable, tuple]
+    upload: Callable[[Any], tuple[Any, int]]
+    release: Callable[[Any], None]
+    placeholder: Any
+    asset: Any
+    size: int
+    refs: int
+    pending: bool
+    last_used: int
+
+    def __init__(self, name: str, decode: tuple[Callable, tuple], upload: Callable[[Any], tuple[Any, int]],
+                 release: Callable[[Any], None], placeholder: Any) -> None:
+        self.name = name
+        self.decode = decode
+        self.upload = upload
+        self.release = release
+        self.placeholder = placeholder
+        self.asset = None
+        self.size = 0
+        self.refs = 0
+        self.pending = False
+        self.last_used = -1
+
+
+class ResidencyManager:
+    # assets are decoded on the loader workers when first used, uploaded in poll()
+    # and evicted least recently used first once resident_bytes exceeds the budget
+    loader: AssetLoader
+    budget: int
+    assets: dict[str, ResidentAsset]
+    # resident assets, least recently used first
+    lru: OrderedDict[str, ResidentAsset]
+    frame: int
+    # bumped whenever an asset is uploaded or evicted
+    version: int
+    resident_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, loader: AssetLoader, budget: int = GPU_MEMORY_BUDGET) -> None:
+        self.loader = loader
+        self.budget = budget
+        self.assets = dict()
+        self.lru = OrderedDict()
+        self.frame = 0
+        self.version = 0
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def register(self, name: str, decode: tuple[Callable, tuple], upload: Callable[[Any], tuple[Any, int]],
+                 release: Callable[[Any], None], placeholder: Any) -> None:
+        # upload receives the unpacked decode result and returns the asset with its size in bytes
+        self.assets[name] = ResidentAsset(name, decode, upload, release, placeholder)
+
+    def acquire(self, name: str) -> None:
+        entry = self.assets[name]
+        entry.refs += 1
+        self.request(entry)
+
+    def release(self, name: str) -> None:
+        entry = self.assets[name]
+        entry.refs = max(0, entry.refs - 1)
+
+    def request(self, entry: ResidentAsset) -> None:
+        if entry.asset is None and not entry.pending:
+            entry.pending = True
+            self.loader.submit(entry.name, entry.decode[0], *entry.decode[1])
+
+    def get(self, name: str) -> Any:
+        entry = self.assets[name]
+        entry.last_used = self.frame
+        if entry.asset is not None:
+            self.hits += 1
+            self.lru.move_to_end(name)
+            return entry.asset
+        self.misses += 1
+        self.request(entry)
+        return entry.placeholder
+
+    def upload(self, entry: ResidentAsset) -> None:
+        entry.pending = False
+        entry.asset, entry.size = self.loader.upload(entry.name, entry.upload)
+        self.resident_bytes += entry.size
+        self.lru[entry.name] = entry
+        self.version += 1
+
+    def evict(self, entry: ResidentAsset) -> None:
+        entry.release(entry.asset)
+        entry.asset = None
+        self.resident_bytes -= entry.size
+        entry.size = 0
+        del self.lru[entry.name]
+        self.evictions += 1
+        self.version += 1
+
+    def poll(self) -> None:
+        # once per frame, on the context thread
+        for entry in self.assets.values():
+            if entry.pending and self.loader.ready(entry.name):
+                self.upload(entry)
+        self.trim()
+        self.frame += 1
+
+    def trim(self) -> None:
+        # unreferenced assets go first, assets used this frame are never evicted
+        for referenced in (False, True):
+            for entry in list(self.lru.values()):
+                if self.resident_bytes <= self.budget:
+                    return
+                if (entry.refs > 0) == referenced and entry.last_used < self.frame:
+                    self.evict(entry)
+
+    def flush(self) -> None:
+        # blocks until every requested asset is resident
+        for entry in self.assets.values():
+            if entry.pending:
+                self.upload(entry)
+        self.trim()
+
+    @property
+    def pending_count(self) -> int:
+        return sum(entry.pending for entry in self.assets.values())
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'resident_bytes': self.resident_bytes,
+            'budget': self.budget,
+            'resident': len(self.lru),
+            'pending': self.pending_count,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def destroy(self) -> None:
+        self.loader.finish()
+        for entry in list(self.lru.values()):
+            entry.release(entry.asset)
+            entry.asset = None
+        self.lru.clear()
+        self.resident_bytes = 0
@@ -1,14 +1,37 @@
 from model import *
+from animation import Animation
+from bake import bake_voxels
+from entity_store import Entity, EntityStore
+from spatial_index import SceneIndex
+from vbo import BakedVBO
+
+# floor chunk side in cubes, each chunk is culled separately
+FLOOR_CHUNK_SIZE = 20
+# area a crowd is spread over, x and z ranges
+CROWD_AREA = ((0, 40), (-40, 40))
 
 
 class Scene:
     app: IGraphicsEngine
     objects: list[ExtendedBaseModel] = []
+    dynamic_objects: list[ExtendedBaseModel]
+    # objects following motion curves, with their rows in the animation
+    animated_objects: list[tuple[ExtendedBaseModel, slice]]
+    animation: Animation
+    # static props by mesh, drawn instanced from one store each
+    entity_models: dict[str, EntityModel]
+    # bounds of every object instance, for culling, picking and collision
+    index: SceneIndex
     skybox: AdvancedSkyBox
     moving_cat: Cat
 
     def __init__(self, app: IGraphicsEngine) -> None:
         self.app = app
+        self.dynamic_objects = []
+        self.animated_objects = []
+        self.animation = Animation()
+        self.entity_models = dict()
+        self.index = SceneIndex(self.objects)
         self.load()
         self.skybox = AdvancedSkyBox(app)
 
@@ -18,15 +41,10 @@ class Scene:
         self.__load_cactus()
         self.__load_hedge()
 
-        self.add_object(
-            Ferret(self.app, pos=(10, -1, -25), rot=(-90, 90, 0), scale=(0.025, 0.025, 0.025)),
-        )
-        self.add_object(
-            Hawk(self.app, pos=(15.5, 9.6, -30.3), rot=(-90, -90, 0), scale=(0.05, 0.05, 0.05)),
-        )
-        self.add_object(
-            Farmhouse(self.app, pos=(20, -1, -30), rot=(0, 90, 0), scale=(0.5, 0.5, 0.5)),
-        )
+        self.add_entity('ferret', 'ferret', pos=(10, -1, -25), rot=(-90, 90, 0), scale=(0.025, 0.025, 0.025))
+        self.add_entity('hawk', 'hawk', pos=(15.5, 9.6, -30.3), rot=(-90, -90, 0), scale=(0.05, 0.05, 0.05))
+        self.add_entity('farmhouse', 'farmhouse', pos=(20, -1, -30), rot=(0, 90, 0), scale=(0.5, 0.5, 0.5),
+                        solid=True)
 
         self.moving_cat = Cat(self.app, pos=(10, -1, -15), rot=(-90, 90, 0), scale=(0.03, 0.03, 0.03))
         self.add_object(
@@ -39,69 +57,89 @@ class Scene:
 
     def add_object(self, obj: ExtendedBaseModel) -> None:
         self.objects.append(obj)
+        if obj.motion is not None:
+            self.animated_objects.append((obj, self.animation.add(obj.motion, obj.motion_count)))
+        elif obj.dynamic:
+            self.dynamic_objects.append(obj)
+
+    def add_entity(self, vao_name: str, tex_id: str, pos=(0, 0, 0), rot=(0, 0, 0), scale=(1, 1, 1),
+                   solid: bool = False) -> Entity:
+        # a static prop, rotation in degrees as for the models; props of one mesh share an EntityModel,
+        # their textures must share its texture array. The first prop of a mesh decides if they are solid
+        model = self.entity_models.get(vao_name)
+        if model is None:
+            store = EntityStore()
+            entity = store.add(pos, np.radians(rot), scale, self.app.mesh.texture.get_layer(tex_id))
+            self.entity_models[vao_name] = model = EntityModel(self.app, vao_name, tex_id, store)
+            model.solid = solid
+            self.add_object(model)
+            return entity
+        return model.store.add(pos, np.radians(rot), scale, model.get_instance_layer(self.app, model.tex_id, tex_id))
 
-    def update(self) -> None:
-        ...
+    def add_crowd(self, count: int, seed: int = 0) -> AnimatedModel:
+        # count cats wandering over the floor, each on its own curves
+        rng = np.random.default_rng(seed)
+        (x_min, x_max), (z_min, z_max) = CROWD_AREA
+        centers = np.stack([rng.uniform(x_min, x_max, count), np.full(count, -1.0),
+                            rng.uniform(z_min, z_max, count)], axis=1)
+        crowd = AnimatedModel(self.app, vao_name='cat', tex_id='cat', count=count, motion={
+            'center': centers,
+            'orbit_radius': rng.uniform(0.5, 3, count),
+            'orbit_speed': rng.uniform(-1, 1, count),
+            'orbit_phase': rng.uniform(0, 2 * np.pi, count),
+            'base_rot': (-np.pi / 2, 0, 0),
+            'spin': np.stack([np.zeros(count), rng.uniform(-1, 1, count), np.zeros(count)], axis=1),
+            'base_scale': (0.01, 0.01, 0.01),
+            'pulse': 0.2,
+            'pulse_speed': rng.uniform(1, 3, count),
+            'pulse_phase': rng.uniform(0, 2 * np.pi, count),
+        })
+        self.add_object(crowd)
+        return crowd
+
+    def update(self, steps: int) -> None:
+        # runs the fixed simulation steps the clock owes
+        for _ in range(steps):
+            self.app.clock.advance_step()
+            self.animation.step(self.app.clock.time)
+            for obj in self.dynamic_objects:
+                obj.step()
+
+    def interpolate(self, alpha: float) -> None:
+        for model in self.entity_models.values():
+            model.sync()
+        if self.animated_objects:
+            transforms = self.animation.get_transforms(alpha)
+            for obj, rows in self.animated_objects:
+                obj.animate(transforms[rows])
+        for obj in self.dynamic_objects:
+            obj.interpolate(alpha)
 
     def __load_hedge(self) -> None:
+        placements = []
         for x in range(6, 40, 2):
-            self.add_object(
-                Hedge(self.app, pos=(x, -1, -5), rot=(-90, 0, 0), scale=(0.01, 0.01, 0.01)),
-            )
-            self.add_object(
-                Hedge(self.app, pos=(x, -1, -41), rot=(-90, 0, 0), scale=(0.01, 0.01, 0.01)),
-            )
+            placements += [((x, -1, -5), (-90, 0, 0)), ((x, -1, -41), (-90, 0, 0))]
         for z in range(6, 42, 2):
             if z not in (28, 30, 32):
-                self.add_object(
-                    Hedge(self.app, pos=(5, -1, -z), rot=(-90, 90, 0), scale=(0.01, 0.01, 0.01)),
-                )
-            self.add_object(
-                Hedge(self.app, pos=(39, -1, -z), rot=(-90, 90, 0), scale=(0.01, 0.01, 0.01)),
-            )
+                placements.append(((5, -1, -z), (-90, 90, 0)))
+            placements.append(((39, -1, -z), (-90, 90, 0)))
+        for pos, rot in placements:
+            self.add_entity('hedge', 'hedge', pos=pos, rot=rot, scale=(0.01, 0.01, 0.01), solid=True)
 
     def __load_cactus(self) -> None:
-        self.add_object(
-            Cactus(self.app, pos=(20, -1, 15), rot=(-90, 90, 0), scale=(0.03, 0.03, 0.03)),
-        )
-        self.add_object(
-            Cactus(self.app, pos=(13, -1, 19), rot=(-90, 90, 0), scale=(0.03, 0.03, 0.03)),
-        )
-        self.add_object(
-            Cactus(self.app, pos=(28, -1, 24), rot=(-90, 90, 0), scale=(0.03, 0.03, 0.03)),
-        )
-        self.add_object(
-            Cactus(self.app, pos=(22, -1, 27), rot=(-90, 90, 0), scale=(0.03, 0.03, 0.03)),
-        )
+        for pos in ((20, -1, 15), (13, -1, 19), (28, -1, 24), (22, -1, 27)):
+            self.add_entity('cactus', 'cactus', pos=pos, rot=(-90, 90, 0), scale=(0.03, 0.03, 0.03))
 
     def __load_palms(self) -> None:
-        self.add_object(
-            Plant(self.app, pos=(28, -1, -8), rot=(-90, 90, 0), scale=(0.01, 0.01, 0.01)),
-        )
-        self.add_object(
-            Plant(self.app, pos=(25, -1, -8), rot=(-90, 90, 0), scale=(0.01, 0.01, 0.01)),
-        )
-        self.add_object(
-            Plant(self.app, pos=(22, -1, -8), rot=(-90, 90, 0), scale=(0.01, 0.01, 0.01)),
-        )
-        self.add_object(
-            Plant(self.app, pos=(19, -1, -8), rot=(-90, 90, 0), scale=(0.01, 0.01, 0.01)),
-        )
-        self.add_object(
-            Plant(self.app, pos=(16, -1, -8), rot=(-90, 90, 0), scale=(0.01, 0.01, 0.01)),
-        )
-        self.add_object(
-            Plant(self.app, pos=(13, -1, -8), rot=(-90, 90, 0), scale=(0.01, 0.01, 0.01)),
-        )
-        self.add_object(
-            Plant(self.app, pos=(10, -1, -8), rot=(-90, 90, 0), scale=(0.01, 0.01, 0.01)),
-        )
+        for x in range(28, 9, -3):
+            self.add_entity('plant', 'plant', pos=(x, -1, -8), rot=(-90, 90, 0), scale=(0.01, 0.01, 0.01))
 
     def __load_floor(self) -> None:
         n = 20
         thickness = 1
         road_width = 6
         cube_size = 2
+        cells: dict[tuple[int, int, int], str] = dict()
         for y in range(-thickness, 0):
             for x in range(0, n):
                 for z in range(-n, n):
@@ -109,7 +147,15 @@ class Scene:
                         tex = 'stone'
                     else:
                         tex = 'dirt'
-                    world_x = x * cube_size
-                    world_y = y * cube_size
-                    world_z = z * cube_size
-                    self.add_object(Cube(self.app, tex_id=tex, pos=(world_x, world_y, world_z)))
+                    cells[x, y, z] = tex
+        # the floor never moves, bake it into a few meshes without the faces hidden between cubes;
+        # the textures share a texture array, so each chunk is one mesh with the layer in its vertices
+        chunks: dict[tuple[int, int], list[np.ndarray]] = dict()
+        for (tex, chunk), vertex_data in bake_voxels(cells, cube_size, FLOOR_CHUNK_SIZE).items():
+            vertex_data = vertex_data.reshape(-1, 8)
+            layers = np.full((len(vertex_data), 1), self.app.mesh.texture.get_layer(tex), dtype='f4')
+            chunks.setdefault(chunk, []).append(np.hstack([vertex_data, layers]))
+        for chunk, parts in chunks.items():
+            vao_name = f'floor/{chunk[0]}_{chunk[1]}'
+            self.app.mesh.vao.vbo.add(vao_name, BakedVBO(self.app.ctx, np.concatenate(parts).ravel()))
+            self.add_object(BakedMesh(self.app, vao_name=vao_name, tex_id='stone'))
@@ -1,7 +1,18 @@
+import numpy as np
+from typing import Optional
 from moderngl import Texture, TextureCube, Framebuffer
 from graphics_engine import IGraphicsEngine
 from mesh import Mesh
 from scene import Scene
+from model import InstancedModel
+from culling import SceneCuller
+from occlusion import OcclusionCuller
+from profiler import Profiler
+from frame_uniforms import FrameUniforms
+from render_queue import RenderQueue
+from lod import LodSelector
+from shadow_cache import ShadowCache
+from shadow_cascades import ShadowCascades
 
 
 class SceneRenderer:
@@ -10,32 +21,120 @@ class SceneRenderer:
     scene: Scene
     depth_texture: Texture | TextureCube
     depth_fbo: Framebuffer
+    cascades: ShadowCascades
+    shadow_cache: ShadowCache
+    # the window by default, an offscreen framebuffer when running headless
+    target: Framebuffer
+    culler: SceneCuller
+    occlusion: OcclusionCuller
+    lod_selector: LodSelector
+    queue: RenderQueue
+    shadow_queue: RenderQueue
+    culled_count: int
+    shadow_culled_count: int
+    profiler: Profiler
+    frame_uniforms: FrameUniforms
 
-    def __init__(self, app: IGraphicsEngine):
+    def __init__(self, app: IGraphicsEngine, target: Optional[Framebuffer] = None):
         self.app = app
         self.ctx = app.ctx
+        self.target = target or self.ctx.screen
         self.mesh = app.mesh
         self.scene = app.scene
 
         self.depth_texture = self.mesh.texture.textures['depth_texture']
         self.depth_fbo = self.ctx.framebuffer(depth_attachment=self.depth_texture)
+        self.cascades = ShadowCascades(app.camera, app.light)
+        self.shadow_cache = ShadowCache(app, self.depth_texture.size, self.cascades.count)
+
+        self.culler = SceneCuller(self.scene.index)
+        self.occlusion = OcclusionCuller(app, self.culler)
+        self.lod_selector = LodSelector(self.culler, app.camera, app.WIN_SIZE[1])
+        self.queue = RenderQueue(self.culler)
+        self.shadow_queue = RenderQueue(self.culler, shadow=True)
+        self.culled_count = 0
+        self.shadow_culled_count = 0
+        self.profiler = Profiler(self.ctx, app.stats)
+        self.frame_uniforms = FrameUniforms(app, self.mesh.vao.program.programs, self.cascades)
+        self.mesh.vao.program.reload_callbacks.append(self.on_reload)
+
+    def on_reload(self, program_names: set[str]) -> None:
+        # swapped programs need their uniform blocks bound again
+        programs = self.mesh.vao.program.programs
+        self.frame_uniforms.bind_programs({name: programs[name] for name in program_names})
 
     def render_shadow(self) -> None:
-        self.depth_fbo.clear()
-        self.depth_fbo.use()
-        for obj in self.scene.objects:
-            obj.render_shadow()
+        # every cascade only covers its own light frustum
+        cascades = self.cascades
+        visible = []
+        self.shadow_culled_count = 0
+        for matrix in cascades.matrices:
+            visible.append(self.culler.cull(matrix))
+            self.shadow_culled_count += self.culler.culled_count
+        for i in self.shadow_cache.get_stale(self.scene.objects, cascades.matrices):
+            self.use_cascade(self.shadow_cache.fbo, i)
+            self.shadow_cache.fbo.clear(viewport=cascades.get_viewport(i))
+            # baked once and kept while the camera moves, so at full detail instead of the level picked for it
+            self.render_shadow_casters([entry for entry in visible[i] if not entry[0].dynamic], lod=0)
+        for i in range(cascades.count):
+            dynamic = [entry for entry in visible[i] if entry[0].dynamic]
+            # tiles without moving casters keep what was copied into them last time
+            if not dynamic and not self.shadow_cache.dirty[i]:
+                continue
+            self.shadow_cache.copy_to(self.depth_fbo, cascades.get_viewport(i))
+            self.use_cascade(self.depth_fbo, i)
+            self.render_shadow_casters(dynamic)
+            self.shadow_cache.dirty[i] = bool(dynamic)
+
+    def use_cascade(self, framebuffer: Framebuffer, cascade: int) -> None:
+        framebuffer.viewport = self.cascades.get_viewport(cascade)
+        self.app.stats.use_framebuffer(framebuffer)
+        for name in ('shadow_map', 'shadow_map_instanced'):
+            self.mesh.vao.program.programs[name]['u_cascade'] = cascade
+
+    def render_shadow_casters(self, visible: list[tuple[object, np.ndarray, np.ndarray]],
+                              lod: Optional[int] = None) -> None:
+        for obj, instances in self.shadow_queue.sort(visible, self.app.light.position):
+            if isinstance(obj, InstancedModel):
+                obj.render_shadow(instances, lod)
+            else:
+                obj.render_shadow(lod)
 
     def main_render(self) -> None:
-        self.app.ctx.screen.use()
-        for obj in self.scene.objects:
-            obj.render()
+        self.app.stats.use_framebuffer(self.target)
+        visible = self.culler.cull(self.app.camera.m_proj * self.app.camera.m_view)
+        self.culled_count = self.culler.culled_count
+        visible = self.queue.sort(visible, self.app.camera.position)
+        self.occlusion.render(self.target, visible, self.render_object)
         self.scene.skybox.render()
 
+    @staticmethod
+    def render_object(obj, instances: np.ndarray) -> None:
+        if isinstance(obj, InstancedModel):
+            obj.render(instances)
+        else:
+            obj.render()
+
+    def update(self) -> None:
+        self.mesh.residency.poll()
+        self.mesh.vao.program.poll()
+        self.scene.interpolate(self.app.clock.alpha)
+        self.culler.update(self.mesh.residency.version)
+        self.lod_selector.update()
+        self.cascades.update()
+        self.frame_uniforms.update()
+
     def render(self) -> None:
-        self.scene.update()
-        self.render_shadow()
-        self.main_render()
+        with self.profiler.section('update'):
+            self.update()
+        with self.profiler.section('shadow'):
+            self.render_shadow()
+        with self.profiler.section('main'):
+            self.main_render()
+        self.profiler.end_frame()
 
     def destroy(self) -> None:
         self.depth_fbo.release()
+        self.occlusion.destroy()
+        self.shadow_cache.destroy()
+        self.frame_uniforms.destroy()
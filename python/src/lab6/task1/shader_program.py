@@ -1,24 +1,162 @@
-from moderngl import Context, Program
+import hashlib
+import os
+import sys
+import time
+import moderngl as mgl
+from typing import Any, Callable, Optional
+from moderngl import Context, Program, Uniform
+
+SHADER_DIR = 'shaders'
+# shaders/ is checked for edits at most this often
+RELOAD_INTERVAL = 0.5
+# program name -> vertex shader, fragment shader
+PROGRAMS: dict[str, tuple[str, str]] = {
+    'default': ('default', 'default'),
+    'skybox': ('skybox', 'skybox'),
+    'shadow_map': ('shadow_map', 'shadow_map'),
+    'overlay': ('overlay', 'overlay'),
+    'depth_copy': ('depth_copy', 'depth_copy'),
+    'default_instanced': ('default_instanced', 'default'),
+    'shadow_map_instanced': ('shadow_map_instanced', 'shadow_map'),
+    'occlusion': ('occlusion', 'occlusion'),
+}
+
+
+def get_source_hash(vertex_shader: str, fragment_shader: str) -> str:
+    return hashlib.blake2b(f'{vertex_shader}\0{fragment_shader}'.encode(), digest_size=16).hexdigest()
+
+
+class UniformCache:
+    # last bytes written to each (program, uniform), unchanged values are not uploaded again
+    values: dict[tuple[int, str], bytes]
+    # uniforms are looked up by name once per program, not on every write
+    members: dict[tuple[int, str], Uniform]
+    writes: int
+    skipped: int
+
+    def __init__(self) -> None:
+        self.values = dict()
+        self.members = dict()
+        self.writes = 0
+        self.skipped = 0
+
+    def write(self, program: Program, name: str, value) -> None:
+        data = value.to_bytes()
+        key = (program.glo, name)
+        if self.values.get(key) == data:
+            self.skipped += 1
+            return
+        self.values[key] = data
+        member = self.members.get(key)
+        if member is None:
+            member = self.members[key] = program[name]
+        member.write(data)
+        self.writes += 1
+
+    def forget(self, program: Program) -> None:
+        # a released program's glo may be handed out again
+        for cache in (self.values, self.members):
+            for key in [key for key in cache if key[0] == program.glo]:
+                del cache[key]
 
 
 class ShaderProgram:
+    # programs by name; names built from the same sources share one program. Edited shaders are
+    # compiled again in poll() and swapped in under the same names, a program that fails to compile
+    # keeps the last good one. moderngl cannot create a program from a GL_ARB_get_program_binary binary,
+    # so there is no binary cache here; the driver's own shader cache covers repeated startups
     ctx: Context
     programs: dict[str, Program] = dict()
+    uniforms: UniformCache
+    # source hash -> program, and the source hash of every program name
+    compiled: dict[str, Program]
+    hashes: dict[str, str]
+    # uniform values written again whenever a program is swapped, samplers mostly
+    defaults: dict[str, dict[str, Any]]
+    # called with the names of the swapped programs, before the old programs are released
+    reload_callbacks: list[Callable[[set[str]], None]]
+    mtimes: dict[str, float]
+    last_poll: float
+    reloads: int
 
     def __init__(self, ctx: Context) -> None:
         self.ctx = ctx
-        self.programs['default'] = self.get_program('default')
-        self.programs['skybox'] = self.get_program('skybox')
-        self.programs['shadow_map'] = self.get_program('shadow_map')
+        self.uniforms = UniformCache()
+        self.compiled = dict()
+        self.hashes = dict()
+        self.defaults = dict()
+        self.reload_callbacks = []
+        self.mtimes = self.get_mtimes()
+        self.last_poll = time.perf_counter()
+        self.reloads = 0
+        for name, (vertex_shader_name, fragment_shader_name) in PROGRAMS.items():
+            self.hashes[name], self.programs[name] = self.get_program(vertex_shader_name, fragment_shader_name)
 
-    def get_program(self, shader_program_name: str) -> Program:
-        with open(f'shaders/{shader_program_name}.vert') as file:
+    def read_sources(self, shader_program_name: str, fragment_shader_name: Optional[str] = None) -> tuple[str, str]:
+        with open(f'{SHADER_DIR}/{shader_program_name}.vert') as file:
             vertex_shader = file.read()
 
-        with open(f'shaders/{shader_program_name}.frag') as file:
+        with open(f'{SHADER_DIR}/{fragment_shader_name or shader_program_name}.frag') as file:
             fragment_shader = file.read()
 
-        return self.ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+        return vertex_shader, fragment_shader
+
+    def get_program(self, shader_program_name: str,
+                    fragment_shader_name: Optional[str] = None) -> tuple[str, Program]:
+        # compiles only sources not seen before, returns the source hash with the program
+        vertex_shader, fragment_shader = self.read_sources(shader_program_name, fragment_shader_name)
+        source_hash = get_source_hash(vertex_shader, fragment_shader)
+        if source_hash not in self.compiled:
+            self.compiled[source_hash] = self.ctx.program(vertex_shader=vertex_shader,
+                                                          fragment_shader=fragment_shader)
+        return source_hash, self.compiled[source_hash]
+
+    def set_default(self, name: str, uniform: str, value: Any) -> None:
+        self.defaults.setdefault(name, dict())[uniform] = value
+        self.programs[name][uniform] = value
+
+    def get_mtimes(self) -> dict[str, float]:
+        return {entry.name: entry.stat().st_mtime for entry in os.scandir(SHADER_DIR) if entry.is_file()}
+
+    def poll(self) -> set[str]:
+        # swaps in programs whose shader files changed, returns their names
+        if time.perf_counter() - self.last_poll < RELOAD_INTERVAL:
+            return set()
+        self.last_poll = time.perf_counter()
+        mtimes = self.get_mtimes()
+        if mtimes == self.mtimes:
+            return set()
+        self.mtimes = mtimes
+        return self.reload()
+
+    def reload(self) -> set[str]:
+        names = set()
+        for name, (vertex_shader_name, fragment_shader_name) in PROGRAMS.items():
+            try:
+                source_hash, program = self.get_program(vertex_shader_name, fragment_shader_name)
+            except (OSError, mgl.Error) as error:
+                print(f'shader {name} not reloaded: {error}', file=sys.stderr)
+                continue
+            if source_hash == self.hashes[name]:
+                continue
+            self.hashes[name], self.programs[name] = source_hash, program
+            for uniform, value in self.defaults.get(name, dict()).items():
+                if uniform in program:
+                    program[uniform] = value
+            names.add(name)
+        if names:
+            for callback in self.reload_callbacks:
+                callback(names)
+            self.reloads += 1
+        self.release_unused()
+        return names
+
+    def release_unused(self) -> None:
+        used = set(self.hashes.values())
+        for source_hash in [source_hash for source_hash in self.compiled if source_hash not in used]:
+            program = self.compiled.pop(source_hash)
+            self.uniforms.forget(program)
+            program.release()
 
     def destroy(self) -> None:
-        [program.release() for program in self.programs.values()]
+        [program.release() for program in self.compiled.values()]
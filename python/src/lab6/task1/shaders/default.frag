@@ -3,40 +3,105 @@
 layout (location = 0) out vec4 fragColor;
 
 in vec2 uv_0;
+flat in float layer;
 in vec3 normal;
 in vec3 fragPos;
-in vec4 shadowCoord;
 
-struct Light {
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    mat4 m_invProjView;
+    vec3 camPos;
+};
+
+layout (std140) uniform Light {
+    mat4 m_view_light;
     vec3 position;
     vec3 Ia;
     vec3 Id;
     vec3 Is;
+} light;
+
+layout (std140) uniform Shadow {
+    mat4 m_shadow[4];
+    vec4 cascadeSplits;
+    vec4 texelSizes;
+    int cascadeCount;
+    int pcfMode;
 };
 
-uniform Light light;
-uniform sampler2D u_texture_0;
-uniform vec3 camPos;
+uniform sampler2DArray u_texture_0;
 uniform sampler2DShadow shadowMap;
-uniform vec2 u_resolution;
-
 
-float lookup(float ox, float oy) {
-    vec2 pixelOffset = 1 / u_resolution;
-    return textureProj(shadowMap, shadowCoord + vec4(ox * pixelOffset.x * shadowCoord.w,
-    oy * pixelOffset.y * shadowCoord.w, 0.0, 0.0));
+// pcfMode values, see PCF_MODES in shadow_cascades.py
+const int PCF_HARDWARE = 0;
+const int PCF_3X3 = 1;
+const int PCF_5X5 = 2;
+const int PCF_POISSON = 3;
+
+// receivers are pushed this many texels along the normal, against shadow acne
+const float NORMAL_OFFSET = 1.5;
+const float DEPTH_BIAS = 0.0005;
+const float POISSON_RADIUS = 2.0;
+
+const vec2 poissonDisk[16] = vec2[](
+    vec2(-0.94201624, -0.39906216), vec2(0.94558609, -0.76890725),
+    vec2(-0.09418410, -0.92938870), vec2(0.34495938, 0.29387760),
+    vec2(-0.91588581, 0.45771432), vec2(-0.81544232, -0.87912464),
+    vec2(-0.38277543, 0.27676845), vec2(0.97484398, 0.75648379),
+    vec2(0.44323325, -0.97511554), vec2(0.53742981, -0.47373420),
+    vec2(-0.26496911, -0.41893023), vec2(0.79197514, 0.19090188),
+    vec2(-0.24188840, 0.99706507), vec2(-0.81409955, 0.91437590),
+    vec2(0.19984126, 0.78641367), vec2(0.14383161, -0.14100790)
+);
+
+
+float lookup(vec2 uv, float depth, vec4 tile) {
+    // clamped so wide kernels don't read the neighbouring cascade's tile
+    return texture(shadowMap, vec3(clamp(uv, tile.xy, tile.zw), depth));
 }
 
-float getSoftShadowX64() {
-    float shadow;
-    float swidth = 0.6;
-    float endp = swidth * 3.0 + swidth / 2.0;
-    for (float y = -endp; y <= endp; y += swidth) {
-        for (float x = -endp; x <= endp; x += swidth) {
-            shadow += lookup(x, y);
+float getShadow(vec3 Normal) {
+    float viewDepth = -(m_view * vec4(fragPos, 1.0)).z;
+    int cascade = 0;
+    while (cascade < cascadeCount && viewDepth > cascadeSplits[cascade]) {
+        cascade++;
+    }
+    if (cascade == cascadeCount) {
+        return 1.0;
+    }
+
+    vec3 offsetPos = fragPos + Normal * texelSizes[cascade] * NORMAL_OFFSET;
+    vec3 coord = (m_shadow[cascade] * vec4(offsetPos, 1.0)).xyz * 0.5 + 0.5;
+    if (coord.z > 1.0) {
+        return 1.0;
+    }
+    float depth = coord.z - DEPTH_BIAS;
+
+    // the cascades sit side by side in the atlas
+    vec2 texel = 1.0 / vec2(textureSize(shadowMap, 0));
+    float tileWidth = 1.0 / float(cascadeCount);
+    vec2 uv = vec2((float(cascade) + coord.x) * tileWidth, coord.y);
+    vec4 tile = vec4(float(cascade) * tileWidth + texel.x, texel.y, float(cascade + 1) * tileWidth - texel.x, 1.0 - texel.y);
+
+    if (pcfMode == PCF_HARDWARE) {
+        // a single linear filtered lookup compares the 2x2 nearest texels
+        return lookup(uv, depth, tile);
+    }
+    float shadow = 0.0;
+    if (pcfMode == PCF_POISSON) {
+        for (int i = 0; i < 16; i++) {
+            shadow += lookup(uv + poissonDisk[i] * texel * POISSON_RADIUS, depth, tile);
+        }
+        return shadow / 16.0;
+    }
+    int radius = pcfMode == PCF_3X3 ? 1 : 2;
+    for (int y = -radius; y <= radius; y++) {
+        for (int x = -radius; x <= radius; x++) {
+            shadow += lookup(uv + vec2(x, y) * texel, depth, tile);
         }
     }
-    return shadow / 64;
+    return shadow / float((2 * radius + 1) * (2 * radius + 1));
 }
 
 vec3 getLight(vec3 color) {
@@ -57,7 +122,7 @@ vec3 getLight(vec3 color) {
     vec3 specular = spec * light.Is;
 
     // shadow
-    float shadow = getSoftShadowX64();
+    float shadow = getShadow(Normal);
 
     return color * (ambient + (diffuse + specular) * shadow);
 }
@@ -65,7 +130,7 @@ vec3 getLight(vec3 color) {
 
 void main() {
     float gamma = 2.2;
-    vec3 color = texture(u_texture_0, uv_0).rgb;
+    vec3 color = texture(u_texture_0, vec3(uv_0, layer)).rgb;
     color = pow(color, vec3(gamma));
 
     color = getLight(color);
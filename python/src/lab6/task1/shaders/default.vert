@@ -3,32 +3,29 @@
 layout (location = 0) in vec2 in_texcoord_0;
 layout (location = 1) in vec3 in_normal;
 layout (location = 2) in vec3 in_position;
+// texture array layer of baked meshes that mix textures, 0 when the vbo has none
+layout (location = 3) in float in_layer;
 
 out vec2 uv_0;
+flat out float layer;
 out vec3 normal;
 out vec3 fragPos;
-out vec4 shadowCoord;
 
-uniform mat4 m_proj;
-uniform mat4 m_view;
-uniform mat4 m_view_light;
-uniform mat4 m_model;
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    mat4 m_invProjView;
+    vec3 camPos;
+};
 
-mat4 m_shadow_bias = mat4(
-    0.5, 0.0, 0.0, 0.0,
-    0.0, 0.5, 0.0, 0.0,
-    0.0, 0.0, 0.5, 0.0,
-    0.5, 0.5, 0.5, 1.0
-);
+uniform mat4 m_model;
+uniform float u_layer;
 
 
 void main() {
     uv_0 = in_texcoord_0;
+    layer = u_layer + in_layer;
     fragPos = vec3(m_model * vec4(in_position, 1.0));
     normal = mat3(transpose(inverse(m_model))) * normalize(in_normal);
     gl_Position = m_proj * m_view * m_model * vec4(in_position, 1.0);
-
-    mat4 shadowMVP = m_proj * m_view_light * m_model;
-    shadowCoord = m_shadow_bias * shadowMVP * vec4(in_position, 1.0);
-    shadowCoord.z -= 0.0005;
 }
\ No newline at end of file
@@ -0,0 +1,28 @@
+#version 330 core
+
+layout (location = 0) in vec2 in_texcoord_0;
+layout (location = 1) in vec3 in_normal;
+layout (location = 2) in vec3 in_position;
+layout (location = 3) in mat4 in_m_model;
+layout (location = 7) in float in_layer;
+
+out vec2 uv_0;
+flat out float layer;
+out vec3 normal;
+out vec3 fragPos;
+
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    mat4 m_invProjView;
+    vec3 camPos;
+};
+
+
+void main() {
+    uv_0 = in_texcoord_0;
+    layer = in_layer;
+    fragPos = vec3(in_m_model * vec4(in_position, 1.0));
+    normal = mat3(transpose(inverse(in_m_model))) * normalize(in_normal);
+    gl_Position = m_proj * m_view * in_m_model * vec4(in_position, 1.0);
+}
\ No newline at end of file
@@ -0,0 +1,9 @@
+#version 330 core
+
+uniform sampler2D u_depth;
+
+
+void main() {
+    // same texel as the one written, so any viewport copies just its own rectangle
+    gl_FragDepth = texelFetch(u_depth, ivec2(gl_FragCoord.xy), 0).r;
+}
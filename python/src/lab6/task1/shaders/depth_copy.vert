@@ -0,0 +1,8 @@
+#version 330 core
+
+
+void main() {
+    // one triangle covering the viewport, built from the vertex id without a vertex buffer
+    vec2 position = vec2((gl_VertexID << 1) & 2, gl_VertexID & 2);
+    gl_Position = vec4(position * 2.0 - 1.0, 0.0, 1.0);
+}
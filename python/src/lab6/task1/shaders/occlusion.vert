@@ -0,0 +1,17 @@
+#version 330 core
+
+// unit cube, stretched over the bounding box of each instance
+layout (location = 2) in vec3 in_position;
+layout (location = 3) in vec3 in_min;
+layout (location = 4) in vec3 in_max;
+
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    mat4 m_invProjView;
+    vec3 camPos;
+};
+
+void main() {
+    gl_Position = m_proj * m_view * vec4(mix(in_min, in_max, in_position), 1.0);
+}
\ No newline at end of file
@@ -2,11 +2,17 @@
 
 layout (location = 2) in vec3 in_position;
 
-uniform mat4 m_proj;
-uniform mat4 m_view_light;
+layout (std140) uniform Shadow {
+    mat4 m_shadow[4];
+    vec4 cascadeSplits;
+    vec4 texelSizes;
+    int cascadeCount;
+    int pcfMode;
+};
+
+uniform int u_cascade;
 uniform mat4 m_model;
 
 void main() {
-    mat4 mvp = m_proj * m_view_light * m_model;
-    gl_Position = mvp * vec4(in_position, 1.0);
+    gl_Position = m_shadow[u_cascade] * m_model * vec4(in_position, 1.0);
 }
\ No newline at end of file
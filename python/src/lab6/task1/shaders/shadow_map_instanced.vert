@@ -0,0 +1,18 @@
+#version 330 core
+
+layout (location = 2) in vec3 in_position;
+layout (location = 3) in mat4 in_m_model;
+
+layout (std140) uniform Shadow {
+    mat4 m_shadow[4];
+    vec4 cascadeSplits;
+    vec4 texelSizes;
+    int cascadeCount;
+    int pcfMode;
+};
+
+uniform int u_cascade;
+
+void main() {
+    gl_Position = m_shadow[u_cascade] * in_m_model * vec4(in_position, 1.0);
+}
\ No newline at end of file
@@ -5,7 +5,13 @@ out vec4 fragColor;
 in vec4 clipCoords;
 
 uniform samplerCube u_texture_skybox;
-uniform mat4 m_invProjView;
+
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    mat4 m_invProjView;
+    vec3 camPos;
+};
 
 
 void main() {
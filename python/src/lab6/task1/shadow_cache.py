@@ -0,0 +1,79 @@
+import moderngl as mgl
+from typing import Optional
+from moderngl import Framebuffer, Program, Texture, VertexArray
+from pyglm.glm import mat4x4
+from graphics_engine import IGraphicsEngine
+
+# units 0 and 1 hold the diffuse texture and the shadow map
+COPY_TEXTURE_UNIT = 2
+
+
+class ShadowCache:
+    # depth of the static shadow casters, a cascade is rendered again only when its light matrix
+    # or a static caster changes; a tile is copied into the shadow map when it differs from the cache there
+    app: IGraphicsEngine
+    depth_texture: Texture
+    fbo: Framebuffer
+    program: Program
+    vao: VertexArray
+    keys: list[Optional[tuple]]
+    # shadow map tiles that no longer match the cache, because dynamic casters were drawn over them
+    dirty: list[bool]
+    # cascades the static casters were rendered into
+    bakes: int
+
+    def __init__(self, app: IGraphicsEngine, size: tuple[int, int], cascade_count: int) -> None:
+        self.app = app
+        self.depth_texture = app.ctx.depth_texture(size)
+        # sampled as plain depth values, not compared like the shadow map
+        self.depth_texture.compare_func = ''
+        self.depth_texture.filter = (mgl.NEAREST, mgl.NEAREST)
+        self.fbo = app.ctx.framebuffer(depth_attachment=self.depth_texture)
+        app.mesh.vao.program.set_default('depth_copy', 'u_depth', COPY_TEXTURE_UNIT)
+        self.get_vao()
+        app.mesh.vao.program.reload_callbacks.append(self.on_reload)
+        self.keys = [None] * cascade_count
+        self.dirty = [True] * cascade_count
+        self.bakes = 0
+
+    def get_vao(self) -> None:
+        self.program = self.app.mesh.vao.program.programs['depth_copy']
+        # a triangle covering the viewport, made up in the vertex shader
+        self.vao = self.app.ctx.vertex_array(self.program, [])
+        self.vao.vertices = 3
+
+    def on_reload(self, program_names: set[str]) -> None:
+        if 'depth_copy' in program_names:
+            self.vao.release()
+            self.get_vao()
+        # the cached depth was drawn with the old shadow programs
+        if program_names & {'shadow_map', 'shadow_map_instanced'}:
+            self.invalidate()
+
+    def get_stale(self, objects: list, matrices: list[mat4x4]) -> list[int]:
+        # cascades whose cached depth is out of date; the residency version covers meshes streaming in
+        static = (self.app.mesh.residency.version, tuple(obj.node.version for obj in objects if not obj.dynamic))
+        stale = []
+        for i, matrix in enumerate(matrices):
+            key = (matrix.to_bytes(), static)
+            if key != self.keys[i]:
+                self.keys[i] = key
+                self.dirty[i] = True
+                stale.append(i)
+        self.bakes += len(stale)
+        return stale
+
+    def invalidate(self) -> None:
+        self.keys = [None] * len(self.keys)
+
+    def copy_to(self, framebuffer: Framebuffer, viewport: tuple[int, int, int, int]) -> None:
+        framebuffer.viewport = viewport
+        framebuffer.clear(viewport=viewport)
+        self.app.stats.use_framebuffer(framebuffer)
+        self.app.stats.bind_texture(self.depth_texture, COPY_TEXTURE_UNIT)
+        self.app.stats.draw(self.vao)
+
+    def destroy(self) -> None:
+        self.vao.release()
+        self.fbo.release()
+        self.depth_texture.release()
@@ -0,0 +1,125 @@
+import math
+import struct
+import numpy as np
+from pyglm import glm
+from pyglm.glm import vec3, mat4x4
+from camera import Camera, FOV, NEAR
+from light import Light
+
+# the view distance is split into this many cascades, 2 to MAX_CASCADES
+CASCADE_COUNT = 3
+MAX_CASCADES = 4
+# side of each cascade's square tile in the shadow atlas, in texels
+CASCADE_RESOLUTION = 1024
+# the cascades sit side by side in one depth texture
+SHADOW_ATLAS_SIZE = (CASCADE_RESOLUTION * CASCADE_COUNT, CASCADE_RESOLUTION)
+# nothing is shadowed beyond this distance from the camera
+SHADOW_DISTANCE = 120.0
+# blend between uniform (0) and logarithmic (1) split distances
+SPLIT_LAMBDA = 0.7
+# depth kept in front of each cascade, so casters outside the view still shadow it
+CASTER_MARGIN = 100.0
+# cascades move in steps of this many texels; between steps their matrices stay the same,
+# so the cached static depth stays valid while the camera moves a little
+SNAP_TEXELS = 64
+# filtering of the shadow edges, indices match pcfMode in default.frag
+PCF_MODES = ('hardware', 'pcf3x3', 'pcf5x5', 'poisson')
+PCF_MODE = 'poisson'
+
+
+def get_split_distances(near: float, far: float, count: int, split_lambda: float = SPLIT_LAMBDA) -> list[float]:
+    # far end of each cascade, the practical split scheme from Zhang et al., "Parallel-Split Shadow Maps"
+    splits = []
+    for i in range(1, count + 1):
+        log = near * (far / near) ** (i / count)
+        uniform = near + (far - near) * i / count
+        splits.append(split_lambda * log + (1 - split_lambda) * uniform)
+    return splits
+
+
+def get_frustum_corners(camera: Camera, near: float, far: float) -> np.ndarray:
+    # world space corners of the slice of the view frustum between the near and far distances
+    tan_y = math.tan(math.radians(FOV) / 2)
+    tan_x = tan_y * camera.aspect_ratio
+    corners = []
+    for distance in (near, far):
+        center = camera.position + camera.forward * distance
+        for x, y in ((-1, -1), (1, -1), (1, 1), (-1, 1)):
+            corners.append(center + camera.right * (x * tan_x * distance) + camera.up * (y * tan_y * distance))
+    return np.array([tuple(corner) for corner in corners], dtype='f4')
+
+
+def get_light_up(direction: vec3) -> vec3:
+    return glm.vec3(0, 1, 0) if abs(direction.y) < 0.99 else glm.vec3(1, 0, 0)
+
+
+def fit_cascade(corners: np.ndarray, direction: vec3, resolution: int) -> tuple[mat4x4, float]:
+    # orthographic light matrix covering the bounding sphere of the slice, returns it with its texel size;
+    # the sphere keeps the size fixed while the camera turns, snapping keeps it fixed while the camera moves
+    center = corners.mean(axis=0)
+    radius = math.ceil(float(np.linalg.norm(corners - center, axis=1).max()) * 16) / 16
+    # the snapped center is up to one step off, the tile is grown to still cover the whole sphere
+    radius /= 1 - 2 * SNAP_TEXELS / resolution
+    texel = 2 * radius / resolution
+    step = texel * SNAP_TEXELS
+    up = get_light_up(direction)
+    m_rotation = glm.lookAt(glm.vec3(0), direction, up)
+    light_center = glm.vec3(m_rotation * glm.vec4(*center, 1.0))
+    light_center = glm.floor(light_center / step) * step
+    center = glm.vec3(glm.inverse(m_rotation) * glm.vec4(light_center, 1.0))
+    m_view = glm.lookAt(center - direction * (radius + CASTER_MARGIN), center, up)
+    m_proj = glm.ortho(-radius, radius, -radius, radius, 0.0, 2 * radius + CASTER_MARGIN)
+    return m_proj * m_view, texel
+
+
+class ShadowCascades:
+    # directional light shadows in cascades fitted to slices of the camera frustum, one atlas tile each
+    camera: Camera
+    light: Light
+    count: int
+    resolution: int
+    # far distance of each cascade from the camera
+    splits: list[float]
+    # light view-projection of each cascade
+    matrices: list[mat4x4]
+    # world size of one shadow map texel in each cascade
+    texel_sizes: list[float]
+    pcf_mode: int
+
+    def __init__(self, camera: Camera, light: Light) -> None:
+        self.camera = camera
+        self.light = light
+        self.count = CASCADE_COUNT
+        self.resolution = CASCADE_RESOLUTION
+        self.splits = get_split_distances(NEAR, SHADOW_DISTANCE, self.count)
+        self.matrices = [glm.mat4(1.0)] * self.count
+        self.texel_sizes = [0.0] * self.count
+        self.pcf_mode = PCF_MODES.index(PCF_MODE)
+        self.update()
+
+    @property
+    def direction(self) -> vec3:
+        # the light is treated as a sun shining from its position towards its target
+        return glm.normalize(self.light.direction - self.light.position)
+
+    def get_viewport(self, cascade: int) -> tuple[int, int, int, int]:
+        return cascade * self.resolution, 0, self.resolution, self.resolution
+
+    def update(self) -> None:
+        near = NEAR
+        for i, far in enumerate(self.splits):
+            corners = get_frustum_corners(self.camera, near, far)
+            self.matrices[i], self.texel_sizes[i] = fit_cascade(corners, self.direction, self.resolution)
+            near = far
+
+    def cycle_pcf_mode(self) -> str:
+        self.pcf_mode = (self.pcf_mode + 1) % len(PCF_MODES)
+        return PCF_MODES[self.pcf_mode]
+
+    def get_data(self) -> bytes:
+        # the std140 Shadow uniform block
+        padding = MAX_CASCADES - self.count
+        matrices = b''.join(matrix.to_bytes() for matrix in self.matrices) + glm.mat4(1.0).to_bytes() * padding
+        return (matrices + struct.pack('4f', *self.splits, *[0.0] * padding) +
+                struct.pack('4f', *self.texel_sizes, *[0.0] * padding) +
+                struct.pack('2i8x', self.count, self.pcf_mode))
@@ -0,0 +1,296 @@
+import math
+import numpy as np
+from typing import Optional
+
+# side of a grid cell in world units, about the size of the props
+CELL_SIZE = 4.0
+# items covering more cells than this stay out of the grid and are tested by every query
+MAX_ITEM_CELLS = 64
+# cell coordinates are packed into one int64 key, 21 bits per axis
+KEY_BITS = 21
+KEY_BIAS = 1 << (KEY_BITS - 1)
+
+
+def get_cell_keys(cells: np.ndarray) -> np.ndarray:
+    cells = cells.astype(np.int64) + KEY_BIAS
+    return (cells[:, 0] << (2 * KEY_BITS)) | (cells[:, 1] << KEY_BITS) | cells[:, 2]
+
+
+def get_cell_range(b_min: np.ndarray, b_max: np.ndarray) -> np.ndarray:
+    # keys of every cell between two cell coordinates, inclusive
+    axes = [np.arange(low, high + 1) for low, high in zip(b_min.tolist(), b_max.tolist())]
+    cells = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    return get_cell_keys(cells)
+
+
+def intersect_ray(origin: np.ndarray, direction: np.ndarray, mins: np.ndarray, maxs: np.ndarray) -> np.ndarray:
+    # slab test, distance along the ray to each box, inf where it is missed; 0 from inside a box
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inverse = 1 / direction
+        t1 = (mins - origin) * inverse
+        t2 = (maxs - origin) * inverse
+    near = np.nanmax(np.minimum(t1, t2), axis=1)
+    far = np.nanmin(np.maximum(t1, t2), axis=1)
+    near = np.maximum(near, 0)
+    return np.where(far >= near, near, np.inf)
+
+
+class SpatialGrid:
+    # uniform grid over item bounds, every item is listed in each cell it overlaps; the cells are kept
+    # as sorted keys with their item ranges, so a query is a few searchsorted calls, not a scan
+    cell_size: float
+    mins: np.ndarray
+    maxs: np.ndarray
+    # cell coordinates each item covers, inclusive
+    cell_mins: np.ndarray
+    cell_maxs: np.ndarray
+    # items[starts[i]:starts[i + 1]] overlap the cell keys[i]
+    keys: np.ndarray
+    starts: np.ndarray
+    items: np.ndarray
+    # coordinates of the cells in keys, and the box around them
+    cells: np.ndarray
+    grid_min: np.ndarray
+    grid_max: np.ndarray
+    # items too large for the grid
+    large: np.ndarray
+    # an item moved into other cells, the cells are rebuilt before the next query
+    dirty: bool
+    builds: int
+
+    def __init__(self, mins: np.ndarray, maxs: np.ndarray, cell_size: float = CELL_SIZE) -> None:
+        self.cell_size = cell_size
+        self.builds = 0
+        self.build(mins, maxs)
+
+    def get_cells(self, mins: np.ndarray, maxs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return np.floor(mins / self.cell_size).astype(np.int64), np.floor(maxs / self.cell_size).astype(np.int64)
+
+    def build(self, mins: np.ndarray, maxs: np.ndarray) -> None:
+        self.mins, self.maxs = mins, maxs
+        self.cell_mins, self.cell_maxs = self.get_cells(mins, maxs)
+        spans = self.cell_maxs - self.cell_mins + 1
+        counts = np.prod(spans, axis=1)
+        is_large = counts > MAX_ITEM_CELLS
+        self.large = np.flatnonzero(is_large)
+        small = np.flatnonzero(~is_large)
+        counts, spans = counts[small], spans[small]
+        # one entry per (item, covered cell)
+        items = np.repeat(small, counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        local = np.arange(len(items)) - first
+        span_y, span_z = np.repeat(spans[:, 1], counts), np.repeat(spans[:, 2], counts)
+        offsets = np.stack([local // (span_y * span_z), local // span_z % span_y, local % span_z], axis=1)
+        keys = get_cell_keys(self.cell_mins[items] + offsets)
+        order = np.argsort(keys, kind='stable')
+        self.keys, first_entries = np.unique(keys[order], return_index=True)
+        self.starts = np.append(first_entries, len(order))
+        self.items = items[order]
+        mask = (1 << KEY_BITS) - 1
+        self.cells = np.stack([(self.keys >> (2 * KEY_BITS)) & mask, (self.keys >> KEY_BITS) & mask,
+                               self.keys & mask], axis=1) - KEY_BIAS
+        if len(self.cells):
+            self.grid_min = self.cells.min(axis=0) * self.cell_size
+            self.grid_max = (self.cells.max(axis=0) + 1) * self.cell_size
+        self.dirty = False
+        self.builds += 1
+
+    def update(self, mins: np.ndarray, maxs: np.ndarray, changed: np.ndarray) -> None:
+        # new bounds for the changed items; the cells are only rebuilt if one of them left its cells
+        self.mins, self.maxs = mins, maxs
+        if self.dirty or not len(changed):
+            return
+        cell_mins, cell_maxs = self.get_cells(mins[changed], maxs[changed])
+        if not (np.array_equal(cell_mins, self.cell_mins[changed])
+                and np.array_equal(cell_maxs, self.cell_maxs[changed])):
+            self.dirty = True
+
+    def ensure_built(self) -> None:
+        if self.dirty:
+            self.build(self.mins, self.maxs)
+
+    def get_items(self, keys: np.ndarray) -> np.ndarray:
+        # items listed in any of the cells, and the large ones
+        slots = np.searchsorted(self.keys, keys)
+        found = slots < len(self.keys)
+        found[found] = self.keys[slots[found]] == keys[found]
+        slots = slots[found]
+        begins, lengths = self.starts[slots], self.starts[slots + 1] - self.starts[slots]
+        entries = np.repeat(begins - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.union1d(self.items[entries], self.large)
+
+    def query_aabb(self, b_min, b_max) -> np.ndarray:
+        self.ensure_built()
+        b_min, b_max = np.asarray(b_min, dtype='f4'), np.asarray(b_max, dtype='f4')
+        cell_min, cell_max = self.get_cells(b_min[None], b_max[None])
+        candidates = self.get_items(get_cell_range(cell_min[0], cell_max[0]))
+        overlap = np.all(self.mins[candidates] <= b_max, axis=1) & np.all(self.maxs[candidates] >= b_min, axis=1)
+        return candidates[overlap]
+
+    def query_radius(self, center, radius: float) -> np.ndarray:
+        center = np.asarray(center, dtype='f4')
+        candidates = self.query_aabb(center - radius, center + radius)
+        nearest = np.clip(center, self.mins[candidates], self.maxs[candidates])
+        return candidates[np.einsum('ij,ij->i', nearest - center, nearest - center) <= radius * radius]
+
+    def query_frustum(self, frustum) -> np.ndarray:
+        # a culling.Frustum; occupied cells are tested first, then the items in the visible ones
+        self.ensure_built()
+        cell_mins = self.cells * self.cell_size
+        visible = frustum.test(cell_mins, cell_mins + self.cell_size)
+        candidates = self.get_items(self.keys[visible])
+        return candidates[frustum.test(self.mins[candidates], self.maxs[candidates])]
+
+    def raycast(self, origin, direction, max_distance: float = math.inf) -> Optional[tuple[int, float]]:
+        # nearest item along the ray, walking the cells it crosses front to back
+        self.ensure_built()
+        origin = np.asarray(origin, dtype='f8')
+        direction = np.asarray(direction, dtype='f8')
+        direction = direction / np.linalg.norm(direction)
+        best_item, best_distance = -1, max_distance
+        if len(self.large):
+            distances = intersect_ray(origin, direction, self.mins[self.large], self.maxs[self.large])
+            nearest = int(np.argmin(distances))
+            if distances[nearest] < best_distance:
+                best_item, best_distance = int(self.large[nearest]), float(distances[nearest])
+        if not len(self.keys):
+            return (best_item, best_distance) if best_item >= 0 else None
+        # the walk starts where the ray enters the occupied cells and ends where it leaves them
+        grid_min, grid_max = self.grid_min, self.grid_max
+        enter = intersect_ray(origin, direction, grid_min[None], grid_max[None])[0]
+        if enter == np.inf:
+            return (best_item, best_distance) if best_item >= 0 else None
+        with np.errstate(divide='ignore', invalid='ignore'):
+            exit_distance = float(np.nanmin(np.maximum((grid_min - origin) / direction,
+                                                       (grid_max - origin) / direction)))
+        # 3d dda: cell, step and distance to the next cell boundary on each axis
+        start = origin + direction * enter
+        cell = [math.floor(value / self.cell_size) for value in start.tolist()]
+        steps, next_boundary, boundary_step = [], [], []
+        for axis in range(3):
+            d = float(direction[axis])
+            steps.append(1 if d > 0 else -1)
+            if d == 0:
+                next_boundary.append(math.inf)
+                boundary_step.append(math.inf)
+                continue
+            boundary = (cell[axis] + (d > 0)) * self.cell_size
+            next_boundary.append((boundary - origin[axis]) / d)
+            boundary_step.append(self.cell_size / abs(d))
+        distance = float(enter)
+        while distance <= min(best_distance, exit_distance):
+            key = get_cell_keys(np.array([cell]))[0]
+            slot = int(np.searchsorted(self.keys, key))
+            if slot < len(self.keys) and self.keys[slot] == key:
+                items = self.items[self.starts[slot]:self.starts[slot + 1]]
+                distances = intersect_ray(origin, direction, self.mins[items], self.maxs[items])
+                nearest = int(np.argmin(distances))
+                if distances[nearest] < best_distance:
+                    best_item, best_distance = int(items[nearest]), float(distances[nearest])
+            axis = int(np.argmin(next_boundary))
+            distance = next_boundary[axis]
+            cell[axis] += steps[axis]
+            next_boundary[axis] += boundary_step[axis]
+        return (best_item, best_distance) if best_item >= 0 else None
+
+
+class SceneIndex:
+    # bounds of the instances of every scene object, one item per instance, kept up to date as objects
+    # are added and moved, with a grid over them for queries near a point, in a box or along a ray
+    objects: list
+    offsets: list[int]
+    mins: np.ndarray
+    maxs: np.ndarray
+    grid: SpatialGrid
+    item_count: int
+    # residency version the bounds were taken at, placeholder meshes have placeholder bounds
+    version: int
+    # transform node version each object's bounds were taken at
+    node_versions: list[int]
+    # items changed since take_changes() was last called, None after a rebuild
+    changes: Optional[list[np.ndarray]]
+
+    def __init__(self, objects: list) -> None:
+        self.objects = objects
+        self.version = -1
+        self.node_versions = []
+        self.changes = None
+        self.offsets = []
+        self.mins = np.empty((0, 3), dtype='f4')
+        self.maxs = np.empty((0, 3), dtype='f4')
+        self.grid = SpatialGrid(self.mins, self.maxs)
+        self.item_count = 0
+
+    def rebuild(self) -> None:
+        self.offsets = [0]
+        self.node_versions = [obj.node.version for obj in self.objects]
+        mins, maxs = [], []
+        for obj in self.objects:
+            obj_mins, obj_maxs = obj.get_bounds()
+            mins.append(obj_mins)
+            maxs.append(obj_maxs)
+            self.offsets.append(self.offsets[-1] + len(obj_mins))
+        self.item_count = self.offsets[-1]
+        if mins:
+            self.mins, self.maxs = np.concatenate(mins), np.concatenate(maxs)
+        self.grid.build(self.mins, self.maxs)
+        self.changes = None
+
+    def update(self, version: Optional[int] = None) -> None:
+        # queries update with the last residency version
+        if version is None:
+            version = self.version
+        if len(self.offsets) != len(self.objects) + 1 or version != self.version:
+            self.version = version
+            self.rebuild()
+            return
+        changed = []
+        for i, obj in enumerate(self.objects):
+            if obj.node.version != self.node_versions[i]:
+                self.node_versions[i] = obj.node.version
+                start, end = self.offsets[i], self.offsets[i + 1]
+                obj_mins, obj_maxs = obj.get_bounds()
+                if len(obj_mins) != end - start:
+                    # instances were added, the items after them shift
+                    self.rebuild()
+                    return
+                self.mins[start:end], self.maxs[start:end] = obj_mins, obj_maxs
+                changed.append(np.arange(start, end))
+        if changed:
+            changed = np.concatenate(changed)
+            self.grid.update(self.mins, self.maxs, changed)
+            if self.changes is not None:
+                self.changes.append(changed)
+
+    def take_changes(self) -> Optional[np.ndarray]:
+        # items moved since the last call, None if they were all taken again since
+        changes = self.changes
+        self.changes = []
+        if changes is None:
+            return None
+        return np.unique(np.concatenate(changes)) if changes else np.empty(0, dtype=int)
+
+    def get_objects(self, items: np.ndarray) -> list[tuple[object, np.ndarray]]:
+        # (object, instance indices) for a set of items
+        items = np.sort(items)
+        bounds = np.searchsorted(items, self.offsets)
+        return [(obj, items[bounds[i]:bounds[i + 1]] - self.offsets[i])
+                for i, obj in enumerate(self.objects) if bounds[i] != bounds[i + 1]]
+
+    def query_radius(self, center, radius: float) -> list[tuple[object, np.ndarray]]:
+        self.update()
+        return self.get_objects(self.grid.query_radius(center, radius))
+
+    def query_aabb(self, b_min, b_max) -> list[tuple[object, np.ndarray]]:
+        self.update()
+        return self.get_objects(self.grid.query_aabb(b_min, b_max))
+
+    def pick(self, origin, direction, max_distance: float = math.inf) -> Optional[tuple[object, int, float]]:
+        # nearest (object, instance, distance) along the ray
+        self.update()
+        hit = self.grid.raycast(origin, direction, max_distance)
+        if hit is None:
+            return None
+        item, distance = hit
+        i = int(np.searchsorted(self.offsets, item, side='right')) - 1
+        return self.objects[i], item - self.offsets[i], distance
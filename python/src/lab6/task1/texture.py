@@ -1,60 +1,135 @@
+import numpy as np
 import pygame as pg
 import moderngl as mgl
+from OpenGL import GL
 from graphics_engine import IGraphicsEngine
+from residency import ResidencyManager
+from shadow_cascades import SHADOW_ATLAS_SIZE
+from texture_cache import load_texture_array
+
+TEXTURE_PATHS: dict[str, str] = {
+    'stone': 'textures/stone.png',
+    'dirt': 'textures/dirt.png',
+    'ferret': 'objects/10019_ferret_v1_Diffuse.jpg',
+    'hawk': 'objects/10025_Hawk_v1_Diffuse.jpg',
+    'cat': 'objects/Cat_diffuse.jpg',
+    'cactus': 'objects/10436_Cactus_v1_Diffuse.jpg',
+    'plant': 'objects/10446_Palm_Tree_v1_Diffuse.jpg',
+    'hedge': 'objects/10449_Rectangular_Box_Hedge_v1_Diffuse.jpg',
+    'car': 'objects/Car Uv.png',
+    'farmhouse': 'objects/Farmhouse Texture.jpg',
+}
+# streamed textures are layers of a few arrays, so models with different textures share one bind
+# and can be merged into one draw; every layer of an array is resized to its size.
+# array name -> layer size, texture ids in layer order
+TEXTURE_ARRAYS: dict[str, tuple[int, tuple[str, ...]]] = {
+    'diffuse': (1024, ('stone', 'dirt', 'ferret', 'hawk', 'cat', 'cactus', 'plant', 'hedge', 'car')),
+    # the only large texture keeps its detail in an array of its own
+    'farmhouse': (2048, ('farmhouse',)),
+}
+GL_COMPRESSED_RGB_S3TC_DXT1 = 0x83F0
+GL_FORMATS = {
+    'bc1': GL_COMPRESSED_RGB_S3TC_DXT1,
+    'rgb8': GL.GL_RGB8,
+}
+
+
+def decode_texture_cube(dir_path: str, ext='png') -> tuple[tuple[int, int], list[bytes]]:
+    faces = ['right', 'left', 'top', 'bottom'] + ['front', 'back'][::-1]
+    textures = []
+    for face in faces:
+        texture = pg.image.load(dir_path + f'{face}.{ext}')
+        if face in ['right', 'left', 'front', 'back']:
+            texture = pg.transform.flip(texture, flip_x=True, flip_y=False)
+        else:
+            texture = pg.transform.flip(texture, flip_x=False, flip_y=True)
+        textures.append(texture)
+    return textures[0].get_size(), [pg.image.tostring(texture, 'RGB') for texture in textures]
 
 
 class Texture:
     app: IGraphicsEngine
+    residency: ResidencyManager
+    # always resident; the TEXTURE_PATHS textures are streamed through the residency manager, one array at a time
     textures: dict[str, mgl.Texture | mgl.TextureCube] = dict()
+    placeholder: mgl.TextureArray
+    # texture id -> array name, layer
+    layers: dict[str, tuple[str, int]]
+    # cooked format of the streamed textures, bc1 where the driver can sample it
+    texture_format: str
 
-    def __init__(self, app: IGraphicsEngine) -> None:
+    def __init__(self, app: IGraphicsEngine, residency: ResidencyManager) -> None:
         self.app = app
-        self.textures['skybox'] = self.get_texture_cube(dir_path='textures/skybox/', ext='png')
+        self.residency = residency
+        residency.loader.submit('texture/skybox', decode_texture_cube, 'textures/skybox/', 'png')
+        self.textures['skybox'] = residency.loader.upload('texture/skybox', self.get_texture_cube)
         self.textures['depth_texture'] = self.get_depth_texture()
-        self.textures['stone'] = self.get_texture(path='textures/stone.png')
-        self.textures['dirt'] = self.get_texture(path='textures/dirt.png')
-        self.textures['ferret'] = self.get_texture(path='objects/10019_ferret_v1_Diffuse.jpg')
-        self.textures['hawk'] = self.get_texture(path='objects/10025_Hawk_v1_Diffuse.jpg')
-        self.textures['cat'] = self.get_texture(path='objects/Cat_diffuse.jpg')
-        self.textures['cactus'] = self.get_texture(path='objects/10436_Cactus_v1_Diffuse.jpg')
-        self.textures['plant'] = self.get_texture(path='objects/10446_Palm_Tree_v1_Diffuse.jpg')
-        self.textures['hedge'] = self.get_texture(path='objects/10449_Rectangular_Box_Hedge_v1_Diffuse.jpg')
-        self.textures['car'] = self.get_texture(path='objects/Car Uv.png')
-        self.textures['farmhouse'] = self.get_texture(path='objects/Farmhouse Texture.jpg')
+        self.placeholder = self.get_placeholder_texture()
+        self.texture_format = 'bc1' if 'GL_EXT_texture_compression_s3tc' in app.ctx.extensions else 'rgb8'
+        self.layers = dict()
+        for name, (size, tex_ids) in TEXTURE_ARRAYS.items():
+            paths = [TEXTURE_PATHS[tex_id] for tex_id in tex_ids]
+            residency.register(f'texture/{name}', decode=(load_texture_array, (paths, self.texture_format, size)),
+                               upload=self.upload_texture,
+                               release=mgl.TextureArray.release, placeholder=self.placeholder)
+            self.layers.update({tex_id: (name, layer) for layer, tex_id in enumerate(tex_ids)})
+
+    def acquire(self, tex_id: str) -> None:
+        self.residency.acquire(f'texture/{self.layers[tex_id][0]}')
+
+    def release(self, tex_id: str) -> None:
+        self.residency.release(f'texture/{self.layers[tex_id][0]}')
+
+    def get(self, tex_id: str) -> mgl.TextureArray:
+        return self.residency.get(f'texture/{self.layers[tex_id][0]}')
+
+    def get_layer(self, tex_id: str) -> int:
+        return self.layers[tex_id][1]
+
+    def upload_texture(self, header: dict, levels: list[bytes]) -> tuple[mgl.TextureArray, int]:
+        return self.get_texture_array(header, levels), sum(len(level) for level in levels)
+
+    def get_placeholder_texture(self) -> mgl.TextureArray:
+        # one layer, layer indices past it are clamped to it
+        texture = self.app.ctx.texture_array(size=(2, 2, 1), components=3, data=bytes([128, 128, 128] * 4))
+        texture.filter = (mgl.NEAREST, mgl.NEAREST)
+        return texture
 
     def get_depth_texture(self) -> mgl.Texture:
-        depth_texture = self.app.ctx.depth_texture(self.app.WIN_SIZE)
+        # sized by the cascade settings, not the window
+        depth_texture = self.app.ctx.depth_texture(SHADOW_ATLAS_SIZE)
+        # linear filtering makes every comparison a 2x2 pcf lookup
+        depth_texture.filter = (mgl.LINEAR, mgl.LINEAR)
         depth_texture.repeat_x = False
         depth_texture.repeat_y = False
         return depth_texture
 
-    def get_texture_cube(self, dir_path: str, ext='png') -> mgl.TextureCube:
-        faces = ['right', 'left', 'top', 'bottom'] + ['front', 'back'][::-1]
-        textures = []
-        for face in faces:
-            texture = pg.image.load(dir_path + f'{face}.{ext}').convert()
-            if face in ['right', 'left', 'front', 'back']:
-                texture = pg.transform.flip(texture, flip_x=True, flip_y=False)
-            else:
-                texture = pg.transform.flip(texture, flip_x=False, flip_y=True)
-            textures.append(texture)
-
-        size = textures[0].get_size()
+    def get_texture_cube(self, size: tuple[int, int], faces: list[bytes]) -> mgl.TextureCube:
         texture_cube = self.app.ctx.texture_cube(size=size, components=3, data=None)
 
         for i in range(6):
-            texture_data = pg.image.tostring(textures[i], 'RGB')
-            texture_cube.write(face=i, data=texture_data)
+            texture_cube.write(face=i, data=faces[i])
 
         return texture_cube
 
-    def get_texture(self, path: str) -> mgl.Texture:
-        texture = pg.image.load(path).convert()
-        texture = pg.transform.flip(texture, flip_x=False, flip_y=True)
-        texture = self.app.ctx.texture(size=texture.get_size(), components=3,
-                                       data=pg.image.tostring(texture, 'RGB'))
+    def get_texture_array(self, header: dict, levels: list[bytes]) -> mgl.TextureArray:
+        # the cooked mip chain is uploaded level by level as stored, all layers of a level at once; moderngl has
+        # no call for compressed or per-level uploads, so the levels go through gl directly on moderngl's scratch unit
+        layers = header['layers']
+        texture = self.app.ctx.texture_array(size=(header['width'], header['height'], layers), components=3)
+        GL.glActiveTexture(GL.GL_TEXTURE0 + self.app.ctx.default_texture_unit)
+        GL.glBindTexture(GL.GL_TEXTURE_2D_ARRAY, texture.glo)
+        gl_format = GL_FORMATS[header['format']]
+        for i, (level, data) in enumerate(zip(header['levels'], levels)):
+            data = np.frombuffer(data, dtype='u1')
+            if header['format'] == 'rgb8':
+                GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+                GL.glTexImage3D(GL.GL_TEXTURE_2D_ARRAY, i, gl_format, level['width'], level['height'], layers, 0,
+                                GL.GL_RGB, GL.GL_UNSIGNED_BYTE, data)
+            else:
+                GL.glCompressedTexImage3D(GL.GL_TEXTURE_2D_ARRAY, i, gl_format, level['width'], level['height'],
+                                          layers, 0, data)
         texture.filter = (mgl.LINEAR_MIPMAP_LINEAR, mgl.LINEAR)
-        texture.build_mipmaps()
 
         texture.anisotropy = 32.0
 
@@ -62,3 +137,4 @@ class Texture:
 
     def destroy(self) -> None:
         [tex.release() for tex in self.textures.values()]
+        self.placeholder.release()
@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import numpy as np
+import pygame as pg
+from typing import Optional
+
+MAGIC = b'TEXC'
+VERSION = 1
+# magic, version, header size
+PREAMBLE = struct.Struct('<4sII')
+ALIGNMENT = 16
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# bc1 stores every 4x4 block in two rgb565 endpoints and 2 bit indices, 8 bytes
+BC1_BLOCK = np.dtype([('color0', '<u2'), ('color1', '<u2'), ('indices', '<u4')])
+FORMATS = ('bc1', 'rgb8')
+
+
+def get_cache_path(image_path: str, texture_format: str = 'bc1', size: Optional[int] = None) -> str:
+    # resized variants, for texture array layers, are cached separately
+    return f'{image_path}.{size}.{texture_format}.tex' if size else f'{image_path}.{texture_format}.tex'
+
+
+def get_source_hash(image_path: str) -> str:
+    with open(image_path, 'rb') as file:
+        return hashlib.blake2b(file.read(), digest_size=16).hexdigest()
+
+
+def load_image(image_path: str) -> np.ndarray:
+    # rows bottom to top, the way gl expects them
+    image = pg.image.load(image_path)
+    image = pg.transform.flip(image, flip_x=False, flip_y=True)
+    width, height = image.get_size()
+    return np.frombuffer(pg.image.tostring(image, 'RGB'), dtype='u1').reshape(height, width, 3)
+
+
+def resize_image(image: np.ndarray, size: int) -> np.ndarray:
+    # bilinear, to a size x size square; pygame's smoothscale needs a display surface format
+    height, width = image.shape[:2]
+    if (height, width) == (size, size):
+        return image
+    ys = np.clip((np.arange(size) + 0.5) * height / size - 0.5, 0, height - 1)
+    xs = np.clip((np.arange(size) + 0.5) * width / size - 0.5, 0, width - 1)
+    y0, x0 = ys.astype(int), xs.astype(int)
+    y1, x1 = np.minimum(y0 + 1, height - 1), np.minimum(x0 + 1, width - 1)
+    fy, fx = (ys - y0)[:, None, None], (xs - x0)[None, :, None]
+    image = image.astype('f4')
+    top = image[y0][:, x0] * (1 - fx) + image[y0][:, x1] * fx
+    bottom = image[y1][:, x0] * (1 - fx) + image[y1][:, x1] * fx
+    return np.round(top * (1 - fy) + bottom * fy).astype('u1')
+
+
+def get_mip_chain(image: np.ndarray) -> list[np.ndarray]:
+    # 2x2 box filter down to 1x1; odd sizes round down like gl does and lose their last row or column
+    levels = [image]
+    level = image.astype('f4')
+    while level.shape[0] > 1 or level.shape[1] > 1:
+        height, width = max(1, level.shape[0] // 2), max(1, level.shape[1] // 2)
+        fy, fx = (2 if level.shape[0] > 1 else 1), (2 if level.shape[1] > 1 else 1)
+        level = level[:height * fy, :width * fx].reshape(height, fy, width, fx, 3).mean(axis=(1, 3))
+        levels.append(np.round(level).astype('u1'))
+    return levels
+
+
+def pack_rgb565(colors: np.ndarray) -> np.ndarray:
+    r, g, b = [np.clip(np.round(colors[..., i] * scale / 255), 0, scale).astype('u2')
+               for i, scale in enumerate((31, 63, 31))]
+    return (r << 11) | (g << 5) | b
+
+
+def unpack_rgb565(packed: np.ndarray) -> np.ndarray:
+    r, g, b = (packed >> 11) & 31, (packed >> 5) & 63, packed & 31
+    return np.stack([r * 255 / 31, g * 255 / 63, b * 255 / 31], axis=-1).astype('f4')
+
+
+def encode_bc1(image: np.ndarray) -> bytes:
+    # endpoints at the ends of each block's principal axis, every texel takes the nearest of the 4 palette colors;
+    # sizes that are not a multiple of 4 are padded by repeating the edge texels
+    height, width = image.shape[:2]
+    padded = np.pad(image, ((0, -height % 4), (0, -width % 4), (0, 0)), mode='edge').astype('f4')
+    rows, cols = padded.shape[0] // 4, padded.shape[1] // 4
+    blocks = padded.reshape(rows, 4, cols, 4, 3).transpose(0, 2, 1, 3, 4).reshape(-1, 16, 3)
+
+    mean = blocks.mean(axis=1, keepdims=True)
+    centered = blocks - mean
+    covariance = np.einsum('bni,bnj->bij', centered, centered)
+    axis = np.ones((len(blocks), 3), dtype='f4')
+    for _ in range(4):
+        axis = np.einsum('bij,bj->bi', covariance, axis)
+        axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-6)
+    projection = np.einsum('bni,bi->bn', centered, axis)
+    color0 = pack_rgb565(mean[:, 0] + axis * projection.max(axis=1, keepdims=True))
+    color1 = pack_rgb565(mean[:, 0] + axis * projection.min(axis=1, keepdims=True))
+    # color0 > color1 selects the 4 color mode
+    color0, color1 = np.maximum(color0, color1), np.minimum(color0, color1)
+
+    end0, end1 = unpack_rgb565(color0), unpack_rgb565(color1)
+    palette = np.stack([end0, end1, (2 * end0 + end1) / 3, (end0 + 2 * end1) / 3], axis=1)
+    distances = ((blocks[:, :, None] - palette[:, None]) ** 2).sum(axis=-1)
+    indices = np.argmin(distances, axis=2).astype('u4')
+    # equal endpoints fall back to the 3 color mode, where index 3 is black
+    indices[color0 == color1] = 0
+
+    encoded = np.empty(len(blocks), dtype=BC1_BLOCK)
+    encoded['color0'], encoded['color1'] = color0, color1
+    encoded['indices'] = (indices << (2 * np.arange(16, dtype='u4'))).sum(axis=1, dtype='u4')
+    return encoded.tobytes()
+
+
+def write_texture(cache_path: str, level_data: list[bytes], header: dict) -> None:
+    offset = 0
+    for level, data in zip(header['levels'], level_data):
+        level['offset'], level['size'] = offset, len(data)
+        offset += len(data) + (-len(data) % ALIGNMENT)
+    header_data = json.dumps(header).encode()
+    header_data += b' ' * (-(PREAMBLE.size + len(header_data)) % ALIGNMENT)
+    # unique per writer, several workers may cook the same texture
+    tmp_path = f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(PREAMBLE.pack(MAGIC, VERSION, len(header_data)))
+        file.write(header_data)
+        for data in level_data:
+            file.write(data + b'\0' * (-len(data) % ALIGNMENT))
+    os.replace(tmp_path, cache_path)
+
+
+def read_header(cache_path: str) -> tuple[dict, int] | None:
+    try:
+        with open(cache_path, 'rb') as file:
+            magic, version, header_size = PREAMBLE.unpack(file.read(PREAMBLE.size))
+            if magic != MAGIC or version != VERSION:
+                return None
+            return json.loads(file.read(header_size)), PREAMBLE.size + header_size
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+def cook_texture(image_path: str, texture_format: str = 'bc1', size: Optional[int] = None) -> dict:
+    image = load_image(image_path)
+    levels = get_mip_chain(resize_image(image, size) if size else image)
+    if texture_format == 'bc1':
+        level_data = [encode_bc1(level) for level in levels]
+    else:
+        level_data = [level.tobytes() for level in levels]
+    header = {
+        'format': texture_format,
+        'width': levels[0].shape[1],
+        'height': levels[0].shape[0],
+        'levels': [{'width': level.shape[1], 'height': level.shape[0]} for level in levels],
+        'source_hash': get_source_hash(image_path),
+    }
+    write_texture(get_cache_path(image_path, texture_format, size), level_data, header)
+    return header
+
+
+def is_up_to_date(image_path: str, texture_format: str = 'bc1', size: Optional[int] = None) -> bool:
+    cached = read_header(get_cache_path(image_path, texture_format, size))
+    return cached is not None and cached[0]['source_hash'] == get_source_hash(image_path)
+
+
+def load_texture(image_path: str, texture_format: str = 'bc1',
+                 size: Optional[int] = None) -> tuple[dict, list[np.memmap]]:
+    # cooks the texture on first use, then maps every mip level straight from the cache file
+    cache_path = get_cache_path(image_path, texture_format, size)
+    if not is_up_to_date(image_path, texture_format, size):
+        cook_texture(image_path, texture_format, size)
+    header, offset = read_header(cache_path)
+    levels = [np.memmap(cache_path, dtype='u1', mode='r', offset=offset + level['offset'], shape=(level['size'],))
+              for level in header['levels']]
+    return header, levels
+
+
+def load_texture_array(image_paths: list[str], texture_format: str, size: int) -> tuple[dict, list[bytes]]:
+    # the layers of every mip level back to back, as one 3d upload per level expects them
+    layers = [load_texture(image_path, texture_format, size) for image_path in image_paths]
+    header = dict(layers[0][0], layers=len(layers))
+    return header, [b''.join(levels[i] for _, levels in layers) for i in range(len(header['levels']))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Precompile textures into memory-mappable, mipmapped .tex files')
+    parser.add_argument('directories', nargs='*', default=['textures', 'objects'])
+    parser.add_argument('--force', action='store_true', help='rebuild up-to-date textures too')
+    parser.add_argument('--format', choices=FORMATS, default='bc1',
+                        help='bc1 block compression, or rgb8 for drivers without s3tc')
+    parser.add_argument('--size', type=int, help='resize to a square of this size, as texture array layers are')
+    args = parser.parse_args()
+
+    for directory in args.directories:
+        for name in sorted(os.listdir(directory)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image_path = os.path.join(directory, name)
+            if not args.force and is_up_to_date(image_path, args.format, args.size):
+                print(f'{name}: up to date')
+                continue
+            start = time.perf_counter()
+            header = cook_texture(image_path, args.format, args.size)
+            size = sum(level['size'] for level in header['levels'])
+            print(f'{name}: {header["width"]}x{header["height"]}, {len(header["levels"])} levels, '
+                  f'{header["width"] * header["height"] * 3 / 2 ** 20:.1f} MB rgb8 -> '
+                  f'{size / 2 ** 20:.1f} MB {args.format} in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
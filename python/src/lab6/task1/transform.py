@@ -0,0 +1,85 @@
+from typing import Optional
+from pyglm import glm
+from pyglm.glm import vec3, mat4x4
+
+
+def get_model_matrix(pos, rot, scale) -> mat4x4:
+    m_model = glm.mat4()
+    # translate
+    m_model = glm.translate(m_model, pos)
+    # rotate
+    m_model = glm.rotate(m_model, rot[2], glm.vec3(0, 0, 1))
+    m_model = glm.rotate(m_model, rot[1], glm.vec3(0, 1, 0))
+    m_model = glm.rotate(m_model, rot[0], glm.vec3(1, 0, 0))
+    # scale
+    m_model = glm.scale(m_model, scale)
+    return m_model
+
+
+class Node:
+    # local transform relative to the parent; the world matrix is rebuilt lazily when it is read
+    pos: vec3
+    # radians
+    rot: vec3
+    scale: vec3
+    parent: Optional['Node']
+    children: list['Node']
+    local: mat4x4
+    world: mat4x4
+    local_dirty: bool
+    dirty: bool
+    # bumped whenever the world matrix changes, for consumers caching anything derived from it
+    version: int
+
+    def __init__(self, pos=(0, 0, 0), rot=(0, 0, 0), scale=(1, 1, 1)) -> None:
+        self.pos = glm.vec3(pos)
+        self.rot = glm.vec3(rot)
+        self.scale = glm.vec3(scale)
+        self.parent = None
+        self.children = []
+        self.local = glm.mat4()
+        self.world = glm.mat4()
+        self.local_dirty = True
+        self.dirty = True
+        self.version = 0
+
+    def set_transform(self, pos=None, rot=None, scale=None) -> None:
+        changed = False
+        for name, value in (('pos', pos), ('rot', rot), ('scale', scale)):
+            if value is not None and getattr(self, name) != glm.vec3(value):
+                setattr(self, name, glm.vec3(value))
+                changed = True
+        if changed:
+            self.local_dirty = True
+            self.mark_dirty()
+
+    def mark_dirty(self) -> None:
+        # a dirty node's subtree is dirty already, nothing below it can be clean until it is read
+        if self.dirty:
+            return
+        self.dirty = True
+        self.version += 1
+        for child in self.children:
+            child.mark_dirty()
+
+    @property
+    def world_matrix(self) -> mat4x4:
+        if self.dirty:
+            if self.local_dirty:
+                self.local = get_model_matrix(self.pos, self.rot, self.scale)
+                self.local_dirty = False
+            self.world = self.parent.world_matrix * self.local if self.parent else self.local
+            self.dirty = False
+        return self.world
+
+    def add_child(self, child: 'Node') -> None:
+        if child.parent is not None:
+            child.parent.remove_child(child)
+        child.parent = self
+        self.children.append(child)
+        child.mark_dirty()
+
+    def remove_child(self, child: 'Node') -> None:
+        self.children.remove(child)
+        child.parent = None
+        child.mark_dirty()
@@ -1,89 +1,56 @@
+from residency import ResidencyManager
 from vbo import VBO, BaseVBO
 from shader_program import ShaderProgram
-from moderngl import Context, VertexArray, Program
+from typing import Optional
+from moderngl import Context, VertexArray, Program, Buffer
 
 
 class VAO:
     ctx: Context
     vbo: VBO
     program: ShaderProgram
-    vaos: dict[str, VertexArray] = dict()
+    # (program, vbo, instance buffer) -> vbo the vertex array was built from, vertex array
+    vaos: dict[tuple[str, str, int], tuple[BaseVBO, VertexArray]] = dict()
 
-    def __init__(self, ctx: Context) -> None:
+    def __init__(self, ctx: Context, residency: ResidencyManager) -> None:
         self.ctx = ctx
-        self.vbo = VBO(ctx)
+        self.vbo = VBO(ctx, residency)
         self.program = ShaderProgram(ctx)
-
-        self.vaos['cube'] = self.get_vao(
-            program=self.program.programs['default'],
-            vbo=self.vbo.vbos['cube'])
-        self.vaos['shadow_cube'] = self.get_vao(
-            program=self.program.programs['shadow_map'],
-            vbo=self.vbo.vbos['cube'])
-
-        self.vaos['ferret'] = self.get_vao(
-            program=self.program.programs['default'],
-            vbo=self.vbo.vbos['ferret'])
-        self.vaos['shadow_ferret'] = self.get_vao(
-            program=self.program.programs['shadow_map'],
-            vbo=self.vbo.vbos['ferret'])
-
-        self.vaos['hawk'] = self.get_vao(
-            program=self.program.programs['default'],
-            vbo=self.vbo.vbos['hawk'])
-        self.vaos['shadow_hawk'] = self.get_vao(
-            program=self.program.programs['shadow_map'],
-            vbo=self.vbo.vbos['hawk'])
-
-        self.vaos['cat'] = self.get_vao(
-            program=self.program.programs['default'],
-            vbo=self.vbo.vbos['cat'])
-        self.vaos['shadow_cat'] = self.get_vao(
-            program=self.program.programs['shadow_map'],
-            vbo=self.vbo.vbos['cat'])
-
-        self.vaos['cactus'] = self.get_vao(
-            program=self.program.programs['default'],
-            vbo=self.vbo.vbos['cactus'])
-        self.vaos['shadow_cactus'] = self.get_vao(
-            program=self.program.programs['shadow_map'],
-            vbo=self.vbo.vbos['cactus'])
-
-        self.vaos['plant'] = self.get_vao(
-            program=self.program.programs['default'],
-            vbo=self.vbo.vbos['plant'])
-        self.vaos['shadow_plant'] = self.get_vao(
-            program=self.program.programs['shadow_map'],
-            vbo=self.vbo.vbos['plant'])
-
-        self.vaos['farmhouse'] = self.get_vao(
-            program=self.program.programs['default'],
-            vbo=self.vbo.vbos['farmhouse'])
-        self.vaos['shadow_farmhouse'] = self.get_vao(
-            program=self.program.programs['shadow_map'],
-            vbo=self.vbo.vbos['farmhouse'])
-
-        self.vaos['hedge'] = self.get_vao(
-            program=self.program.programs['default'],
-            vbo=self.vbo.vbos['hedge'])
-        self.vaos['shadow_hedge'] = self.get_vao(
-            program=self.program.programs['shadow_map'],
-            vbo=self.vbo.vbos['hedge'])
-
-        self.vaos['car'] = self.get_vao(
-            program=self.program.programs['default'],
-            vbo=self.vbo.vbos['car'])
-        self.vaos['shadow_car'] = self.get_vao(
-            program=self.program.programs['shadow_map'],
-            vbo=self.vbo.vbos['car'])
-
-        self.vaos['skybox'] = self.get_vao(
-            program=self.program.programs['skybox'],
-            vbo=self.vbo.vbos['skybox'])
-
-    def get_vao(self, program: Program, vbo: BaseVBO) -> VertexArray:
-        return self.ctx.vertex_array(program, [(vbo.vbo, vbo.format, *vbo.attribs)], skip_errors=True)
+        self.program.reload_callbacks.append(self.invalidate)
+
+    def get(self, program_name: str, vbo_name: str, instance_buffer: Optional[Buffer] = None) -> VertexArray:
+        # vertex arrays are built on first use and rebuilt when their vbo is streamed in or evicted
+        vbo = self.vbo.get(vbo_name)
+        key = (program_name, vbo_name, instance_buffer.glo if instance_buffer is not None else 0)
+        cached = self.vaos.get(key)
+        if cached is not None and cached[0] is vbo:
+            return cached[1]
+        if cached is not None:
+            cached[1].release()
+        vao = self.get_vao(self.program.programs[program_name], vbo, instance_buffer)
+        self.vaos[key] = (vbo, vao)
+        return vao
+
+    def get_vao(self, program: Program, vbo: BaseVBO, instance_buffer: Optional[Buffer] = None) -> VertexArray:
+        content = [(vbo.vbo, vbo.format, *vbo.attribs)]
+        if instance_buffer is not None:
+            # one model matrix and texture array layer per instance
+            content.append((instance_buffer, '16f 1f/i', 'in_m_model', 'in_layer'))
+        return self.ctx.vertex_array(program, content, index_buffer=vbo.ibo,
+                                     index_element_size=vbo.index_element_size, skip_errors=True)
+
+    def invalidate(self, program_names: set[str]) -> None:
+        # vertex arrays of reloaded programs are built again on next use
+        for key in [key for key in self.vaos if key[0] in program_names]:
+            self.vaos.pop(key)[1].release()
+
+    def release_instance_buffer(self, instance_buffer: Buffer) -> None:
+        # vertex arrays built on the buffer go with it, its glo may be handed out again
+        for key in [key for key in self.vaos if key[2] == instance_buffer.glo]:
+            self.vaos.pop(key)[1].release()
+        instance_buffer.release()
 
     def destroy(self) -> None:
+        [vao.release() for _, vao in self.vaos.values()]
         self.vbo.destroy()
         self.program.destroy()
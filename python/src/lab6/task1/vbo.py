@@ -1,41 +1,91 @@
 from typing import Optional
 from moderngl import Context, Buffer
 import numpy as np
-import pywavefront
+from residency import ResidencyManager
+from mesh_cache import load_mesh, LOD_LEVELS
+from mesh_index import index_vertex_data, get_acmr
+
+# vertex data, index data, acmr; produced without touching the gl context
+MeshData = tuple[np.ndarray, Optional[np.ndarray], Optional[float]]
 
 
 class BaseVBO:
     ctx: Context
     format: Optional[str] = None
     attribs: Optional[list] = None
-
-    def __init__(self, ctx: Context) -> None:
+    indexed: bool = True
+    # local min/max of in_position, shape (2, 3)
+    bounds: np.ndarray
+    ibo: Optional[Buffer] = None
+    index_element_size: int = 4
+    acmr: Optional[float] = None
+    # streamed meshes may be evicted, the others stay resident
+    streamed: bool = True
+    # detail levels, level 0 is the full mesh
+    lods: int = 1
+
+    def __init__(self, ctx: Context, mesh_data: Optional[MeshData] = None) -> None:
         self.ctx = ctx
-        self.vbo = self.get_vbo()
+        if mesh_data is None:
+            mesh_data = self.get_mesh_data()
+        self.vbo = self.get_vbo(mesh_data)
 
-    def get_vertex_data(self) -> np.ndarray:
+    @classmethod
+    def get_vertex_data(cls) -> np.ndarray:
         raise NotImplementedError
 
-    def get_vbo(self) -> Buffer:
-        vertex_data = self.get_vertex_data()
+    @classmethod
+    def get_mesh_data(cls, lod: int = 0) -> MeshData:
+        vertex_data = cls.get_vertex_data()
+        if not cls.indexed:
+            return vertex_data, None, None
+        stride = sum(int(attr[:-1]) for attr in cls.format.split())
+        vertex_data, index_data = index_vertex_data(vertex_data, stride)
+        return vertex_data, index_data, get_acmr(index_data)
+
+    @staticmethod
+    def load_obj(path: str, lod: int = 0) -> MeshData:
+        vertex_data, index_data, header = load_mesh(path, lod)
+        return vertex_data, index_data, header['acmr']
+
+    def get_vbo(self, mesh_data: MeshData) -> Buffer:
+        vertex_data, index_data, self.acmr = mesh_data
+        self.bounds = self.get_bounds(vertex_data)
+        if index_data is not None:
+            self.ibo = self.ctx.buffer(index_data)
+            self.index_element_size = index_data.itemsize
         return self.ctx.buffer(vertex_data)
 
+    @property
+    def size(self) -> int:
+        return self.vbo.size + (self.ibo.size if self.ibo is not None else 0)
+
+    def get_bounds(self, vertex_data: np.ndarray) -> np.ndarray:
+        sizes = [int(attr[:-1]) for attr in self.format.split()]
+        offset = sum(sizes[:self.attribs.index('in_position')])
+        positions = vertex_data.reshape(-1, sum(sizes))[:, offset:offset + 3]
+        return np.array([positions.min(axis=0), positions.max(axis=0)], dtype='f4')
+
     def destroy(self) -> None:
         self.vbo.release()
+        if self.ibo is not None:
+            self.ibo.release()
 
 
 class CubeVBO(BaseVBO):
-    def __init__(self, ctx: Context):
-        super().__init__(ctx)
-        self.format = '2f 3f 3f'
-        self.attribs = ['in_texcoord_0', 'in_normal', 'in_position']
+    format: str = '2f 3f 3f'
+    attribs: list[str] = ['in_texcoord_0', 'in_normal', 'in_position']
+
+    def __init__(self, ctx: Context, mesh_data: Optional[MeshData] = None) -> None:
+        super().__init__(ctx, mesh_data)
 
     @staticmethod
     def get_data(vertices, indices):
         data = [vertices[ind] for triangle in indices for ind in triangle]
         return np.array(data, dtype='f4')
 
-    def get_vertex_data(self) -> np.ndarray:
+    @classmethod
+    def get_vertex_data(cls) -> np.ndarray:
         vertices = [(-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1),
                     (-1, 1, -1), (-1, -1, -1), (1, -1, -1), (1, 1, -1)]
 
@@ -45,7 +95,7 @@ class CubeVBO(BaseVBO):
                    (3, 4, 5), (3, 5, 0),
                    (3, 7, 4), (3, 2, 7),
                    (0, 6, 1), (0, 5, 6)]
-        vertex_data = self.get_data(vertices, indices)
+        vertex_data = cls.get_data(vertices, indices)
 
         tex_coord_vertices = [(0, 0), (1, 0), (1, 1), (0, 1)]
         tex_coord_indices = [(0, 2, 3), (0, 1, 2),
@@ -54,7 +104,7 @@ class CubeVBO(BaseVBO):
                              (2, 3, 0), (2, 0, 1),
                              (0, 2, 3), (0, 1, 2),
                              (3, 1, 2), (3, 0, 1), ]
-        tex_coord_data = self.get_data(tex_coord_vertices, tex_coord_indices)
+        tex_coord_data = cls.get_data(tex_coord_vertices, tex_coord_indices)
 
         normals = [(0, 0, 1) * 6,
                    (1, 0, 0) * 6,
@@ -69,153 +119,204 @@ class CubeVBO(BaseVBO):
         return vertex_data
 
 
+class BakedVBO(BaseVBO):
+    # pre-transformed static geometry, built at load time rather than streamed; mixes textures by array layer
+    format: str = '2f 3f 3f 1f'
+    attribs: list[str] = ['in_texcoord_0', 'in_normal', 'in_position', 'in_layer']
+    streamed = False
+
+    def __init__(self, ctx: Context, vertex_data: np.ndarray) -> None:
+        stride = sum(int(attr[:-1]) for attr in self.format.split())
+        vertex_data, index_data = index_vertex_data(vertex_data, stride)
+        super().__init__(ctx, (vertex_data, index_data, get_acmr(index_data)))
+
+
 class FerretVBO(BaseVBO):
     format: str = '2f 3f 3f'
     attribs: list[str] = ['in_texcoord_0', 'in_normal', 'in_position']
+    lods = LOD_LEVELS
 
-    def __init__(self, ctx: Context) -> None:
-        super().__init__(ctx)
+    def __init__(self, ctx: Context, mesh_data: Optional[MeshData] = None) -> None:
+        super().__init__(ctx, mesh_data)
 
-    def get_vertex_data(self) -> np.ndarray:
-        objs = pywavefront.Wavefront('objects/10019_ferret_v1_iterations-2.obj', cache=True, parse=True)
-        obj = objs.materials.popitem()[1]
-        vertex_data = obj.vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        return vertex_data
+    @classmethod
+    def get_mesh_data(cls, lod: int = 0) -> MeshData:
+        return cls.load_obj('objects/10019_ferret_v1_iterations-2.obj', lod)
 
 
 class HawkVBO(BaseVBO):
     format: str = '2f 3f 3f'
     attribs: list[str] = ['in_texcoord_0', 'in_normal', 'in_position']
+    lods = LOD_LEVELS
 
-    def __init__(self, ctx: Context) -> None:
-        super().__init__(ctx)
+    def __init__(self, ctx: Context, mesh_data: Optional[MeshData] = None) -> None:
+        super().__init__(ctx, mesh_data)
 
-    def get_vertex_data(self) -> np.ndarray:
-        objs = pywavefront.Wavefront('objects/10025_Hawk_v1_iterations-2.obj', cache=True, parse=True)
-        obj = objs.materials.popitem()[1]
-        vertex_data = obj.vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        return vertex_data
+    @classmethod
+    def get_mesh_data(cls, lod: int = 0) -> MeshData:
+        return cls.load_obj('objects/10025_Hawk_v1_iterations-2.obj', lod)
 
 
 class FarmHouseVBO(BaseVBO):
     format: str = '2f 3f 3f'
     attribs: list[str] = ['in_texcoord_0', 'in_normal', 'in_position']
+    # too few triangles to simplify
+    lods = 1
 
-    def __init__(self, ctx: Context) -> None:
-        super().__init__(ctx)
+    def __init__(self, ctx: Context, mesh_data: Optional[MeshData] = None) -> None:
+        super().__init__(ctx, mesh_data)
 
-    def get_vertex_data(self) -> np.ndarray:
-        objs = pywavefront.Wavefront('objects/farmhouse_obj.obj', cache=True, parse=True)
-        obj = objs.materials.popitem()[1]
-        vertex_data = obj.vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        return vertex_data
+    @classmethod
+    def get_mesh_data(cls, lod: int = 0) -> MeshData:
+        return cls.load_obj('objects/farmhouse_obj.obj', lod)
 
 
 class CatVBO(BaseVBO):
     format: str = '2f 3f 3f'
     attribs: list[str] = ['in_texcoord_0', 'in_normal', 'in_position']
+    lods = LOD_LEVELS
 
-    def __init__(self, ctx: Context) -> None:
-        super().__init__(ctx)
+    def __init__(self, ctx: Context, mesh_data: Optional[MeshData] = None) -> None:
+        super().__init__(ctx, mesh_data)
 
-    def get_vertex_data(self) -> np.ndarray:
-        objs = pywavefront.Wavefront('objects/12221_Cat_v1_l3.obj', cache=True, parse=True)
-        obj = objs.materials.popitem()[1]
-        vertex_data = obj.vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        return vertex_data
+    @classmethod
+    def get_mesh_data(cls, lod: int = 0) -> MeshData:
+        return cls.load_obj('objects/12221_Cat_v1_l3.obj', lod)
 
 
 class CactusVBO(BaseVBO):
     format: str = '2f 3f 3f'
     attribs: list[str] = ['in_texcoord_0', 'in_normal', 'in_position']
+    lods = LOD_LEVELS
 
-    def __init__(self, ctx: Context) -> None:
-        super().__init__(ctx)
+    def __init__(self, ctx: Context, mesh_data: Optional[MeshData] = None) -> None:
+        super().__init__(ctx, mesh_data)
 
-    def get_vertex_data(self) -> np.ndarray:
-        objs = pywavefront.Wavefront('objects/10436_Cactus_v1_max2010_it2.obj', cache=True, parse=True)
-        obj = objs.materials.popitem()[1]
-        vertex_data = obj.vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        return vertex_data
+    @classmethod
+    def get_mesh_data(cls, lod: int = 0) -> MeshData:
+        return cls.load_obj('objects/10436_Cactus_v1_max2010_it2.obj', lod)
 
 
 class CarVBO(BaseVBO):
     format: str = '2f 3f 3f'
     attribs: list[str] = ['in_texcoord_0', 'in_normal', 'in_position']
+    lods = LOD_LEVELS
 
-    def __init__(self, ctx: Context) -> None:
-        super().__init__(ctx)
+    def __init__(self, ctx: Context, mesh_data: Optional[MeshData] = None) -> None:
+        super().__init__(ctx, mesh_data)
 
-    def get_vertex_data(self) -> np.ndarray:
-        objs = pywavefront.Wavefront('objects/Rusted Car.obj', cache=True, parse=True)
-        obj = objs.materials.popitem()[1]
-        vertex_data = obj.vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        return vertex_data
+    @classmethod
+    def get_mesh_data(cls, lod: int = 0) -> MeshData:
+        return cls.load_obj('objects/Rusted Car.obj', lod)
 
 
 class PlantVBO(BaseVBO):
     format: str = '2f 3f 3f'
     attribs: list[str] = ['in_texcoord_0', 'in_normal', 'in_position']
+    lods = LOD_LEVELS
 
-    def __init__(self, ctx: Context) -> None:
-        super().__init__(ctx)
+    def __init__(self, ctx: Context, mesh_data: Optional[MeshData] = None) -> None:
+        super().__init__(ctx, mesh_data)
 
-    def get_vertex_data(self) -> np.ndarray:
-        objs = pywavefront.Wavefront('objects/10446_Palm_Tree_v1_max2010_iteration-2.obj', cache=True, parse=True)
-        obj = objs.materials.popitem()[1]
-        vertex_data = obj.vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        return vertex_data
+    @classmethod
+    def get_mesh_data(cls, lod: int = 0) -> MeshData:
+        return cls.load_obj('objects/10446_Palm_Tree_v1_max2010_iteration-2.obj', lod)
 
 
 class HedgeVBO(BaseVBO):
     format: str = '2f 3f 3f'
     attribs: list[str] = ['in_texcoord_0', 'in_normal', 'in_position']
+    lods = LOD_LEVELS
 
-    def __init__(self, ctx: Context) -> None:
-        super().__init__(ctx)
+    def __init__(self, ctx: Context, mesh_data: Optional[MeshData] = None) -> None:
+        super().__init__(ctx, mesh_data)
 
-    def get_vertex_data(self) -> np.ndarray:
-        objs = pywavefront.Wavefront('objects/10449_Rectangular_Box_Hedge_v1_iterations-2.obj', cache=True, parse=True)
-        obj = objs.materials.popitem()[1]
-        vertex_data = obj.vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        return vertex_data
+    @classmethod
+    def get_mesh_data(cls, lod: int = 0) -> MeshData:
+        return cls.load_obj('objects/10449_Rectangular_Box_Hedge_v1_iterations-2.obj', lod)
 
 
 class AdvancedSkyBoxVBO(BaseVBO):
     format: str = '3f'
     attribs: list[str] = ['in_position']
+    indexed: bool = False
+    streamed: bool = False
 
-    def __init__(self, ctx: Context) -> None:
-        super().__init__(ctx)
+    def __init__(self, ctx: Context, mesh_data: Optional[MeshData] = None) -> None:
+        super().__init__(ctx, mesh_data)
 
-    def get_vertex_data(self) -> np.ndarray:
+    @classmethod
+    def get_vertex_data(cls) -> np.ndarray:
         z = 0.9999
         vertices = [(-1, -1, z), (3, -1, z), (-1, 3, z)]
         return np.array(vertices, dtype='f4')
 
 
+VBO_CLASSES: dict[str, type[BaseVBO]] = {
+    'cube': CubeVBO,
+    'farmhouse': FarmHouseVBO,
+    'ferret': FerretVBO,
+    'hawk': HawkVBO,
+    'cat': CatVBO,
+    'cactus': CactusVBO,
+    'plant': PlantVBO,
+    'hedge': HedgeVBO,
+    'car': CarVBO,
+    'skybox': AdvancedSkyBoxVBO,
+}
+
+
+def get_lod_name(name: str, lod: int) -> str:
+    return f'{name}@lod{lod}' if lod else name
+
+
 class VBO:
+    ctx: Context
+    residency: ResidencyManager
+    # meshes that are not streamed
     vbos: dict[str, BaseVBO] = dict()
+    placeholder: BaseVBO
 
-    def __init__(self, ctx: Context) -> None:
-        self.vbos['cube'] = CubeVBO(ctx)
-        self.vbos['farmhouse'] = FarmHouseVBO(ctx)
-        self.vbos['ferret'] = FerretVBO(ctx)
-        self.vbos['hawk'] = HawkVBO(ctx)
-        self.vbos['cat'] = CatVBO(ctx)
-        self.vbos['cactus'] = CactusVBO(ctx)
-        self.vbos['plant'] = PlantVBO(ctx)
-        self.vbos['hedge'] = HedgeVBO(ctx)
-        self.vbos['car'] = CarVBO(ctx)
-        self.vbos['skybox'] = AdvancedSkyBoxVBO(ctx)
+    def __init__(self, ctx: Context, residency: ResidencyManager) -> None:
+        self.ctx = ctx
+        self.residency = residency
+        self.placeholder = CubeVBO(ctx)
+        for name, vbo_class in VBO_CLASSES.items():
+            if not vbo_class.streamed:
+                self.vbos[name] = vbo_class(ctx)
+                continue
+            for lod in range(vbo_class.lods):
+                residency.register(f'mesh/{get_lod_name(name, lod)}', decode=(vbo_class.get_mesh_data, (lod,)),
+                                   upload=lambda *mesh_data, vbo_class=vbo_class: self.upload_vbo(vbo_class, mesh_data),
+                                   release=BaseVBO.destroy, placeholder=self.placeholder)
+
+    def upload_vbo(self, vbo_class: type[BaseVBO], mesh_data: MeshData) -> tuple[BaseVBO, int]:
+        vbo = vbo_class(self.ctx, mesh_data)
+        return vbo, vbo.size
+
+    def add(self, name: str, vbo: BaseVBO) -> None:
+        # meshes built at runtime, kept resident
+        self.vbos[name] = vbo
+
+    def get_lod_count(self, name: str) -> int:
+        return VBO_CLASSES[name].lods if name in VBO_CLASSES else 1
+
+    def acquire(self, name: str) -> None:
+        # every detail level of the mesh, so switching levels never waits for a load
+        if name not in self.vbos:
+            for lod in range(self.get_lod_count(name)):
+                self.residency.acquire(f'mesh/{get_lod_name(name, lod)}')
+
+    def release(self, name: str) -> None:
+        if name not in self.vbos:
+            for lod in range(self.get_lod_count(name)):
+                self.residency.release(f'mesh/{get_lod_name(name, lod)}')
+
+    def get(self, name: str) -> BaseVBO:
+        if name in self.vbos:
+            return self.vbos[name]
+        return self.residency.get(f'mesh/{name}')
 
     def destroy(self) -> None:
         [vbo.destroy() for vbo in self.vbos.values()]
+        self.placeholder.destroy()
@@ -1,17 +1,50 @@
-from typing import Optional, Tuple
+from typing import Optional, Sequence, Tuple
 from OpenGL.GL import *
 import numpy as np
 
+# x, y, radius
+VERTEX_SIZE = 3 * 4
+# outlines tessellated by the geometry shader, or a quad per circle with the outline drawn by the fragment shader,
+# which is cheaper for many small circles
+MODES = ('geometry', 'sdf')
+# segments circle.geom can emit with its max_vertices
+MAX_SEGMENTS = 255
+
+
 class Circle:
     def __init__(self, radius: float, position: Tuple[float, float]) -> None:
         self.radius: float = radius
         self.position: Tuple[float, float] = position
-        self.shader_program: Optional[int] = None
+
+
+class CircleBatch:
+    # every circle is one point of (position, radius), the geometry shader turns them into outlines
+    # or quads, so all circles are drawn in a single call
+    def __init__(self, mode: str = 'geometry') -> None:
+        self.mode: str = mode
+        self.programs: dict[str, int] = {}
+        self.viewport_locations: dict[str, int] = {}
         self.vao: Optional[int] = None
         self.vbo: Optional[int] = None
+        self.count: int = 0
+        # bytes allocated for the vbo
+        self.capacity: int = 0
 
-    def init_gl(self, shader_program: int) -> None:
-        self.shader_program = shader_program
+    @property
+    def shader_program(self) -> Optional[int]:
+        return self.programs.get(self.mode)
+
+    def init_gl(self, programs: dict[str, int]) -> None:
+        self.programs = programs
+        # resolved once, not on every draw
+        self.viewport_locations = {mode: glGetUniformLocation(program, "viewport")
+                                   for mode, program in programs.items()}
+        # every segment is a vertex of 4 position components
+        max_segments = min(MAX_SEGMENTS, glGetIntegerv(GL_MAX_GEOMETRY_OUTPUT_VERTICES) - 1,
+                           glGetIntegerv(GL_MAX_GEOMETRY_TOTAL_OUTPUT_COMPONENTS) // 4 - 1)
+        glUseProgram(programs['geometry'])
+        glUniform1i(glGetUniformLocation(programs['geometry'], "maxSegments"), max_segments)
+        glUseProgram(0)
 
         self.vao = glGenVertexArrays(1)
         glBindVertexArray(self.vao)
@@ -19,24 +52,51 @@ class Circle:
         self.vbo = glGenBuffers(1)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
 
-        point_data = np.array(self.position, dtype=np.float32)
-        glBufferData(GL_ARRAY_BUFFER, point_data.nbytes, point_data, GL_STATIC_DRAW)
-
         glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 0, None)
+        glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, VERTEX_SIZE, None)
+        glEnableVertexAttribArray(1)
+        glVertexAttribPointer(1, 1, GL_FLOAT, GL_FALSE, VERTEX_SIZE, ctypes.c_void_p(2 * 4))
 
         glBindBuffer(GL_ARRAY_BUFFER, 0)
         glBindVertexArray(0)
 
+    def set_viewport(self, width: int, height: int) -> None:
+        for mode, program in self.programs.items():
+            glUseProgram(program)
+            glUniform2f(self.viewport_locations[mode], width, height)
+        glUseProgram(0)
+
+    def set_circles(self, circles: Sequence[Circle]) -> None:
+        positions = np.array([circle.position for circle in circles], dtype=np.float32).reshape(-1, 2)
+        radii = np.array([circle.radius for circle in circles], dtype=np.float32)
+        self.update(positions, radii)
+
+    def update(self, positions: np.ndarray, radii: np.ndarray) -> None:
+        # called every frame for animated circles: the old storage is orphaned instead of overwritten,
+        # so the driver does not wait for draws still reading it
+        assert self.vbo is not None, "CircleBatch.init_gl must be called before update()"
+        data = np.empty((len(radii), 3), dtype=np.float32)
+        data[:, :2] = positions
+        data[:, 2] = radii
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        self.capacity = max(self.capacity, data.nbytes)
+        glBufferData(GL_ARRAY_BUFFER, self.capacity, None, GL_STREAM_DRAW)
+        if data.nbytes:
+            glBufferSubData(GL_ARRAY_BUFFER, 0, data.nbytes, data)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.count = len(data)
+
     def draw(self) -> None:
         assert self.shader_program is not None and self.vao is not None, \
-            "Circle.init_gl must be called before draw()"
+            "CircleBatch.init_gl must be called before draw()"
 
         glUseProgram(self.shader_program)
         glBindVertexArray(self.vao)
-
-        loc_radius = glGetUniformLocation(self.shader_program, "radius")
-        glUniform1f(loc_radius, self.radius)
-
-        glDrawArrays(GL_POINTS, 0, 1)
+        glDrawArrays(GL_POINTS, 0, self.count)
         glBindVertexArray(0)
+
+    def destroy(self) -> None:
+        if self.vbo is not None:
+            glDeleteBuffers(1, [self.vbo])
+        if self.vao is not None:
+            glDeleteVertexArrays(1, [self.vao])
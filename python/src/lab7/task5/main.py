@@ -1,4 +1,6 @@
+import argparse
 import sys
+import time
 import numpy as np
 from typing import Optional
 from PyQt5.QtWidgets import QApplication, QMainWindow, QOpenGLWidget
@@ -6,39 +8,78 @@ from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QSurfaceFormat
 from OpenGL.GL import *
 from shader import Shader
-from circle import Circle
+from circle import Circle, CircleBatch, MODES
+
+# ndc units per second of the animated circles
+SPEED = 0.3
 
 class App(QOpenGLWidget):
-    def __init__(self, parent: Optional[QMainWindow] = None) -> None:
+    def __init__(self, parent: Optional[QMainWindow] = None, count: int = 0, mode: str = 'geometry') -> None:
         super().__init__(parent)
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update)
-        self.shader_program: Optional[int] = None
+        self.batch = CircleBatch(mode)
 
         self.circles = [
             Circle(0.3, (-0.7, -0.2)),
             Circle(0.5, (-0.5, 0.7)),
             Circle(0.1, (0.2, 0.3)),
         ]
+        # count random circles bouncing around the window instead, streamed to the gpu every frame
+        rng = np.random.default_rng(0)
+        self.positions = rng.uniform(-1, 1, (count, 2)).astype(np.float32)
+        self.velocities = rng.uniform(-SPEED, SPEED, (count, 2)).astype(np.float32)
+        self.radii = rng.uniform(0.002, 0.02, count).astype(np.float32)
+        self.last_time = time.perf_counter()
+
+    @property
+    def animated(self) -> bool:
+        return len(self.radii) > 0
 
     def initializeGL(self) -> None:
-        self.shader_program = Shader().get_program('circle')
-        for circle in self.circles:
-            circle.init_gl(self.shader_program)
+        shader = Shader()
+        self.batch.init_gl({
+            'geometry': shader.get_program('circle'),
+            'sdf': shader.get_program('circle_sdf', 'circle'),
+        })
+        # the sdf outlines are antialiased through their alpha
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        if self.animated:
+            self.timer.start(0)
+        else:
+            self.batch.set_circles(self.circles)
+
+    def animate(self) -> None:
+        now = time.perf_counter()
+        dt = now - self.last_time
+        self.last_time = now
+        self.positions += self.velocities * dt
+        outside = np.abs(self.positions) > 1
+        self.velocities[outside] *= -1
+        np.clip(self.positions, -1, 1, out=self.positions)
+        self.batch.update(self.positions, self.radii)
 
     def paintGL(self) -> None:
+        if self.animated:
+            self.animate()
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        for circle in self.circles:
-            circle.draw()
+        self.batch.draw()
 
     def resizeGL(self, w: int, h: int) -> None:
         glViewport(0, 0, w, h)
+        self.batch.set_viewport(w, h)
 
 class MainWindow(QMainWindow):
     def __init__(self) -> None:
         super().__init__()
         self.setWindowTitle("Lab 7. Task 5")
-        widget = App(self)
+        parser = argparse.ArgumentParser()
+        parser.add_argument('count', type=int, nargs='?', default=0, help='animated random circles to draw')
+        parser.add_argument('--mode', choices=MODES, default='geometry',
+                            help='sdf draws a quad per circle, faster for very many circles')
+        args, _ = parser.parse_known_args()
+        widget = App(self, args.count, args.mode)
         self.setCentralWidget(widget)
         self.resize(1000, 1000)
 
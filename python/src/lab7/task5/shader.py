@@ -1,19 +1,92 @@
+import hashlib
+import os
+import numpy as np
+from typing import Optional
 from OpenGL.GL import *
-from OpenGL.GL.shaders import compileShader, compileProgram
+from OpenGL.error import GLError
+from OpenGL.GL.shaders import compileShader
+
+# linked program binaries, reused while the sources and the driver stay the same
+CACHE_DIR = 'shaders/.cache'
+STAGES = (('vert', GL_VERTEX_SHADER), ('geom', GL_GEOMETRY_SHADER), ('frag', GL_FRAGMENT_SHADER))
+
 
 class Shader:
-    def get_program(self, shader_program_name: str):
-        with open(f'shaders/{shader_program_name}.vert') as file:
-            vertex_shader = file.read()
+    def __init__(self) -> None:
+        # source hash -> program, the same sources are only linked once
+        self.programs: dict[str, int] = {}
+
+    def get_sources(self, shader_program_name: str, vertex_shader_name: Optional[str] = None) -> list[str]:
+        sources = []
+        for extension, _ in STAGES:
+            name = vertex_shader_name if extension == 'vert' and vertex_shader_name else shader_program_name
+            with open(f'shaders/{name}.{extension}') as file:
+                sources.append(file.read())
+        return sources
+
+    def get_program(self, shader_program_name: str, vertex_shader_name: Optional[str] = None) -> int:
+        sources = self.get_sources(shader_program_name, vertex_shader_name)
+        # binaries only load on the driver that wrote them
+        driver = [glGetString(name).decode() for name in (GL_VENDOR, GL_RENDERER, GL_VERSION)]
+        source_hash = hashlib.blake2b('\0'.join(driver + sources).encode(), digest_size=16).hexdigest()
+        if source_hash not in self.programs:
+            program = self.load_binary(source_hash) if self.binaries_supported() else None
+            if program is None:
+                program = self.compile_program(sources)
+                if self.binaries_supported():
+                    self.save_binary(source_hash, program)
+            self.programs[source_hash] = program
+        return self.programs[source_hash]
+
+    @staticmethod
+    def binaries_supported() -> bool:
+        # GL_ARB_get_program_binary, core since 4.1
+        return bool(glProgramBinary) and bool(glProgramParameteri) and glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
 
-        with open(f'shaders/{shader_program_name}.geom') as file:
-            geom_shader = file.read()
+    def compile_program(self, sources: list[str]) -> int:
+        shaders = [compileShader(source, stage) for source, (_, stage) in zip(sources, STAGES)]
+        program = glCreateProgram()
+        for shader in shaders:
+            glAttachShader(program, shader)
+        if self.binaries_supported():
+            glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+        glLinkProgram(program)
+        for shader in shaders:
+            glDetachShader(program, shader)
+            glDeleteShader(shader)
+        if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+            raise RuntimeError(glGetProgramInfoLog(program))
+        return program
 
-        with open(f'shaders/{shader_program_name}.frag') as file:
-            fragment_shader = file.read()
+    def load_binary(self, source_hash: str) -> Optional[int]:
+        # a missing, stale or rejected binary means compiling from source
+        path = f'{CACHE_DIR}/{source_hash}.bin'
+        if not os.path.exists(path):
+            return None
+        data = np.fromfile(path, dtype='u1')
+        binary_format = int(data[:4].view('<u4')[0])
+        program = glCreateProgram()
+        try:
+            glProgramBinary(program, binary_format, data[4:], len(data) - 4)
+        except GLError:
+            glDeleteProgram(program)
+            return None
+        if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+            glDeleteProgram(program)
+            return None
+        return program
 
-        return compileProgram(
-            compileShader(vertex_shader,   GL_VERTEX_SHADER),
-            compileShader(geom_shader, GL_GEOMETRY_SHADER),
-            compileShader(fragment_shader, GL_FRAGMENT_SHADER),
-        )
+    def save_binary(self, source_hash: str, program: int) -> None:
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if not length:
+            return
+        binary = np.empty(length, dtype='u1')
+        written = GLsizei(0)
+        binary_format = GLenum(0)
+        glGetProgramBinary(program, length, written, binary_format, binary)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        data = np.uint32(binary_format.value).astype('<u4').tobytes() + binary[:written.value].tobytes()
+        tmp_path = f'{CACHE_DIR}/{source_hash}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, f'{CACHE_DIR}/{source_hash}.bin')
@@ -1,9 +1,12 @@
 #version 330 core
 
 layout(location = 0) in vec2 aPos;
+layout(location = 1) in float aRadius;
 out vec2 vPos;
+out float vRadius;
 
 void main() {
     gl_Position = vec4(aPos, 0.0, 1.0);
     vPos = aPos;
+    vRadius = aRadius;
 }
@@ -0,0 +1,19 @@
+#version 330 core
+
+in vec2 local;
+flat in vec2 pixelRadius;
+
+out vec4 FragColor;
+
+void main() {
+    // distance to the outline in pixels, the outline value over its gradient in pixel units;
+    // the outline is one pixel wide like the line strip one
+    float len = length(local);
+    vec2 gradient = local / max(len, 1e-4) / pixelRadius;
+    float distance = abs(len - 1.0) / max(length(gradient), 1e-6);
+    float coverage = clamp(1.0 - distance, 0.0, 1.0);
+    if (coverage <= 0.0) {
+        discard;
+    }
+    FragColor = vec4(0.2, 0.8, 0.2, coverage);
+}
\ No newline at end of file